@@ -0,0 +1,231 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from enum import IntEnum
+from typing import Any, Dict, List, Optional, Tuple
+
+from models import ModelSize, MODEL_CONFIGS
+
+class Priority(IntEnum):
+    """Lower values are admitted first"""
+    INTERACTIVE = 0
+    BATCH = 1
+    FORCED = 2
+    BACKGROUND = 3
+
+class AdmissionRejected(Exception):
+    """A request could not be admitted within its wait budget"""
+
+    def __init__(self, model_size: ModelSize, reason: str, status_code: int,
+                 retry_after: Optional[float] = None):
+        super().__init__(f"{MODEL_CONFIGS[model_size]['name']} is overloaded ({reason})")
+        self.model_size = model_size
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """Refills ``rate`` tokens per second up to ``burst``; ``rate`` of None means unlimited"""
+
+    def __init__(self, rate: Optional[float], burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, tokens: float = 1.0) -> float:
+        """Seconds until ``tokens`` tokens are available"""
+        if not self.rate:
+            return 0.0
+        self._refill()
+        return max(0.0, (tokens - self.tokens) / self.rate)
+
+    def take(self):
+        if self.rate:
+            self._refill()
+            self.tokens -= 1
+
+class TierAdmission:
+    """Token bucket, concurrency cap and priority queue for one tier.
+
+    A request is admitted at once when a concurrency slot and a token are
+    both free and nobody of equal or higher priority is waiting. Otherwise
+    it joins a heap ordered by (priority, arrival). A request is rejected
+    straight away when the queue is full (503), or when the token bucket
+    alone means it can't be admitted within its wait budget (429). A queued
+    request that isn't admitted within the budget also gets a 429.
+    """
+
+    def __init__(self, model_size: ModelSize, rate: Optional[float], burst: float,
+                 max_concurrency: int, max_queue: int, metrics=None):
+        self.model_size = model_size
+        self.bucket = TokenBucket(rate, burst)
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.metrics = metrics
+
+        self.active = 0
+        self.waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self.sequence = itertools.count()
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {}
+        self.max_wait_seen = 0.0
+        self.wait_ewma = 0.0
+
+    def queued(self) -> Dict[Priority, int]:
+        counts = {priority: 0 for priority in Priority}
+        for priority, _, future in self.waiters:
+            if not future.done():
+                counts[Priority(priority)] += 1
+        return counts
+
+    def _ahead_of(self, priority: Priority) -> int:
+        return sum(1 for p, _, future in self.waiters if p <= priority and not future.done())
+
+    def _reject(self, priority: Priority, reason: str, status_code: int,
+                retry_after: Optional[float]) -> AdmissionRejected:
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        if self.metrics is not None:
+            self.metrics.admission_rejected.inc(self.model_size.value, priority.name.lower(), reason)
+        return AdmissionRejected(self.model_size, reason, status_code, retry_after)
+
+    def _record_wait(self, priority: Priority, waited: float):
+        self.admitted += 1
+        self.max_wait_seen = max(self.max_wait_seen, waited)
+        self.wait_ewma += 0.2 * (waited - self.wait_ewma)
+        if self.metrics is not None:
+            self.metrics.admission_wait_seconds.observe(
+                waited, self.model_size.value, priority.name.lower()
+            )
+
+    async def acquire(self, priority: Priority, max_wait: float):
+        """Wait for a slot; raises AdmissionRejected if it can't be had within ``max_wait``"""
+        ahead = self._ahead_of(priority)
+        if ahead == 0 and self.active < self.max_concurrency and self.bucket.wait_time() == 0:
+            self.bucket.take()
+            self.active += 1
+            self._record_wait(priority, 0.0)
+            return
+
+        if sum(1 for _, _, waiter in self.waiters if not waiter.done()) >= self.max_queue:
+            raise self._reject(priority, "queue_full", 503, max_wait)
+        token_wait = self.bucket.wait_time(ahead + 1)
+        if token_wait > max_wait:
+            raise self._reject(priority, "rate_limited", 429, token_wait)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.sequence), future))
+        start = time.monotonic()
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), max_wait)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # Admitted just as the budget ran out; keep the slot
+                self._record_wait(priority, time.monotonic() - start)
+                return
+            future.cancel()
+            raise self._reject(priority, "wait_budget_exceeded", 429, self.wait_ewma or max_wait)
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                future.cancel()
+            raise
+        self._record_wait(priority, time.monotonic() - start)
+
+    def release(self):
+        self.active -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """Admit queued requests in priority order while slots and tokens allow"""
+        while self.waiters and self.active < self.max_concurrency:
+            if self.waiters[0][2].done():
+                heapq.heappop(self.waiters)
+                continue
+            wait = self.bucket.wait_time()
+            if wait > 0:
+                if self.timer is None:
+                    self.timer = asyncio.get_running_loop().call_later(wait, self._on_timer)
+                return
+            _, _, future = heapq.heappop(self.waiters)
+            self.bucket.take()
+            self.active += 1
+            future.set_result(None)
+
+    def _on_timer(self):
+        self.timer = None
+        self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "max_concurrency": self.max_concurrency,
+            "queued": {priority.name.lower(): count for priority, count in self.queued().items()},
+            "max_queue": self.max_queue,
+            "rate": self.bucket.rate,
+            "tokens": round(self.bucket.tokens, 2),
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "avg_wait": round(self.wait_ewma, 4),
+            "max_wait": round(self.max_wait_seen, 4)
+        }
+
+class _Slot:
+    def __init__(self, tier: TierAdmission, priority: Priority, max_wait: float):
+        self.tier = tier
+        self.priority = priority
+        self.max_wait = max_wait
+
+    async def __aenter__(self):
+        await self.tier.acquire(self.priority, self.max_wait)
+
+    async def __aexit__(self, *exc_info):
+        self.tier.release()
+
+class AdmissionController:
+    """Per-tier admission in front of the model client.
+
+    Rates, bursts, concurrency caps and queue limits come from
+    MODEL_CONFIGS and are split evenly between ``workers`` processes, since
+    each process admits on its own. The wait budget depends on the
+    request's priority.
+    """
+
+    def __init__(self, max_wait: Dict[str, float], metrics=None, workers: int = 1):
+        self.max_wait = {priority: max_wait.get(priority.name.lower(), 0.0) for priority in Priority}
+        workers = max(1, workers)
+        
+        def share(limit):
+            return max(1, math.ceil(limit / workers))
+        
+        self.tiers = {}
+        for size, config in MODEL_CONFIGS.items():
+            rate = config.get("rate_limit")
+            self.tiers[size] = TierAdmission(
+                size,
+                rate=rate / workers if rate else rate,
+                burst=share(config.get("burst", 1)),
+                max_concurrency=share(config.get("max_concurrency", config["max_connections"])),
+                max_queue=share(config.get("max_queue", 100)),
+                metrics=metrics
+            )
+
+    def slot(self, model_size: ModelSize, priority: Optional[Priority] = None) -> _Slot:
+        """``async with`` a slot for one upstream call (interactive priority by default)"""
+        priority = Priority.INTERACTIVE if priority is None else Priority(priority)
+        return _Slot(self.tiers[model_size], priority, self.max_wait[priority])
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {size.value: tier.stats() for size, tier in self.tiers.items()}
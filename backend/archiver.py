@@ -0,0 +1,307 @@
+"""Move query and savings logs older than the retention period into archive files.
+
+The live tables are treated as day partitions. Each expired day is
+exported to gzipped NDJSON (one file per table), its hourly totals are
+added to archive_summaries, and then its rows are deleted in small
+batches so the log writer is never locked out for long. Stats read the
+rollups, which are never pruned, so they keep covering archived days;
+rebuild_rollups restores archived days from archive_summaries.
+
+    python archiver.py --retention-days 30
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, delete, func, select
+
+from database import (CostSaving, LogArchive, QueryLog, SessionLocal, apply_archive_summaries,
+                      bucket_start, paired_saving_id, rollup_deltas, rollup_inputs)
+
+try:
+    import fcntl
+except ImportError:
+    # No cross-process lock on Windows; run a single worker there
+    fcntl = None
+
+def _row_dict(row) -> Dict[str, Any]:
+    values = {}
+    for column in row.__table__.columns:
+        value = getattr(row, column.name)
+        values[column.name] = value.isoformat() if isinstance(value, datetime) else value
+    return values
+
+class _ArchiveFile:
+    """Gzipped NDJSON written to a temporary name and renamed into place once complete"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows = 0
+        self._tmp = f"{path}.tmp"
+        self._file = None
+
+    def __enter__(self) -> "_ArchiveFile":
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = gzip.open(self._tmp, "wt", encoding="utf-8")
+        return self
+
+    def write(self, row):
+        self._file.write(json.dumps(_row_dict(row)) + "\n")
+        self.rows += 1
+
+    def __exit__(self, exc_type, exc, tb):
+        self._file.close()
+        if exc_type is None and self.rows:
+            os.replace(self._tmp, self.path)
+        else:
+            os.remove(self._tmp)
+
+def _delete_archived(model, start: datetime, end: datetime, max_id: int,
+                     batch_size: int, pause: float) -> int:
+    """Delete one day's archived rows a batch at a time, each batch in its own transaction"""
+    deleted = 0
+    while True:
+        db = SessionLocal()
+        try:
+            ids = select(model.id).where(
+                model.timestamp >= start, model.timestamp < end, model.id <= max_id
+            ).limit(batch_size)
+            count = db.execute(delete(model).where(model.id.in_(ids))).rowcount
+            db.commit()
+        finally:
+            db.close()
+        deleted += count
+        if count < batch_size:
+            return deleted
+        # Let queued log writes take the lock between batches
+        time.sleep(pause)
+
+def archive_day(day: datetime, archive_dir: str, batch_size: int = 5000,
+                pause: float = 0.05) -> Optional[Dict[str, Any]]:
+    """Archive and delete one day of logs; safe to re-run after an interruption.
+
+    Rows up to the ids recorded by earlier runs for the same day are
+    already in an archive file and are only deleted. Anything newer is
+    written to a further file for that day.
+    """
+    start = bucket_start(day, "day")
+    end = start + timedelta(days=1)
+    db = SessionLocal()
+    try:
+        done_query, done_savings = db.query(
+            func.max(LogArchive.max_query_id), func.max(LogArchive.max_savings_id)
+        ).filter(LogArchive.day == start).one()
+        done_query, done_savings = done_query or 0, done_savings or 0
+
+        in_day = and_(CostSaving.timestamp >= start, CostSaving.timestamp < end,
+                      CostSaving.id > done_savings)
+        queries = db.query(QueryLog, CostSaving).outerjoin(
+            CostSaving, and_(CostSaving.id == paired_saving_id(), in_day)
+        ).filter(
+            QueryLog.timestamp >= start, QueryLog.timestamp < end, QueryLog.id > done_query
+        ).order_by(QueryLog.id).yield_per(batch_size)
+        savings = db.query(CostSaving).filter(in_day).order_by(CostSaving.id).yield_per(batch_size)
+
+        name = start.strftime("%Y-%m-%d")
+        if done_query or done_savings:
+            # A later part of a day archived before; don't overwrite its files
+            name += f"-{done_query}-{done_savings}"
+        query_file = _ArchiveFile(os.path.join(archive_dir, "query_logs", f"{name}.ndjson.gz"))
+        savings_file = _ArchiveFile(os.path.join(archive_dir, "cost_savings", f"{name}.ndjson.gz"))
+        max_query, max_savings = done_query, done_savings
+
+        # Each query log comes with its own savings row, if any; savings
+        # rows left unpaired are archived after them
+        paired = set()
+        deltas: Dict[Tuple, Dict[str, float]] = {}
+        query_rows, savings_rows = [], []
+
+        def summarize():
+            for key, counters in rollup_deltas(query_rows, savings_rows).items():
+                if key[0] != "hour":
+                    continue
+                total = deltas.setdefault(key, dict.fromkeys(counters, 0))
+                for counter, value in counters.items():
+                    total[counter] += value
+            query_rows.clear()
+            savings_rows.clear()
+
+        with query_file, savings_file:
+            for log, saving in queries:
+                query_file.write(log)
+                max_query = log.id
+                if saving is not None:
+                    savings_file.write(saving)
+                    paired.add(saving.id)
+                    max_savings = max(max_savings, saving.id)
+                query_row, savings_row = rollup_inputs(log, saving)
+                query_rows.append(query_row)
+                savings_rows.append(savings_row)
+                if len(query_rows) >= batch_size:
+                    summarize()
+            for saving in savings:
+                if saving.id in paired:
+                    continue
+                savings_file.write(saving)
+                max_savings = max(max_savings, saving.id)
+            summarize()
+
+        result = None
+        if query_file.rows or savings_file.rows:
+            db.add(LogArchive(
+                day=start,
+                query_path=query_file.path if query_file.rows else None,
+                savings_path=savings_file.path if savings_file.rows else None,
+                query_rows=query_file.rows,
+                savings_rows=savings_file.rows,
+                max_query_id=max_query,
+                max_savings_id=max_savings
+            ))
+            apply_archive_summaries(db, deltas)
+            db.commit()
+            result = {"day": start.date().isoformat(), "query_rows": query_file.rows,
+                      "savings_rows": savings_file.rows}
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    _delete_archived(QueryLog, start, end, max_query, batch_size, pause)
+    _delete_archived(CostSaving, start, end, max_savings, batch_size, pause)
+    return result
+
+def _oldest_day(before: datetime, after: Optional[datetime] = None) -> Optional[datetime]:
+    """Start of the oldest day with live rows in [after, before)"""
+    db = SessionLocal()
+    try:
+        oldest = []
+        for model in (QueryLog, CostSaving):
+            query = db.query(func.min(model.timestamp)).filter(model.timestamp < before)
+            if after is not None:
+                query = query.filter(model.timestamp >= after)
+            value = query.scalar()
+            if value is not None:
+                oldest.append(value)
+    finally:
+        db.close()
+    return bucket_start(min(oldest), "day") if oldest else None
+
+def archive_expired(archive_dir: str, retention_days: float, batch_size: int = 5000,
+                    pause: float = 0.05) -> List[Dict[str, Any]]:
+    """Archive every whole day older than ``retention_days``, oldest first"""
+    cutoff = bucket_start(datetime.now(timezone.utc) - timedelta(days=retention_days), "day")
+    archived = []
+    day = _oldest_day(cutoff)
+    while day is not None:
+        result = archive_day(day, archive_dir, batch_size, pause)
+        if result is not None:
+            archived.append(result)
+        day = _oldest_day(cutoff, day + timedelta(days=1))
+    return archived
+
+class LogArchiver:
+    """Background task that runs ``archive_expired`` every ``interval`` seconds.
+
+    Work happens in a thread. When several worker processes share the
+    database, a lock file in the archive directory lets only one of them
+    archive at a time; the others skip that run.
+    """
+
+    def __init__(self, archive_dir: str, retention_days: float, interval: float = 3600.0,
+                 batch_size: int = 5000):
+        self.archive_dir = archive_dir
+        self.retention_days = retention_days
+        self.interval = interval
+        self.batch_size = batch_size
+        self.task: Optional[asyncio.Task] = None
+
+        self.runs = 0
+        self.days_archived = 0
+        self.rows_archived = 0
+        self.last_run: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+
+    async def start(self):
+        """Start archiving (called on app startup)"""
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop archiving (called on app shutdown); an export in progress finishes in its thread"""
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+
+    async def _run(self):
+        while True:
+            await self.run_once()
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self) -> List[Dict[str, Any]]:
+        try:
+            archived = await asyncio.to_thread(self.archive_once)
+        except Exception as e:
+            print(f"Error archiving logs: {e}")
+            self.last_error = str(e)
+            return []
+        self.runs += 1
+        self.last_run = datetime.now(timezone.utc)
+        self.last_error = None
+        self.days_archived += len(archived)
+        self.rows_archived += sum(day["query_rows"] for day in archived)
+        return archived
+
+    def archive_once(self) -> List[Dict[str, Any]]:
+        """Archive expired days unless another process is already doing so"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        with open(os.path.join(self.archive_dir, ".lock"), "w") as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return []
+            return archive_expired(self.archive_dir, self.retention_days, self.batch_size)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "retention_days": self.retention_days,
+            "archive_dir": self.archive_dir,
+            "runs": self.runs,
+            "days_archived": self.days_archived,
+            "rows_archived": self.rows_archived,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+            "last_error": self.last_error
+        }
+
+def main() -> int:
+    from config import settings
+
+    parser = argparse.ArgumentParser(description="Archive query logs older than the retention period")
+    parser.add_argument("--retention-days", type=float, default=settings.LOG_RETENTION_DAYS)
+    parser.add_argument("--archive-dir", default=settings.LOG_ARCHIVE_DIR)
+    parser.add_argument("--batch-size", type=int, default=settings.LOG_ARCHIVE_BATCH_SIZE)
+    args = parser.parse_args()
+    if args.retention_days is None:
+        print("No retention period set (LOG_RETENTION_DAYS or --retention-days)")
+        return 1
+
+    archiver = LogArchiver(args.archive_dir, args.retention_days, batch_size=args.batch_size)
+    for day in archiver.archive_once():
+        print(f"  {day['day']}  {day['query_rows']} queries, {day['savings_rows']} savings rows")
+    print(f"Archived logs older than {args.retention_days:g} days to {args.archive_dir}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,383 @@
+"""Load tests and micro-benchmarks for the cascade backend.
+
+The load test starts mock_hf_server.py and the backend as subprocesses,
+with the backend pointed at the mock through HF_API_BASE_URL and given a
+throwaway database and response cache. It then drives /query and /stats
+with a closed-loop load generator. The micro-benchmarks time
+CascadeRouter.route and the query logging path in-process.
+
+Results are written as JSON. Passing --baseline compares p95 latencies
+and throughput against an earlier result file and exits non-zero on a
+regression:
+
+    python benchmark.py --requests 2000 --concurrency 32 --output bench.json
+    python benchmark.py --output new.json --baseline bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from mock_hf_server import add_profile_arguments, summarize
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+QUERIES = [
+    "What is 2+2?",
+    "What's the capital of France?",
+    "Define photosynthesis",
+    "Who wrote Hamlet?",
+    "Explain the concept of recursion in programming",
+    "How does a hash map handle collisions?",
+    "Write a Python function to calculate fibonacci numbers",
+    "Debug this javascript code that throws undefined is not a function",
+    "Solve the equation 3x + 7 = 22 and explain each step",
+    "Calculate the derivative of x^3 * sin(x)",
+    "Analyze the pros and cons of microservices architecture",
+    "Compare and evaluate the economic impact of remote work on city centers. "
+    "Why does it matter? What should planners do?",
+    "Design a distributed rate limiter and discuss the trade-offs between accuracy and latency",
+    "Critically assess the main arguments for and against universal basic income"
+]
+
+def make_workload(requests: int, repeat_ratio: float, seed: int) -> List[str]:
+    """Queries for the load test; a ``repeat_ratio`` share reuse earlier text to exercise the caches"""
+    rng = random.Random(seed)
+    workload = []
+    for i in range(requests):
+        if workload and rng.random() < repeat_ratio:
+            workload.append(rng.choice(workload))
+        else:
+            workload.append(f"{rng.choice(QUERIES)} (request {i})")
+    return workload
+
+def stage_report(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    report = summarize(sorted(latencies))
+    report["errors"] = errors
+    report["throughput"] = round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0
+    return report
+
+def start_process(args: List[str], env: Dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable] + args, cwd=BACKEND_DIR, env={**os.environ, **env},
+        stdout=subprocess.DEVNULL if not os.environ.get("BENCH_VERBOSE") else None,
+        stderr=subprocess.STDOUT if not os.environ.get("BENCH_VERBOSE") else None
+    )
+
+def stop_process(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+async def wait_until_up(client: httpx.AsyncClient, url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            await client.get(url)
+            return
+        except httpx.TransportError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+            await asyncio.sleep(0.1)
+
+async def drive(client: httpx.AsyncClient, app_url: str, workload: List[str],
+                concurrency: int, stats_every: int, latency_budget: Optional[float]) -> Dict[str, Any]:
+    """Closed-loop load: ``concurrency`` workers each send one request at a time"""
+    samples: Dict[str, List[float]] = {"query": [], "query_server": [], "stats": []}
+    errors = {"query": 0, "stats": 0}
+    statuses: Dict[str, int] = {}
+    tiers: Dict[str, int] = {}
+    flags = {"cached": 0, "coalesced": 0, "hedged": 0, "failed": 0}
+    pending = iter(enumerate(workload))
+
+    async def timed(stage: str, method: str, path: str, **kwargs) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, f"{app_url}{path}", **kwargs)
+        except httpx.HTTPError:
+            errors[stage] += 1
+            statuses["transport_error"] = statuses.get("transport_error", 0) + 1
+            return None
+        elapsed = time.perf_counter() - start
+        statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+        if response.status_code != 200:
+            errors[stage] += 1
+            return None
+        samples[stage].append(elapsed)
+        return response
+
+    async def worker():
+        for i, query in pending:
+            body = {"query": query}
+            if latency_budget is not None:
+                body["latency_budget"] = latency_budget
+            response = await timed("query", "POST", "/query", json=body)
+            if response is not None:
+                data = response.json()
+                samples["query_server"].append(data["response_time"])
+                tiers[data["model_size"]] = tiers.get(data["model_size"], 0) + 1
+                for flag in ("cached", "coalesced", "hedged"):
+                    flags[flag] += int(bool(data.get(flag)))
+                flags["failed"] += int(data["response"].startswith("Error:"))
+            if stats_every and i % stats_every == 0:
+                await timed("stats", "GET", "/stats")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    completed = len(samples["query"])
+    return {
+        "elapsed": round(elapsed, 3),
+        "requests": len(workload),
+        "concurrency": concurrency,
+        "status_codes": statuses,
+        "tier_mix": {tier: round(count / completed, 4) for tier, count in tiers.items()} if completed else {},
+        "rates": {flag: round(count / completed, 4) for flag, count in flags.items()} if completed else {},
+        "stages": {
+            "query": stage_report(samples["query"], errors["query"], elapsed),
+            "query_server": stage_report(samples["query_server"], 0, elapsed),
+            "stats": stage_report(samples["stats"], errors["stats"], elapsed)
+        }
+    }
+
+async def run_load(args: argparse.Namespace) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix="cascade-bench-")
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    app_url = f"http://127.0.0.1:{args.app_port}"
+
+    mock_args = ["mock_hf_server.py", "--port", str(args.mock_port),
+                 "--latency-scale", str(args.latency_scale), "--seed", str(args.seed)]
+    for flag, value in (("--error-rate", args.error_rate),
+                        ("--loading-seconds", args.loading_seconds),
+                        ("--profiles", args.profiles)):
+        if value is not None:
+            mock_args += [flag, str(value)]
+
+    mock = start_process(mock_args, {})
+    app = None
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency * 2)
+        async with httpx.AsyncClient(limits=limits, timeout=120.0) as client:
+            await wait_until_up(client, f"{mock_url}/_stats")
+            app = start_process(
+                ["-m", "uvicorn", "main:create_app", "--factory", "--port", str(args.app_port),
+                 "--workers", str(args.workers), "--log-level", "warning"],
+                {
+                    "HF_API_BASE_URL": f"{mock_url}/models",
+                    "HUGGINGFACE_API_KEY": "benchmark",
+                    "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'cascade.db')}",
+                    "RESPONSE_CACHE_PATH": os.path.join(workdir, "response_cache.db"),
+                    "ROUTER_CACHE_PATH": os.path.join(workdir, "router_cache.db"),
+                    "WEB_CONCURRENCY": str(args.workers),
+                    "RESPONSE_CACHE_ENABLED": str(not args.no_cache).lower()
+                }
+            )
+            await wait_until_up(client, f"{app_url}/")
+            await client.post(f"{mock_url}/_reset")
+
+            workload = make_workload(args.requests, args.repeat_ratio, args.seed)
+            result = await drive(client, app_url, workload, args.concurrency,
+                                 args.stats_every, args.latency_budget)
+
+            upstream = (await client.get(f"{mock_url}/_stats")).json()
+            for tier, stats in upstream.items():
+                result["stages"][f"upstream_{tier}"] = {
+                    **stats.pop("latency"),
+                    "errors": stats["errors"] + stats["loading"]
+                }
+            result["upstream"] = upstream
+            result["backend_stats"] = (await client.get(f"{app_url}/stats")).json()
+            result["backend_health"] = (await client.get(f"{app_url}/health")).json()
+            return result
+    finally:
+        if app is not None:
+            stop_process(app)
+        stop_process(mock)
+
+def time_calls(fn, items: List[Any], repeat: int) -> Dict[str, Any]:
+    """Time ``fn(item)`` for every item, ``repeat`` passes, one sample per call"""
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            call_start = time.perf_counter()
+            fn(item)
+            latencies.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+    report = summarize(sorted(latencies))
+    report["throughput"] = round(len(latencies) / elapsed, 2)
+    return report
+
+def bench_route(queries: int, repeat: int) -> Dict[str, Any]:
+    from router import CascadeRouter
+
+    router = CascadeRouter()
+    workload = [f"{QUERIES[i % len(QUERIES)]} (variant {i})" for i in range(queries)]
+
+    def cold(query: str):
+        router.decision_cache.pop(router.get_query_hash(query))
+        router.route(query)
+
+    return {
+        "route_uncached": time_calls(cold, workload, repeat),
+        "route_cached": time_calls(router.route, workload, repeat),
+        "extract_features": time_calls(router.extract_features, workload, repeat)
+    }
+
+def bench_logging(rows: int, batch_size: int) -> Dict[str, Any]:
+    from database import log_batch
+    from log_writer import LogWriter
+
+    def make_rows(count: int):
+        now = datetime.now(timezone.utc)
+        return [(
+            {"query_hash": f"{i:032x}", "query_text": QUERIES[i % len(QUERIES)],
+             "model_used": "Phi-2", "model_size": "tiny", "response_time": 0.1,
+             "tokens_used": 20, "cost": 2e-06, "confidence": 0.9, "routing_reason": "benchmark",
+             "was_escalated": 0, "cache_hit": 0, "coalesced": 0, "hedged": 0, "timestamp": now},
+            {"query_hash": f"{i:032x}", "actual_cost": 2e-06, "baseline_cost": 2e-05,
+             "saved": 1.8e-05, "cache_hit": 0, "timestamp": now}
+        ) for i in range(count)]
+
+    batches = [make_rows(batch_size) for _ in range(max(1, rows // batch_size))]
+    log_batch_report = time_calls(
+        lambda batch: log_batch([q for q, _ in batch], [s for _, s in batch]), batches, 1
+    )
+    log_batch_report["rows_per_second"] = round(log_batch_report["throughput"] * batch_size, 2)
+
+    async def through_writer() -> Dict[str, Any]:
+        writer = LogWriter(batch_size=batch_size)
+        await writer.start()
+        submit_latencies = []
+        start = time.perf_counter()
+        for query_row, savings_row in make_rows(rows):
+            call_start = time.perf_counter()
+            await writer.submit(query_row, savings_row)
+            submit_latencies.append(time.perf_counter() - call_start)
+        submitted = time.perf_counter() - start
+        await writer.stop()
+        drained = time.perf_counter() - start
+        submit_report = summarize(sorted(submit_latencies))
+        submit_report["throughput"] = round(rows / submitted, 2)
+        return {
+            "log_writer_submit": submit_report,
+            "log_writer": {"rows_per_second": round(rows / drained, 2), **writer.stats()}
+        }
+
+    return {"log_batch": log_batch_report, **asyncio.run(through_writer())}
+
+def run_micro(args: argparse.Namespace) -> Dict[str, Any]:
+    # The logging benchmarks write to a throwaway database, so point the
+    # settings at it before database.py creates its engine
+    from config import settings
+
+    workdir = tempfile.mkdtemp(prefix="cascade-micro-")
+    settings.DATABASE_URL = f"sqlite:///{os.path.join(workdir, 'cascade.db')}"
+    return {
+        **bench_route(args.route_queries, args.route_repeat),
+        **bench_logging(args.log_rows, args.log_batch_size)
+    }
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Stages whose p95 rose, or whose throughput fell, by more than ``tolerance``"""
+    regressions = []
+    for section in ("load", "micro"):
+        current = result.get(section) or {}
+        previous = baseline.get(section) or {}
+        if section == "load":
+            current = current.get("stages", {})
+            previous = previous.get("stages", {})
+        for stage, stats in current.items():
+            old = previous.get(stage)
+            if not isinstance(old, dict) or not old.get("p95"):
+                continue
+            if stats.get("p95", 0) > old["p95"] * (1 + tolerance):
+                regressions.append(f"{section}.{stage}: p95 {old['p95']:.6f}s -> {stats['p95']:.6f}s")
+            if old.get("throughput") and stats.get("throughput", 0) < old["throughput"] * (1 - tolerance):
+                regressions.append(
+                    f"{section}.{stage}: throughput {old['throughput']} -> {stats.get('throughput', 0)}/s"
+                )
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the cascade backend")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--baseline", default=None, help="Earlier result file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed relative slowdown before a stage counts as a regression")
+    parser.add_argument("--skip-load", action="store_true")
+    parser.add_argument("--skip-micro", action="store_true")
+
+    load = parser.add_argument_group("load test")
+    load.add_argument("--requests", type=int, default=1000)
+    load.add_argument("--concurrency", type=int, default=16)
+    load.add_argument("--repeat-ratio", type=float, default=0.2,
+                      help="Share of queries that repeat an earlier one")
+    load.add_argument("--stats-every", type=int, default=50,
+                      help="Also fetch /stats after every Nth query (0 disables)")
+    load.add_argument("--latency-budget", type=float, default=None)
+    load.add_argument("--no-cache", action="store_true", help="Disable the response cache")
+    load.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    load.add_argument("--mock-port", type=int, default=8081)
+    load.add_argument("--app-port", type=int, default=8082)
+    add_profile_arguments(load)
+
+    micro = parser.add_argument_group("micro-benchmarks")
+    micro.add_argument("--route-queries", type=int, default=2000)
+    micro.add_argument("--route-repeat", type=int, default=5)
+    micro.add_argument("--log-rows", type=int, default=20000)
+    micro.add_argument("--log-batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    result: Dict[str, Any] = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args)
+        }
+    }
+    if not args.skip_load:
+        print(f"Load test: {args.requests} requests, concurrency {args.concurrency}...")
+        result["load"] = asyncio.run(run_load(args))
+    if not args.skip_micro:
+        print("Micro-benchmarks...")
+        result["micro"] = run_micro(args)
+
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    for section in ("load", "micro"):
+        stages = result.get(section, {})
+        stages = stages.get("stages", stages) if section == "load" else stages
+        for stage, stats in stages.items():
+            if "p50" in stats:
+                print(f"  {section}.{stage:<20} p50 {stats['p50'] * 1000:9.3f}ms  "
+                      f"p95 {stats['p95'] * 1000:9.3f}ms  p99 {stats['p99'] * 1000:9.3f}ms  "
+                      f"{stats.get('throughput', '-')}/s")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,277 @@
+import json
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from config import settings
+
+def tune_sqlite(connection):
+    """Pragmas for a SQLite file shared by several worker processes.
+
+    WAL lets readers run alongside the single writer, the busy timeout
+    makes a writer wait for the lock instead of failing straight away,
+    and the page cache and memory map keep hot pages out of read() calls.
+    """
+    cursor = connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT * 1000)}")
+    cursor.execute(f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KB)}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+def estimate_size(key: Any, value: Any) -> int:
+    """Rough in-memory size of a cache entry in bytes"""
+    size = sys.getsizeof(key) + sys.getsizeof(value)
+    attributes = getattr(value, "__dict__", None)
+    if attributes is not None:
+        size += sys.getsizeof(attributes)
+        size += sum(sys.getsizeof(item) for item in attributes.values())
+    elif isinstance(value, dict):
+        size += sum(sys.getsizeof(item) for item in value.values())
+    return size
+
+class LRUCache:
+    """Bounded LRU cache with an entry limit, a byte budget and an optional TTL.
+
+    Lookups, inserts and evictions are O(1): entries live in an OrderedDict
+    in recency order and the least recently used entry is popped from the
+    front when either limit is exceeded. Expired entries are dropped lazily
+    when they are read.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: Optional[int] = None,
+                 ttl: Optional[float] = None,
+                 sizeof: Callable[[Any, Any], int] = estimate_size):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+
+        # key -> (value, expires_at, size)
+        self._entries: "OrderedDict[Hashable, Tuple[Any, Optional[float], int]]" = OrderedDict()
+        self.current_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return a cached value and mark it most recently used"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        value, expires_at, _ = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return default
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Insert or replace a value, evicting LRU entries to stay within limits"""
+        if key in self._entries:
+            self._remove(key)
+
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        size = self.sizeof(key, value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        self._entries[key] = (value, expires_at, size)
+        self.current_bytes += size
+
+        while (len(self._entries) > self.max_entries or
+               (self.max_bytes is not None and self.current_bytes > self.max_bytes)):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove a key and return its value"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        self._remove(key)
+        return entry[0]
+
+    def clear(self):
+        """Invalidate every entry"""
+        self._entries.clear()
+        self.current_bytes = 0
+
+    def _remove(self, key: Hashable):
+        _, _, size = self._entries.pop(key)
+        self.current_bytes -= size
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit-rate and occupancy metrics"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+class DiskCache:
+    """JSON values in a SQLite table, shared by every process that opens the file.
+
+    Meant as a second tier behind a per-process LRUCache, so that uvicorn
+    workers see each other's entries. Reads never write: entries expire
+    after ``ttl`` seconds, and once the table grows past ``max_entries``
+    the oldest are trimmed in one go down to ``low_water`` of the limit,
+    so inserts don't pay for a trim each. The row count is re-read from
+    disk every so often because other processes insert too. Every call
+    blocks on SQLite; async callers should run it in a worker thread.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100000, ttl: Optional[float] = None,
+                 low_water: float = 0.9):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.low_water = int(max_entries * low_water)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._count = 0
+        self._writes = 0
+        # Re-count after this many inserts so other workers' rows are noticed
+        self._recount_every = max(1, max_entries // 100)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is not None:
+            return self._conn
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        tune_sqlite(self._conn)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_created_at ON cache (created_at)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        return self._conn
+
+    def __len__(self) -> int:
+        return self._count
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            self.misses += 1
+            return default
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, items: Dict[str, Any], ttl: Optional[float] = None):
+        """Insert or replace several entries in one transaction"""
+        now = time.time()
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = now + ttl if ttl else None
+        with self._lock:
+            conn = self._connect()
+            for key, value in items.items():
+                replaced = conn.execute(
+                    "SELECT 1 FROM cache WHERE key = ?", (key,)
+                ).fetchone() is not None
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, created_at, expires_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value), now, expires_at)
+                )
+                if not replaced:
+                    self._count += 1
+                self._writes += 1
+                if self._writes % self._recount_every == 0:
+                    self._count = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            if self._count > self.max_entries:
+                self._evict(now)
+            conn.commit()
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        value = self.get(key, default)
+        with self._lock:
+            conn = self._connect()
+            if conn.execute("DELETE FROM cache WHERE key = ?", (key,)).rowcount:
+                self._count -= 1
+            conn.commit()
+        return value
+
+    def _evict(self, now: float):
+        """Drop expired rows, then the oldest rows down to the low-water mark"""
+        expired = self._conn.execute(
+            "DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+        ).rowcount
+        count = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        trimmed = 0
+        if count > self.max_entries:
+            trimmed = self._conn.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM cache ORDER BY created_at LIMIT ?)",
+                (count - self.low_water,)
+            ).rowcount
+        self.evictions += expired + trimmed
+        self._count = count - trimmed
+
+    def clear(self):
+        """Invalidate every entry, for all processes"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM cache")
+            conn.commit()
+            self._count = 0
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": self._count,
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
@@ -1,12 +1,133 @@
+from pydantic import field_validator
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List, Optional
 
 class Settings(BaseSettings):
     HUGGINGFACE_API_KEY: str = ""
+    HF_API_BASE_URL: str = "https://api-inference.huggingface.co/models"
     DATABASE_URL: str = "sqlite:///./cascade.db"
     CORS_ORIGINS: List[str] = ["http://localhost:3000"]
     PORT: int = 8000
     
+    # Worker processes (uvicorn reads WEB_CONCURRENCY as its --workers default);
+    # per-process limits such as admission rates are divided between them
+    WEB_CONCURRENCY: int = 1
+    
+    # SQLAlchemy pool per worker process
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    
+    # Pragmas for every SQLite file (database, response and routing caches)
+    SQLITE_BUSY_TIMEOUT: float = 5.0
+    SQLITE_CACHE_SIZE_KB: int = 16384
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    
+    # Upstream HTTP connection pooling
+    HTTP2_ENABLED: bool = False
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    
+    # Routing decision cache
+    ROUTER_CACHE_MAX_ENTRIES: int = 10000
+    ROUTER_CACHE_MAX_BYTES: Optional[int] = 8 * 1024 * 1024
+    ROUTER_CACHE_TTL: Optional[float] = None
+    # Second tier on disk so every worker process shares learned routing decisions
+    ROUTER_CACHE_SHARED: bool = True
+    ROUTER_CACHE_PATH: str = "./router_cache.db"
+    ROUTER_CACHE_SHARED_MAX_ENTRIES: int = 100000
+    
+    # Routing mode: "heuristic" rules or a "learned" model from train_router.py
+    ROUTER_MODE: str = "heuristic"
+    ROUTER_MODEL_PATH: str = "./router_model.json"
+    ROUTER_MIN_SUCCESS: float = 0.7
+    # Let the router pick max_new_tokens per complexity and domain (else 256)
+    ADAPTIVE_TOKEN_BUDGETS: bool = True
+    # Count tokens with each model's tokenizer (the tokenizers package from
+    # requirements.txt; without it, or when disabled, words x 1.3 is used)
+    TOKENIZER_ENABLED: bool = True
+    
+    # Model response cache (in-memory LRU in front of SQLite)
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_PATH: str = "./response_cache.db"
+    RESPONSE_CACHE_MAX_ENTRIES: int = 100000
+    RESPONSE_CACHE_MEMORY_ENTRIES: int = 1000
+    RESPONSE_CACHE_TTL: Optional[float] = 7 * 24 * 3600
+    # Reuse answers to near-identical queries (MinHash/LSH) on exact misses
+    # (opt-in); a match needs the same content words in the same order and
+    # at least the tier's estimated similarity
+    NEAR_DUP_ENABLED: bool = False
+    NEAR_DUP_THRESHOLDS: Dict[str, float] = {"tiny": 0.9, "medium": 0.9, "large": 0.95}
+    NEAR_DUP_MAX_ENTRIES: int = 100000
+    
+    # Single-flight coalescing of identical in-flight queries
+    COALESCE_ENABLED: bool = True
+    COALESCE_WAIT_TIMEOUT: Optional[float] = None
+    
+    # Write-behind batching of query and savings logs
+    LOG_QUEUE_MAX: int = 10000
+    LOG_BATCH_SIZE: int = 500
+    LOG_FLUSH_INTERVAL: float = 0.5
+    
+    # Log retention: whole days older than this are moved from query_logs and
+    # cost_savings into gzipped NDJSON under LOG_ARCHIVE_DIR. Off by default;
+    # None, "", "none" or 0 keeps everything. /logs/export, train_router.py
+    # and simulate.py only read the live tables, so they skip archived days
+    LOG_RETENTION_DAYS: Optional[float] = None
+    LOG_ARCHIVE_DIR: str = "./archive"
+    LOG_ARCHIVE_INTERVAL: float = 3600.0
+    LOG_ARCHIVE_BATCH_SIZE: int = 5000
+    
+    # Rows fetched per round trip by /logs/export
+    LOG_EXPORT_FETCH_SIZE: int = 1000
+    
+    # Hedged cascade: start the next tier early for uncertain routes or latency budgets.
+    # A route is uncertain when its confidence is at most this far above the
+    # router's escalation threshold; below the threshold it always escalates
+    HEDGE_ENABLED: bool = False
+    HEDGE_CONFIDENCE_MARGIN: float = 0.1
+    HEDGE_DELAY: float = 1.0
+    HEDGE_BUDGET_FRACTION: float = 0.5
+    
+    # Stream lower tiers and cancel them once escalation is certain
+    EARLY_ABORT_ENABLED: bool = True
+    
+    # Batch endpoint
+    BATCH_MAX_QUERIES: int = 1000
+    BATCH_MAX_CONCURRENCY: int = 4
+    
+    # Per-model health tracking and circuit breakers
+    HEALTH_EWMA_ALPHA: float = 0.2
+    BREAKER_FAILURE_THRESHOLD: int = 5
+    BREAKER_MAX_ERROR_RATE: float = 0.5
+    BREAKER_MIN_REQUESTS: int = 10
+    BREAKER_OPEN_SECONDS: float = 30.0
+    BREAKER_MAX_OPEN_SECONDS: float = 300.0
+    
+    # Admission control: per-tier rate, concurrency and queue limits live in
+    # MODEL_CONFIGS; these are the queue wait budgets (seconds) per priority
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_WAIT: Dict[str, float] = {
+        "interactive": 2.0,
+        "batch": 30.0,
+        "forced": 10.0,
+        "background": 0.0
+    }
+    
+    # Cold-start handling: warm-keeper pings and how long to wait on a loading model
+    WARM_KEEP_ENABLED: bool = True
+    WARM_KEEP_INTERVAL: float = 240.0
+    WARM_DEFAULT_WAIT_BUDGET: float = 5.0
+    
+    @field_validator("LOG_RETENTION_DAYS", mode="before")
+    @classmethod
+    def retention_disabled(cls, value):
+        """Read an empty string, "none", "null" or 0 as keeping everything"""
+        if isinstance(value, str) and value.strip().lower() in ("", "none", "null"):
+            return None
+        if value is not None and float(value) == 0:
+            return None
+        return value
+    
     class Config:
         env_file = ".env"
 
@@ -0,0 +1,9 @@
+"""Point the tests at throwaway databases before anything imports config"""
+import os
+import tempfile
+
+_tmp = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_tmp, "test.db")
+os.environ["RESPONSE_CACHE_PATH"] = os.path.join(_tmp, "response_cache.db")
+os.environ["ROUTER_CACHE_PATH"] = os.path.join(_tmp, "router_cache.db")
+os.environ["LOG_ARCHIVE_DIR"] = os.path.join(_tmp, "archive")
@@ -1,8 +1,14 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text
+import time
+from sqlalchemy import (create_engine, event, func, insert, inspect, select, text, Column,
+                        Index, Integer, String, Float, DateTime, Text, UniqueConstraint)
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
 from config import settings
+from cache import tune_sqlite
 
 Base = declarative_base()
 
@@ -13,31 +19,151 @@ class QueryLog(Base):
     query_hash = Column(String(32), index=True)
     query_text = Column(Text)
     model_used = Column(String(50))
-    model_size = Column(String(20))
+    model_size = Column(String(20), index=True)
     response_time = Column(Float)
-    tokens_used = Column(Integer)
+    tokens_used = Column(Integer)  # Completion tokens
+    prompt_tokens = Column(Integer, default=0)  # Charged too (0 for rows logged before it was added)
     cost = Column(Float)
     confidence = Column(Float)
     routing_reason = Column(Text)
     was_escalated = Column(Integer, default=0)
-    timestamp = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    cache_hit = Column(Integer, default=0)
+    coalesced = Column(Integer, default=0)
+    hedged = Column(Integer, default=0)
+    timestamp = Column(DateTime, default=lambda: datetime.now(timezone.utc), index=True)
     
 class CostSaving(Base):
     __tablename__ = "cost_savings"
+    # Pairs rows logged before query_log_id existed (see paired_saving_id)
+    __table_args__ = (Index("ix_cost_savings_query_hash_timestamp", "query_hash", "timestamp"),)
     
     id = Column(Integer, primary_key=True, index=True)
-    query_hash = Column(String(32))
+    # The QueryLog row this saving belongs to (null for rows logged before it was added)
+    query_log_id = Column(Integer, index=True)
+    query_hash = Column(String(32), index=True)
     actual_cost = Column(Float)
     baseline_cost = Column(Float)  # What GPT-4 would cost
     saved = Column(Float)
-    timestamp = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    cache_hit = Column(Integer, default=0)
+    timestamp = Column(DateTime, default=lambda: datetime.now(timezone.utc), index=True)
+
+class StatsRollup(Base):
+    """Running totals per model, kept per minute, hour and day plus all-time"""
+    __tablename__ = "stats_rollups"
+    __table_args__ = (UniqueConstraint("bucket", "bucket_start", "model_size"),)
+    
+    id = Column(Integer, primary_key=True)
+    bucket = Column(String(10))  # minute, hour, day or total
+    bucket_start = Column(DateTime)
+    model_size = Column(String(20))
+    queries = Column(Integer, default=0)
+    tokens = Column(Integer, default=0)
+    prompt_tokens = Column(Integer, default=0)
+    cost = Column(Float, default=0)
+    baseline_cost = Column(Float, default=0)
+    saved = Column(Float, default=0)
+    response_time_sum = Column(Float, default=0)
+    escalations = Column(Integer, default=0)
+    cache_hits = Column(Integer, default=0)
+    cache_saved = Column(Float, default=0)
+
+class LogArchive(Base):
+    """One day of query and savings logs moved out of the live tables"""
+    __tablename__ = "log_archives"
+    
+    id = Column(Integer, primary_key=True)
+    day = Column(DateTime, index=True)
+    query_path = Column(Text)
+    savings_path = Column(Text)
+    query_rows = Column(Integer, default=0)
+    savings_rows = Column(Integer, default=0)
+    # Highest ids written to the files; rows up to these are safe to delete
+    max_query_id = Column(Integer, default=0)
+    max_savings_id = Column(Integer, default=0)
+    archived_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+class ArchiveSummary(Base):
+    """Hourly per-model totals of archived logs, so rollups can be rebuilt without them"""
+    __tablename__ = "archive_summaries"
+    __table_args__ = (UniqueConstraint("bucket_start", "model_size"),)
+    
+    id = Column(Integer, primary_key=True)
+    bucket_start = Column(DateTime)
+    model_size = Column(String(20))
+    queries = Column(Integer, default=0)
+    tokens = Column(Integer, default=0)
+    prompt_tokens = Column(Integer, default=0)
+    cost = Column(Float, default=0)
+    baseline_cost = Column(Float, default=0)
+    saved = Column(Float, default=0)
+    response_time_sum = Column(Float, default=0)
+    escalations = Column(Integer, default=0)
+    cache_hits = Column(Integer, default=0)
+    cache_saved = Column(Float, default=0)
+
+ROLLUP_BUCKETS = ("minute", "hour", "day", "total")
+ROLLUP_COUNTERS = ("queries", "tokens", "prompt_tokens", "cost", "baseline_cost", "saved",
+                   "response_time_sum", "escalations", "cache_hits", "cache_saved")
+TOTAL_BUCKET_START = datetime(1970, 1, 1)
+
+# Create engine and session. Each worker process gets its own pool; a
+# SQLite file still has a single writer, so the pool only needs to cover
+# concurrent readers plus the log writer.
+engine = create_engine(
+    settings.DATABASE_URL,
+    connect_args={"check_same_thread": False} if settings.DATABASE_URL.startswith("sqlite") else {},
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT
+)
+
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        """Use WAL so background log writes don't block readers"""
+        tune_sqlite(dbapi_connection)
 
-# Create engine and session
-engine = create_engine(settings.DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+def add_missing_columns():
+    """Add columns introduced after a database file was first created"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                default = column.default.arg if column.default is not None and column.default.is_scalar else None
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                if default is not None:
+                    ddl += f" DEFAULT {default!r}"
+                conn.execute(text(ddl))
+
+def add_missing_indexes():
+    """Create indexes introduced after a database file was first created"""
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
+def init_db(attempts: int = 5):
+    """Create tables and columns, tolerating other workers doing the same at once"""
+    for attempt in range(attempts):
+        try:
+            Base.metadata.create_all(bind=engine)
+            add_missing_columns()
+            add_missing_indexes()
+            return
+        except OperationalError:
+            # Another process created the table or column between our check and
+            # our DDL, or held the write lock past the busy timeout
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.1 * (attempt + 1))
+
+init_db()
 
 # Database helper functions
 def get_db():
@@ -47,38 +173,270 @@ def get_db():
     finally:
         db.close()
 
-def log_query(db, query_data: dict):
-    """Log a query and its routing decision"""
-    log_entry = QueryLog(**query_data)
-    db.add(log_entry)
-    db.commit()
-    return log_entry
+def _naive_utc(timestamp: datetime) -> datetime:
+    if timestamp.tzinfo is not None:
+        return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+def bucket_start(timestamp: datetime, bucket: str) -> datetime:
+    """Truncate a timestamp to the start of its rollup bucket (naive UTC)"""
+    timestamp = _naive_utc(timestamp)
+    if bucket == "minute":
+        return timestamp.replace(second=0, microsecond=0)
+    if bucket == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    if bucket == "day":
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    return TOTAL_BUCKET_START
+
+def rollup_deltas(query_rows: list, savings_rows: list) -> Dict[Tuple, Dict[str, float]]:
+    """Aggregate paired query/savings rows into per-bucket counter increments"""
+    deltas: Dict[Tuple, Dict[str, float]] = {}
+    for query, savings in zip(query_rows, savings_rows):
+        timestamp = query.get("timestamp") or datetime.now(timezone.utc)
+        cache_hit = query.get("cache_hit", 0)
+        for bucket in ROLLUP_BUCKETS:
+            key = (bucket, bucket_start(timestamp, bucket), query.get("model_size"))
+            counters = deltas.setdefault(key, dict.fromkeys(ROLLUP_COUNTERS, 0))
+            counters["queries"] += 1
+            counters["tokens"] += query.get("tokens_used") or 0
+            counters["prompt_tokens"] += query.get("prompt_tokens") or 0
+            counters["cost"] += query.get("cost") or 0
+            counters["baseline_cost"] += savings.get("baseline_cost") or 0
+            counters["saved"] += savings.get("saved") or 0
+            counters["response_time_sum"] += query.get("response_time") or 0
+            counters["escalations"] += query.get("was_escalated") or 0
+            counters["cache_hits"] += cache_hit or 0
+            counters["cache_saved"] += (savings.get("saved") or 0) if cache_hit else 0
+    return deltas
+
+def apply_rollups(db, deltas: Dict[Tuple, Dict[str, float]]):
+    """Add counter increments to the rollup rows, creating rows as needed"""
+    dialect_insert = postgresql.insert if engine.dialect.name == "postgresql" else sqlite.insert
+    table = StatsRollup.__table__
+    for (bucket, start, model_size), counters in deltas.items():
+        stmt = dialect_insert(table).values(
+            bucket=bucket, bucket_start=start, model_size=model_size, **counters
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["bucket", "bucket_start", "model_size"],
+            set_={name: table.c[name] + stmt.excluded[name] for name in ROLLUP_COUNTERS}
+        )
+        db.execute(stmt)
+
+def apply_archive_summaries(db, deltas: Dict[Tuple, Dict[str, float]]):
+    """Add the hourly counters of newly archived rows to archive_summaries"""
+    dialect_insert = postgresql.insert if engine.dialect.name == "postgresql" else sqlite.insert
+    table = ArchiveSummary.__table__
+    for (bucket, start, model_size), counters in deltas.items():
+        if bucket != "hour":
+            continue
+        stmt = dialect_insert(table).values(bucket_start=start, model_size=model_size, **counters)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["bucket_start", "model_size"],
+            set_={name: table.c[name] + stmt.excluded[name] for name in ROLLUP_COUNTERS}
+        )
+        db.execute(stmt)
+
+def log_batch(query_rows: list, savings_rows: list):
+    """Bulk insert paired query and savings rows and update the rollups in one transaction.
+    
+    Each savings row is linked to its query row through query_log_id.
+    """
+    db = SessionLocal()
+    try:
+        if query_rows:
+            ids = db.execute(
+                insert(QueryLog).returning(QueryLog.id, sort_by_parameter_order=True), query_rows
+            ).scalars().all()
+            savings_rows = [{**savings, "query_log_id": query_log_id}
+                            for savings, query_log_id in zip(savings_rows, ids)]
+        if savings_rows:
+            db.execute(insert(CostSaving), savings_rows)
+        apply_rollups(db, rollup_deltas(query_rows, savings_rows))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def rollup_inputs(log: QueryLog, saving: Optional[CostSaving]) -> Tuple[dict, dict]:
+    """The fields of a stored query/savings pair that feed the rollups"""
+    return {
+        "timestamp": log.timestamp,
+        "model_size": log.model_size,
+        "tokens_used": log.tokens_used,
+        "prompt_tokens": log.prompt_tokens,
+        "cost": log.cost,
+        "response_time": log.response_time,
+        "was_escalated": log.was_escalated,
+        "cache_hit": log.cache_hit
+    }, {
+        "baseline_cost": saving.baseline_cost if saving else 0,
+        "saved": saving.saved if saving else 0
+    }
 
-def log_savings(db, savings_data: dict):
-    """Log cost savings"""
-    savings_entry = CostSaving(**savings_data)
-    db.add(savings_entry)
+def rebuild_rollups(db, batch_size: int = 5000):
+    """Backfill the rollup tables from the raw logs (one-off, for older databases).
+    
+    Archived logs only survive as hourly summaries, so they contribute to
+    the hour, day and total buckets but not to minute buckets.
+    """
+    db.query(StatsRollup).delete()
+    
+    archived: Dict[Tuple, Dict[str, float]] = {}
+    for row in db.query(ArchiveSummary).yield_per(batch_size):
+        for bucket in ROLLUP_BUCKETS[1:]:
+            key = (bucket, bucket_start(row.bucket_start, bucket), row.model_size)
+            counters = archived.setdefault(key, dict.fromkeys(ROLLUP_COUNTERS, 0))
+            for name in ROLLUP_COUNTERS:
+                counters[name] += getattr(row, name) or 0
+    apply_rollups(db, archived)
+    
+    queries = db.query(QueryLog, CostSaving).outerjoin(
+        CostSaving, CostSaving.id == paired_saving_id()
+    ).order_by(QueryLog.id).yield_per(batch_size)
+    
+    query_rows, savings_rows = [], []
+    for log, saving in queries:
+        query_row, savings_row = rollup_inputs(log, saving)
+        query_rows.append(query_row)
+        savings_rows.append(savings_row)
+        if len(query_rows) >= batch_size:
+            apply_rollups(db, rollup_deltas(query_rows, savings_rows))
+            query_rows, savings_rows = [], []
+    
+    apply_rollups(db, rollup_deltas(query_rows, savings_rows))
     db.commit()
-    return savings_entry
+
+def ensure_rollups():
+    """Build the rollups once if the raw logs predate them"""
+    db = SessionLocal()
+    try:
+        has_rollups = db.query(StatsRollup.id).first() is not None
+        has_logs = (db.query(QueryLog.id).first() is not None or
+                    db.query(ArchiveSummary.id).first() is not None)
+        if has_logs and not has_rollups:
+            rebuild_rollups(db)
+    finally:
+        db.close()
 
 def get_stats(db):
-    """Get aggregate statistics"""
-    from sqlalchemy import func
+    """Get aggregate statistics from the running totals"""
+    totals = db.query(StatsRollup).filter(StatsRollup.bucket == "total").all()
     
-    total_queries = db.query(QueryLog).count()
-    total_cost = db.query(func.sum(QueryLog.cost)).scalar() or 0
-    total_saved = db.query(func.sum(CostSaving.saved)).scalar() or 0
-    avg_response_time = db.query(func.avg(QueryLog.response_time)).scalar() or 0
-    
-    model_distribution = db.query(
-        QueryLog.model_size,
-        func.count(QueryLog.id)
-    ).group_by(QueryLog.model_size).all()
+    total_queries = sum(row.queries for row in totals)
+    total_cost = sum(row.cost for row in totals)
+    total_saved = sum(row.saved for row in totals)
+    response_time_sum = sum(row.response_time_sum for row in totals)
+    avg_response_time = response_time_sum / total_queries if total_queries else 0
+    cache_hits = sum(row.cache_hits for row in totals)
+    cache_saved = sum(row.cache_saved for row in totals)
     
     return {
         "total_queries": total_queries,
         "total_cost": round(total_cost, 4),
         "total_saved": round(total_saved, 4),
         "avg_response_time": round(avg_response_time, 2),
-        "model_distribution": dict(model_distribution)
-    }
\ No newline at end of file
+        "model_distribution": {row.model_size: row.queries for row in totals},
+        "cache_hits": cache_hits,
+        "cache_saved": round(cache_saved, 4)
+    }
+
+def get_timeseries(db, start: datetime, end: datetime, bucket: str = "hour",
+                   model_size: Optional[str] = None) -> List[dict]:
+    """Get per-bucket totals for a time window from the rollups"""
+    if bucket not in ROLLUP_BUCKETS[:-1]:
+        raise ValueError(f"Unknown bucket: {bucket}")
+    
+    if end.tzinfo is not None:
+        end = end.astimezone(timezone.utc).replace(tzinfo=None)
+    
+    query = db.query(StatsRollup).filter(
+        StatsRollup.bucket == bucket,
+        StatsRollup.bucket_start >= bucket_start(start, bucket),
+        StatsRollup.bucket_start < end
+    )
+    if model_size:
+        query = query.filter(StatsRollup.model_size == model_size)
+    
+    points: Dict[datetime, dict] = {}
+    for row in query.order_by(StatsRollup.bucket_start):
+        point = points.setdefault(row.bucket_start, {
+            "bucket_start": row.bucket_start,
+            "model_distribution": {},
+            **dict.fromkeys(ROLLUP_COUNTERS, 0)
+        })
+        point["model_distribution"][row.model_size] = row.queries
+        for name in ROLLUP_COUNTERS:
+            point[name] += getattr(row, name)
+    
+    for point in points.values():
+        queries = point["queries"]
+        point["avg_response_time"] = point.pop("response_time_sum") / queries if queries else 0
+    return list(points.values())
+
+EXPORT_SAVINGS_COLUMNS = ("actual_cost", "baseline_cost", "saved")
+EXPORT_COLUMNS = tuple(column.name for column in QueryLog.__table__.columns) + EXPORT_SAVINGS_COLUMNS
+
+# How long after its query an unlinked savings row may be stamped and still pair with it
+SAVINGS_MATCH_WINDOW = 2.0
+
+def _seconds_after(column, seconds: float):
+    """SQL for a timestamp column plus ``seconds``"""
+    if engine.dialect.name == "sqlite":
+        # Same text layout SQLAlchemy stores, so the comparison is by string
+        return func.strftime("%Y-%m-%d %H:%M:%f", column, f"+{seconds} seconds")
+    return column + timedelta(seconds=seconds)
+
+def paired_saving_id():
+    """Correlated subquery for the id of the current QueryLog row's savings row.
+    
+    Rows written by log_batch are linked through query_log_id. Older rows
+    were committed one after the other without a link, so for them the
+    earliest unlinked savings row with the same query_hash stamped within
+    SAVINGS_MATCH_WINDOW seconds is taken.
+    """
+    linked = select(CostSaving.id).where(
+        CostSaving.query_log_id == QueryLog.id
+    ).limit(1).correlate(QueryLog).scalar_subquery()
+    candidate = CostSaving.__table__.alias("candidate")
+    legacy = select(candidate.c.id).where(
+        candidate.c.query_log_id.is_(None),
+        candidate.c.query_hash == QueryLog.query_hash,
+        candidate.c.timestamp >= QueryLog.timestamp,
+        candidate.c.timestamp <= _seconds_after(QueryLog.timestamp, SAVINGS_MATCH_WINDOW)
+    ).order_by(candidate.c.timestamp, candidate.c.id).limit(1).correlate(QueryLog).scalar_subquery()
+    return func.coalesce(linked, legacy)
+
+def iter_log_batches(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                     model_size: Optional[str] = None, escalated: Optional[bool] = None,
+                     batch_size: int = 1000) -> Iterator[List[dict]]:
+    """Stream query logs joined to their savings rows, in batches of ``batch_size``.
+    
+    Rows are fetched from a server-side cursor as they are consumed, so
+    memory stays flat however many rows match. Each query log gets at
+    most one savings row (see paired_saving_id).
+    """
+    query = select(
+        *QueryLog.__table__.columns,
+        *(CostSaving.__table__.c[name] for name in EXPORT_SAVINGS_COLUMNS)
+    ).select_from(QueryLog).outerjoin(CostSaving, CostSaving.id == paired_saving_id())
+    
+    if start is not None:
+        query = query.where(QueryLog.timestamp >= _naive_utc(start))
+    if end is not None:
+        query = query.where(QueryLog.timestamp < _naive_utc(end))
+    if model_size is not None:
+        query = query.where(QueryLog.model_size == model_size)
+    if escalated is not None:
+        query = query.where(QueryLog.was_escalated == int(escalated))
+    query = query.order_by(QueryLog.id).execution_options(yield_per=batch_size)
+    
+    db = SessionLocal()
+    try:
+        for partition in db.execute(query).partitions():
+            yield [dict(row._mapping) for row in partition]
+    finally:
+        db.close()
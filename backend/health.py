@@ -0,0 +1,133 @@
+import time
+from enum import Enum
+from typing import Any, Dict
+
+from models import ModelSize
+
+class BreakerState(Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+class ModelHealth:
+    """Health of a single model: EWMAs plus circuit breaker state"""
+
+    def __init__(self):
+        self.error_rate = 0.0
+        self.latency = None
+        self.requests = 0
+        self.consecutive_failures = 0
+        self.state = BreakerState.CLOSED
+        self.opened_at = 0.0
+        self.open_seconds = 0.0
+        self.probe_in_flight = False
+
+class HealthTracker:
+    """Per-model health tracking with circuit breakers.
+
+    Every upstream call reports its outcome and latency, and both feed
+    exponentially weighted moving averages. A breaker opens after
+    ``failure_threshold`` consecutive failures, or once the error-rate
+    EWMA passes ``max_error_rate``. While it is open, callers skip the
+    model. After the cool-down, a single half-open probe is let through.
+    If the probe succeeds the breaker closes. If it fails, the breaker
+    reopens with a doubled cool-down, capped at ``max_open_seconds``.
+    """
+
+    def __init__(self, alpha: float = 0.2, failure_threshold: int = 5,
+                 max_error_rate: float = 0.5, min_requests: int = 10,
+                 open_seconds: float = 30.0, max_open_seconds: float = 300.0):
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.max_error_rate = max_error_rate
+        self.min_requests = min_requests
+        self.base_open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.models: Dict[ModelSize, ModelHealth] = {size: ModelHealth() for size in ModelSize}
+
+    def _cooled_down(self, health: ModelHealth) -> bool:
+        return time.monotonic() - health.opened_at >= health.open_seconds
+
+    def is_available(self, model_size: ModelSize) -> bool:
+        """Whether a request to this model would currently be let through"""
+        health = self.models[model_size]
+        if health.state == BreakerState.CLOSED:
+            return True
+        if health.state == BreakerState.OPEN:
+            return self._cooled_down(health)
+        return not health.probe_in_flight
+
+    def allow_request(self, model_size: ModelSize) -> bool:
+        """Claim permission to call a model, turning a cooled-down breaker half-open"""
+        health = self.models[model_size]
+        if health.state == BreakerState.CLOSED:
+            return True
+        if health.state == BreakerState.OPEN:
+            if not self._cooled_down(health):
+                return False
+            health.state = BreakerState.HALF_OPEN
+        if health.probe_in_flight:
+            return False
+        health.probe_in_flight = True
+        return True
+
+    def _update_latency(self, health: ModelHealth, latency: float):
+        if health.latency is None:
+            health.latency = latency
+        else:
+            health.latency += self.alpha * (latency - health.latency)
+
+    def record_success(self, model_size: ModelSize, latency: float):
+        health = self.models[model_size]
+        health.requests += 1
+        health.error_rate += self.alpha * (0.0 - health.error_rate)
+        self._update_latency(health, latency)
+        health.consecutive_failures = 0
+        health.probe_in_flight = False
+        if health.state != BreakerState.CLOSED:
+            health.state = BreakerState.CLOSED
+            health.open_seconds = 0.0
+
+    def record_failure(self, model_size: ModelSize, latency: float):
+        health = self.models[model_size]
+        health.requests += 1
+        health.error_rate += self.alpha * (1.0 - health.error_rate)
+        self._update_latency(health, latency)
+        health.consecutive_failures += 1
+        health.probe_in_flight = False
+
+        if health.state == BreakerState.HALF_OPEN:
+            # Failed probe: back off further before the next one
+            self._open(health, min(health.open_seconds * 2, self.max_open_seconds))
+        elif health.state == BreakerState.CLOSED and (
+            health.consecutive_failures >= self.failure_threshold or
+            (health.requests >= self.min_requests and health.error_rate >= self.max_error_rate)
+        ):
+            self._open(health, self.base_open_seconds)
+
+    def record_cancelled(self, model_size: ModelSize):
+        """A call was abandoned before finishing; free the probe slot without judging it"""
+        self.models[model_size].probe_in_flight = False
+
+    def _open(self, health: ModelHealth, open_seconds: float):
+        health.state = BreakerState.OPEN
+        health.opened_at = time.monotonic()
+        health.open_seconds = open_seconds
+
+    def snapshot(self, model_size: ModelSize) -> Dict[str, Any]:
+        health = self.models[model_size]
+        retry_in = 0.0
+        if health.state == BreakerState.OPEN:
+            retry_in = max(0.0, health.open_seconds - (time.monotonic() - health.opened_at))
+        return {
+            "state": health.state.value,
+            "available": self.is_available(model_size),
+            "error_rate": round(health.error_rate, 4),
+            "latency": round(health.latency, 4) if health.latency is not None else None,
+            "requests": health.requests,
+            "consecutive_failures": health.consecutive_failures,
+            "retry_in": round(retry_in, 2)
+        }
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {size.value: self.snapshot(size) for size in ModelSize}
@@ -0,0 +1,127 @@
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from models import ModelSize
+
+TIERS = list(ModelSize)
+
+# Numeric features computed for every query, before the keyword indicators
+BASE_FEATURES = [
+    "log_words", "log_chars", "questions", "simple_pattern",
+    "complex_keywords", "code_keywords", "math_keywords"
+]
+
+def feature_names(router) -> List[str]:
+    """Base features followed by one indicator per routing keyword"""
+    keywords = [f"{group}:{keyword}"
+                for group, words in (("complex", router.complex_keywords),
+                                     ("code", router.code_keywords),
+                                     ("math", router.math_keywords))
+                for keyword in words]
+    return BASE_FEATURES + keywords
+
+def featurize(router, queries: Sequence[str], names: Sequence[str],
+              features: Optional[Sequence[Any]] = None) -> np.ndarray:
+    """Turn queries into a feature matrix with one row per query.
+
+    Keyword hits come from the router's matcher, so a keyword that has
+    been removed from the router's lists since training reads as absent.
+    Pass ``features`` to reuse QueryFeatures already extracted by the router.
+    """
+    columns = {name: i for i, name in enumerate(names)}
+    matrix = np.zeros((len(queries), len(names)), dtype=np.float64)
+    for row, query in enumerate(queries):
+        f = features[row] if features is not None else router.extract_features(query)
+        matrix[row, :len(BASE_FEATURES)] = (
+            f.word_count, len(query), f.question_count, f.matches_simple_pattern,
+            f.complex_score, f.technical_score, f.math_score
+        )
+        for group, hits in (("complex", f.complex_hits), ("code", f.code_hits),
+                            ("math", f.math_hits)):
+            for keyword in hits:
+                column = columns.get(f"{group}:{keyword}")
+                if column is not None:
+                    matrix[row, column] = 1.0
+    matrix[:, :2] = np.log1p(matrix[:, :2])
+    return matrix
+
+class TierModel:
+    """Multinomial logistic regression over the cheapest tier that answers without escalating.
+
+    Feature columns are standardized with the training mean and std, and
+    both are stored with the weights. Because every larger tier can handle
+    what a smaller one can, P(tier k suffices) is the cumulative
+    probability of classes 0..k.
+    """
+
+    def __init__(self, names: List[str], weights: np.ndarray, bias: np.ndarray,
+                 mean: np.ndarray, std: np.ndarray, metadata: Optional[Dict[str, Any]] = None):
+        self.names = names
+        self.weights = weights
+        self.bias = bias
+        self.mean = mean
+        self.std = std
+        self.metadata = metadata or {}
+
+    def predict_proba(self, matrix: np.ndarray) -> np.ndarray:
+        """Class probabilities, shape (queries, tiers)"""
+        logits = ((matrix - self.mean) / self.std) @ self.weights + self.bias
+        logits -= logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def success_probabilities(self, matrix: np.ndarray) -> np.ndarray:
+        """P(each tier answers without escalating), shape (queries, tiers)"""
+        return np.cumsum(self.predict_proba(matrix), axis=1)
+
+    def choose(self, matrix: np.ndarray, min_success: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Cheapest tier index per query whose success probability reaches ``min_success``"""
+        success = self.success_probabilities(matrix)
+        success[:, -1] = 1.0
+        tiers = np.argmax(success >= min_success, axis=1)
+        return tiers, success
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump({
+                "tiers": [size.value for size in TIERS],
+                "features": self.names,
+                "weights": self.weights.tolist(),
+                "bias": self.bias.tolist(),
+                "mean": self.mean.tolist(),
+                "std": self.std.tolist(),
+                "metadata": self.metadata
+            }, f, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> "TierModel":
+        with open(path) as f:
+            data = json.load(f)
+        if data["tiers"] != [size.value for size in TIERS]:
+            raise ValueError(f"Model tiers {data['tiers']} don't match {[s.value for s in TIERS]}")
+        return cls(
+            data["features"], np.array(data["weights"]), np.array(data["bias"]),
+            np.array(data["mean"]), np.array(data["std"]), data.get("metadata")
+        )
+
+def fit(matrix: np.ndarray, labels: np.ndarray, names: List[str], l2: float = 1e-3,
+        learning_rate: float = 0.5, epochs: int = 500) -> TierModel:
+    """Fit softmax regression by full-batch gradient descent on standardized features"""
+    mean = matrix.mean(axis=0)
+    std = matrix.std(axis=0)
+    std[std == 0] = 1.0
+    x = (matrix - mean) / std
+    y = np.eye(len(TIERS))[labels]
+
+    weights = np.zeros((x.shape[1], len(TIERS)))
+    bias = np.log(y.mean(axis=0) + 1e-6)
+    for _ in range(epochs):
+        logits = x @ weights + bias
+        logits -= logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        error = exp / exp.sum(axis=1, keepdims=True) - y
+        weights -= learning_rate * (x.T @ error / len(x) + l2 * weights)
+        bias -= learning_rate * error.mean(axis=0)
+    return TierModel(names, weights, bias, mean, std)
@@ -0,0 +1,128 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from database import log_batch
+
+class LogWriter:
+    """Write-behind logger that batches QueryLog and CostSaving rows.
+
+    Requests hand their rows to a bounded queue and return immediately.
+    A background task drains the queue and bulk inserts rows in a worker
+    thread, flushing once ``batch_size`` rows are pending or
+    ``flush_interval`` seconds have passed. When the queue is full,
+    ``submit`` waits for room, so the database's write rate limits
+    producers instead of memory growing without bound.
+    """
+
+    def __init__(self, max_queue: int = 10000, batch_size: int = 500,
+                 flush_interval: float = 0.5, metrics=None):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Optional CascadeMetrics recording flush latency
+        self.metrics = metrics
+
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+
+        self.rows_written = 0
+        self.batches_written = 0
+        self.failed_rows = 0
+        self.last_flush_seconds = 0.0
+
+    async def start(self):
+        """Start the background writer (called on app startup)"""
+        if self.task is None:
+            self.queue = asyncio.Queue(maxsize=self.max_queue)
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything still queued and stop the writer (called on app shutdown)"""
+        if self.task is None:
+            return
+        await self.queue.put(None)
+        await self.task
+        self.task = None
+        self.queue = None
+
+    async def submit(self, query_data: Dict[str, Any], savings_data: Dict[str, Any]):
+        """Queue a query log row and its savings row for writing"""
+        # Stamp both rows now so they reflect request time, not flush time
+        timestamp = datetime.now(timezone.utc)
+        query_data.setdefault("timestamp", timestamp)
+        savings_data.setdefault("timestamp", timestamp)
+
+        if self.task is None:
+            # Writer not running (e.g. outside the app lifespan): write directly
+            await self._flush([(query_data, savings_data)])
+            return
+        await self.queue.put((query_data, savings_data))
+
+    async def submit_many(self, rows: List[Tuple[Dict[str, Any], Dict[str, Any]]]):
+        """Queue many (query row, savings row) pairs at once"""
+        timestamp = datetime.now(timezone.utc)
+        for query_data, savings_data in rows:
+            query_data.setdefault("timestamp", timestamp)
+            savings_data.setdefault("timestamp", timestamp)
+
+        if self.task is None:
+            await self._flush(list(rows))
+            return
+        for row in rows:
+            await self.queue.put(row)
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            item = await self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+
+            # Keep collecting until the batch is full or the interval elapses
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Tuple[Dict[str, Any], Dict[str, Any]]]):
+        query_rows = [query for query, _ in batch]
+        savings_rows = [savings for _, savings in batch]
+        start = time.perf_counter()
+        try:
+            await asyncio.to_thread(log_batch, query_rows, savings_rows)
+        except Exception as e:
+            print(f"Error writing {len(batch)} log rows: {e}")
+            self.failed_rows += len(batch)
+            if self.metrics is not None:
+                self.metrics.db_write_rows.inc("failed", amount=len(batch))
+            return
+        self.last_flush_seconds = time.perf_counter() - start
+        if self.metrics is not None:
+            self.metrics.db_write_seconds.observe(self.last_flush_seconds)
+            self.metrics.db_write_rows.inc("written", amount=len(batch))
+        self.rows_written += len(batch)
+        self.batches_written += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "max_queue": self.max_queue,
+            "rows_written": self.rows_written,
+            "batches_written": self.batches_written,
+            "failed_rows": self.failed_rows,
+            "last_flush_seconds": round(self.last_flush_seconds, 4)
+        }
@@ -1,17 +1,66 @@
 # backend/main.py
 from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, Dict
+from typing import Optional, Dict, List, AsyncIterator, Iterator, Tuple
+from contextlib import asynccontextmanager
+import asyncio
+import csv
+import io
+import json
 import time
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 
 from config import settings
-from router import CascadeRouter
+from router import CascadeRouter, RouteDecision
 from models import ModelClient, ModelSize, MODEL_CONFIGS
-from database import get_db, log_query, log_savings, get_stats
+from tokens import TokenCounter
+from health import HealthTracker
+from warmup import ModelReadiness, WarmKeeper
+from response_cache import ResponseCache
+from similarity import NearDuplicateIndex
+from cache import DiskCache
+from singleflight import SingleFlight
+from log_writer import LogWriter
+from archiver import LogArchiver
+from admission import AdmissionController, AdmissionRejected, Priority
+from metrics import CascadeMetrics
+from database import (get_db, get_stats, get_timeseries, ensure_rollups, iter_log_batches,
+                      EXPORT_COLUMNS)
 
-app = FastAPI(title="CascadeLearn API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open shared resources on startup and release them on shutdown"""
+    await model_client.start()
+    await asyncio.to_thread(ensure_rollups)
+    await log_writer.start()
+    if settings.WARM_KEEP_ENABLED:
+        await warm_keeper.start()
+    if log_archiver is not None:
+        await log_archiver.start()
+    yield
+    if log_archiver is not None:
+        await log_archiver.stop()
+    await warm_keeper.stop()
+    await log_writer.stop()
+    await model_client.close()
+    if response_cache is not None:
+        response_cache.close()
+    if router.shared_cache is not None:
+        router.shared_cache.close()
+
+app = FastAPI(title="CascadeLearn API", version="1.0.0", lifespan=lifespan)
+
+def create_app() -> FastAPI:
+    """App factory for ``uvicorn main:create_app --factory --workers N``.
+
+    Every worker process imports this module and so builds its own
+    clients, queues and in-memory caches. The database, the response cache
+    and the routing cache's second tier are SQLite files in WAL mode that
+    all workers share.
+    """
+    return app
 
 # Configure CORS
 app.add_middleware(
@@ -23,24 +72,102 @@ app.add_middleware(
 )
 
 # Initialize components
-router = CascadeRouter()
-model_client = ModelClient()
+metrics = CascadeMetrics()
+health = HealthTracker(
+    alpha=settings.HEALTH_EWMA_ALPHA,
+    failure_threshold=settings.BREAKER_FAILURE_THRESHOLD,
+    max_error_rate=settings.BREAKER_MAX_ERROR_RATE,
+    min_requests=settings.BREAKER_MIN_REQUESTS,
+    open_seconds=settings.BREAKER_OPEN_SECONDS,
+    max_open_seconds=settings.BREAKER_MAX_OPEN_SECONDS
+)
+readiness = ModelReadiness()
+admission = AdmissionController(
+    settings.ADMISSION_MAX_WAIT, metrics=metrics, workers=settings.WEB_CONCURRENCY
+) if settings.ADMISSION_ENABLED else None
+router = CascadeRouter(
+    health=health,
+    readiness=readiness,
+    shared_cache=DiskCache(
+        settings.ROUTER_CACHE_PATH,
+        max_entries=settings.ROUTER_CACHE_SHARED_MAX_ENTRIES,
+        ttl=settings.ROUTER_CACHE_TTL
+    ) if settings.ROUTER_CACHE_SHARED else None
+)
+token_counter = TokenCounter(settings.TOKENIZER_ENABLED)
+model_client = ModelClient(health=health, readiness=readiness, metrics=metrics,
+                           admission=admission, token_counter=token_counter)
+warm_keeper = WarmKeeper(model_client, readiness, interval=settings.WARM_KEEP_INTERVAL)
+response_cache = ResponseCache(
+    settings.RESPONSE_CACHE_PATH,
+    max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+    memory_entries=settings.RESPONSE_CACHE_MEMORY_ENTRIES,
+    ttl=settings.RESPONSE_CACHE_TTL,
+    near_duplicates=NearDuplicateIndex(
+        settings.NEAR_DUP_THRESHOLDS,
+        capacity=settings.NEAR_DUP_MAX_ENTRIES
+    ) if settings.NEAR_DUP_ENABLED else None
+) if settings.RESPONSE_CACHE_ENABLED else None
+single_flight = SingleFlight()
+log_writer = LogWriter(
+    max_queue=settings.LOG_QUEUE_MAX,
+    batch_size=settings.LOG_BATCH_SIZE,
+    flush_interval=settings.LOG_FLUSH_INTERVAL,
+    metrics=metrics
+)
+log_archiver = LogArchiver(
+    settings.LOG_ARCHIVE_DIR,
+    settings.LOG_RETENTION_DAYS,
+    interval=settings.LOG_ARCHIVE_INTERVAL,
+    batch_size=settings.LOG_ARCHIVE_BATCH_SIZE
+) if settings.LOG_RETENTION_DAYS is not None else None
+metrics.bind(model_client, router, response_cache, single_flight, log_writer, admission)
 
 # Pydantic models
 class QueryRequest(BaseModel):
     query: str
     force_model: Optional[str] = None  # For testing specific models
+    latency_budget: Optional[float] = None  # Seconds; enables hedging to the next tier
 
 class QueryResponse(BaseModel):
     response: str
     model_used: str
     model_size: str
-    tokens: int
+    tokens: int  # Completion tokens
+    prompt_tokens: int = 0  # Also charged in cost
     cost: float
     savings: float
     response_time: float
     confidence: float
     routing_reason: str
+    cached: bool = False
+    coalesced: bool = False
+    hedged: bool = False
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    force_model: Optional[str] = None
+    max_concurrency: Optional[int] = None  # Concurrent upstream requests per tier
+
+class BatchItemResponse(BaseModel):
+    query: str
+    response: str
+    model_used: str
+    model_size: str
+    tokens: int  # Completion tokens
+    prompt_tokens: int = 0  # Also charged in cost
+    cost: float
+    savings: float
+    confidence: float
+    routing_reason: str
+    was_escalated: bool
+    cached: bool
+
+class BatchQueryResponse(BaseModel):
+    results: List[BatchItemResponse]
+    total_cost: float
+    total_savings: float
+    response_time: float
 
 class StatsResponse(BaseModel):
     total_queries: int
@@ -49,120 +176,620 @@ class StatsResponse(BaseModel):
     avg_response_time: float
     model_distribution: Dict[str, int]
     savings_percentage: float
+    cache_hits: int = 0
+    cache_saved: float = 0.0
 
 @app.get("/")
 async def root():
     return {
         "name": "CascadeLearn API",
         "status": "running",
-        "endpoints": ["/query", "/stats", "/models", "/health"]
+        "endpoints": ["/query", "/query/stream", "/query/batch", "/stats", "/stats/timeseries", "/logs/export", "/models", "/health", "/cache/stats", "/metrics"]
     }
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": datetime.now(timezone.utc)}
+    return {
+        "status": "healthy",
+        "timestamp": datetime.now(timezone.utc),
+        "models": health.stats(),
+        "readiness": readiness.stats(),
+        "connection_pools": model_client.pool_stats(),
+        "admission": admission.stats() if admission is not None else None,
+        "log_writer": log_writer.stats(),
+        "log_archive": log_archiver.stats() if log_archiver is not None else None
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics in the text exposition format"""
+    return Response(metrics.render(), media_type=metrics.content_type)
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Get cache hit-rate and occupancy metrics"""
+    return {
+        "routing": router.decision_cache.stats(),
+        "routing_shared": router.shared_cache.stats() if router.shared_cache is not None else None,
+        "responses": response_cache.stats() if response_cache is not None else None,
+        "coalescing": single_flight.stats()
+    }
 
 @app.get("/models")
 async def get_models():
     """Get information about available models"""
+    token_counting = token_counter.stats()
     return {
         model_size.value: {
             "name": config["name"],
             "parameters": config["params"],
-            "cost_per_1k_tokens": config["cost_per_token"] * 1000
+            "cost_per_1k_tokens": config["cost_per_token"] * 1000,
+            "health": health.snapshot(model_size),
+            "readiness": readiness.snapshot(model_size),
+            "token_counting": token_counting[model_size.value]
         }
         for model_size, config in MODEL_CONFIGS.items()
     }
 
+def next_model_size(model_size: ModelSize) -> ModelSize:
+    """The tier to escalate to from a given tier"""
+    if model_size == ModelSize.TINY:
+        return ModelSize.MEDIUM
+    return ModelSize.LARGE
+
+def request_priority(force_model: Optional[str],
+                     default: Priority = Priority.INTERACTIVE) -> Priority:
+    """Forced-model requests are admitted after everything else"""
+    return Priority.FORCED if force_model else default
+
+def admission_error(error: AdmissionRejected) -> HTTPException:
+    """Turn an admission rejection into a 429/503 with a Retry-After hint"""
+    headers = None
+    if error.retry_after:
+        headers = {"Retry-After": str(max(1, round(error.retry_after)))}
+    return HTTPException(status_code=error.status_code, detail=str(error), headers=headers)
+
+async def route_query(query: str, force_model: Optional[str] = None,
+                      latency_budget: Optional[float] = None) -> RouteDecision:
+    """Pick the starting tier for a query"""
+    if force_model:
+        # Allow forcing a specific model for testing
+        return RouteDecision(ModelSize(force_model), 1.0, "Forced model selection")
+    start = time.perf_counter()
+    decision = await router.aroute(query, latency_budget)
+    metrics.routing_seconds.observe(time.perf_counter() - start)
+    return decision
+
+def should_escalate(result: Dict, routing_decision: RouteDecision) -> bool:
+    """Whether a tier's answer needs a larger model (timed for /metrics)"""
+    start = time.perf_counter()
+    escalate = router.should_escalate(result["text"], routing_decision.confidence)
+    metrics.escalation_check_seconds.observe(time.perf_counter() - start)
+    return escalate
+
+async def query_with_cache(model_size: ModelSize, query: str,
+                           priority: Optional[Priority] = None,
+                           max_new_tokens: Optional[int] = None) -> Dict:
+    """Serve a tier's answer from the response cache, querying the model on a miss"""
+    if response_cache is None:
+        return await model_client.query_model(model_size, query, priority, max_new_tokens)
+    
+    # The budget is part of the parameters, so answers cut shorter aren't reused
+    params = model_client.generation_parameters(model_size, max_new_tokens)
+    cached = await response_cache.get(query, model_size, params)
+    if cached is not None:
+        cached["cost"] = 0
+        cached["cache_hit"] = True
+        return cached
+    
+    result = await model_client.query_model(model_size, query, priority, max_new_tokens)
+    # Only cache successful answers from the tier that was asked
+    if not result.get("error") and result["model_size"] == model_size.value:
+        await response_cache.set(query, model_size, params, result)
+    return result
+
+async def stream_with_cache(model_size: ModelSize, query: str,
+                            priority: Optional[Priority] = None,
+                            max_new_tokens: Optional[int] = None) -> AsyncIterator[Dict]:
+    """Streaming counterpart of query_with_cache; a cache hit arrives as one token"""
+    params = model_client.generation_parameters(model_size, max_new_tokens)
+    if response_cache is not None:
+        cached = await response_cache.get(query, model_size, params)
+        if cached is not None:
+            cached["cost"] = 0
+            cached["cache_hit"] = True
+            yield {"token": cached["text"]}
+            yield {"result": cached}
+            return
+    
+    stream = model_client.stream_model(model_size, query, priority, max_new_tokens)
+    try:
+        async for event in stream:
+            result = event.get("result")
+            if (result is not None and response_cache is not None and not result.get("error")
+                    and result["model_size"] == model_size.value):
+                await response_cache.set(query, model_size, params, result)
+            yield event
+    finally:
+        # Close the upstream stream now rather than when it is garbage collected
+        await stream.aclose()
+
+async def query_with_early_abort(model_size: ModelSize, query: str,
+                                 routing_decision: RouteDecision,
+                                 priority: Optional[Priority] = None) -> Optional[Dict]:
+    """Stream a tier's answer, abandoning it as soon as escalation becomes certain.
+    
+    Returns the finished result, or None if the tier was skipped or its
+    generation cancelled because the answer was going to be escalated anyway.
+    """
+    monitor = router.escalation_monitor(routing_decision.confidence)
+    if not monitor.certain:
+        stream = stream_with_cache(model_size, query, priority, routing_decision.max_new_tokens)
+        try:
+            async for event in stream:
+                if "result" in event:
+                    return event["result"]
+                if monitor.feed(event["token"]):
+                    break
+        finally:
+            await stream.aclose()
+    metrics.early_aborts.inc(model_size.value, monitor.reason)
+    return None
+
+def hedge_delay(routing_decision: RouteDecision, force_model: Optional[str],
+                latency_budget: Optional[float]) -> Optional[float]:
+    """How long to wait before hedging to the next tier, or None to run serially"""
+    if not settings.HEDGE_ENABLED or force_model:
+        return None
+    if routing_decision.model_size == ModelSize.LARGE:
+        return None
+    threshold = router.escalation_confidence
+    if routing_decision.confidence < threshold:
+        # Certain to escalate, so the first tier can't win a race; the serial
+        # cascade goes straight to the next tier when early abort is on
+        return None
+    
+    delays = []
+    if routing_decision.confidence < threshold + settings.HEDGE_CONFIDENCE_MARGIN:
+        delays.append(settings.HEDGE_DELAY)
+    if latency_budget is not None:
+        delays.append(latency_budget * settings.HEDGE_BUDGET_FRACTION)
+    return min(delays) if delays else None
+
+async def run_hedged(query: str, routing_decision: RouteDecision, delay: float,
+                     priority: Optional[Priority] = None):
+    """Start the next tier after ``delay`` if the first hasn't answered; first acceptable answer wins"""
+    budget = routing_decision.max_new_tokens
+    primary = asyncio.ensure_future(
+        query_with_cache(routing_decision.model_size, query, priority, budget)
+    )
+    hedge_size = next_model_size(routing_decision.model_size)
+    
+    done, _ = await asyncio.wait({primary}, timeout=delay)
+    if done:
+        # Answered within the delay: fall back to the serial cascade
+        result = primary.result()
+        if not should_escalate(result, routing_decision):
+            return result, False
+        return await query_with_cache(hedge_size, query, priority, budget), True
+    
+    hedge = asyncio.ensure_future(query_with_cache(hedge_size, query, priority, budget))
+    pending = {primary, hedge}
+    completed = []
+    rejected = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # Prefer an acceptable primary answer if both finished together
+            for task in sorted(done, key=lambda t: t is hedge):
+                if task is hedge and isinstance(task.exception(), AdmissionRejected):
+                    # No room on the larger tier; the primary may still be good enough
+                    rejected = task.exception()
+                    continue
+                result = task.result()
+                completed.append(result)
+                if task is hedge or not should_escalate(result, routing_decision):
+                    # Both completed calls were paid for
+                    winner = dict(result)
+                    winner["cost"] = sum(call["cost"] for call in completed)
+                    winner["hedged"] = True
+                    return winner, task is hedge
+        raise rejected
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def run_cascade(query: str, force_model: Optional[str] = None,
+                      latency_budget: Optional[float] = None):
+    """Route a query, call the selected model and escalate if needed"""
+    # Route the query
+    routing_decision = await route_query(query, force_model, latency_budget)
+    priority = request_priority(force_model)
+    
+    delay = hedge_delay(routing_decision, force_model, latency_budget)
+    if delay is not None:
+        result, was_escalated = await run_hedged(query, routing_decision, delay, priority)
+        return routing_decision, result, was_escalated
+    
+    # Query the selected model
+    if settings.EARLY_ABORT_ENABLED and routing_decision.model_size != ModelSize.LARGE:
+        result = await query_with_early_abort(
+            routing_decision.model_size, query, routing_decision, priority
+        )
+    else:
+        result = await query_with_cache(
+            routing_decision.model_size, query, priority, routing_decision.max_new_tokens
+        )
+    
+    # Check if we need to escalate
+    if result is None or should_escalate(result, routing_decision):
+        # Try the next larger model
+        new_size = next_model_size(routing_decision.model_size)
+        result = await query_with_cache(new_size, query, priority, routing_decision.max_new_tokens)
+        was_escalated = True
+    else:
+        was_escalated = False
+    
+    return routing_decision, result, was_escalated
+
+def build_log_rows(query: str, routing_decision: RouteDecision, result: Dict,
+                   was_escalated: bool, response_time: float,
+                   coalesced: bool = False):
+    """Work out cost and savings for a served query and build its log rows"""
+    query_hash = router.get_query_hash(query)
+    
+    # Calculate savings (compare to large model), prompt tokens included
+    prompt_tokens = result.get("prompt_tokens", 0)
+    baseline_cost = ((result["tokens"] + prompt_tokens) *
+                    MODEL_CONFIGS[ModelSize.LARGE]["cost_per_token"])
+    # Coalesced callers didn't pay for the shared upstream call
+    actual_cost = 0 if coalesced else result["cost"]
+    savings = baseline_cost - actual_cost
+    cache_hit = bool(result.get("cache_hit"))
+    
+    query_row = {
+        "query_hash": query_hash,
+        "query_text": query[:500],  # Truncate long queries
+        "model_used": result["model"],
+        "model_size": result["model_size"],
+        "response_time": response_time,
+        "tokens_used": result["tokens"],
+        "prompt_tokens": prompt_tokens,
+        "cost": actual_cost,
+        "confidence": routing_decision.confidence,
+        "routing_reason": routing_decision.reason,
+        "was_escalated": int(was_escalated),
+        "cache_hit": int(cache_hit),
+        "coalesced": int(coalesced),
+        "hedged": int(bool(result.get("hedged")))
+    }
+    savings_row = {
+        "query_hash": query_hash,
+        "actual_cost": actual_cost,
+        "baseline_cost": baseline_cost,
+        "saved": savings,
+        "cache_hit": int(cache_hit)
+    }
+    accounting = {"cost": actual_cost, "savings": savings, "cached": cache_hit,
+                  "prompt_tokens": prompt_tokens}
+    
+    tier = result["model_size"]
+    metrics.queries.inc(tier)
+    # Coalesced callers share the leader's upstream work, so only count it once
+    if not coalesced:
+        if was_escalated:
+            metrics.escalations.inc(routing_decision.model_size.value, tier)
+        if not cache_hit:
+            metrics.tokens.inc(tier, amount=result["tokens"])
+            metrics.prompt_tokens.inc(tier, amount=prompt_tokens)
+            metrics.cost.inc(tier, amount=actual_cost)
+    return query_row, savings_row, accounting
+
+async def record_query(query: str, routing_decision: RouteDecision, result: Dict,
+                       was_escalated: bool, response_time: float,
+                       coalesced: bool = False) -> Dict:
+    """Work out cost and savings for a served query and queue its log rows"""
+    query_row, savings_row, accounting = build_log_rows(
+        query, routing_decision, result, was_escalated, response_time, coalesced
+    )
+    # Queue for the background log writer
+    await log_writer.submit(query_row, savings_row)
+    return accounting
+
 @app.post("/query", response_model=QueryResponse)
-async def process_query(request: QueryRequest, db=Depends(get_db)):
+async def process_query(request: QueryRequest):
     """Process a query through the cascade router"""
     start_time = time.time()
+    metrics.in_flight.inc("query")
     
     try:
-        # Route the query
-        if request.force_model:
-            # Allow forcing a specific model for testing
-            model_size = ModelSize(request.force_model)
-            # Create a simple routing decision object
-            from dataclasses import dataclass
-            
-            @dataclass
-            class RouteDecision:
-                model_size: ModelSize
-                confidence: float
-                reason: str
-            
-            routing_decision = RouteDecision(
-                model_size, 1.0, "Forced model selection"
+        if settings.COALESCE_ENABLED:
+            # Identical concurrent queries share a single upstream cascade
+            query_hash = router.get_query_hash(request.query)
+            (routing_decision, result, was_escalated), coalesced = await single_flight.do(
+                f"{request.force_model or 'auto'}:{query_hash}",
+                lambda: run_cascade(request.query, request.force_model,
+                                    request.latency_budget),
+                timeout=settings.COALESCE_WAIT_TIMEOUT
             )
         else:
-            routing_decision = router.route(request.query)
-        
-        # Query the selected model
-        result = await model_client.query_model(
-            routing_decision.model_size,
-            request.query
-        )
-        
-        # Check if we need to escalate
-        if router.should_escalate(result["text"], routing_decision.confidence):
-            # Try the next larger model
-            if routing_decision.model_size == ModelSize.TINY:
-                new_size = ModelSize.MEDIUM
-            elif routing_decision.model_size == ModelSize.MEDIUM:
-                new_size = ModelSize.LARGE
-            else:
-                new_size = ModelSize.LARGE
-            
-            result = await model_client.query_model(new_size, request.query)
-            was_escalated = True
-        else:
-            was_escalated = False
+            routing_decision, result, was_escalated = await run_cascade(
+                request.query, request.force_model, request.latency_budget
+            )
+            coalesced = False
         
         response_time = time.time() - start_time
-        
-        # Calculate savings (compare to large model)
-        baseline_cost = (result["tokens"] * 
-                        MODEL_CONFIGS[ModelSize.LARGE]["cost_per_token"])
-        actual_cost = result["cost"]
-        savings = baseline_cost - actual_cost
-        
-        # Log to database
-        log_query(db, {
-            "query_hash": router.get_query_hash(request.query),
-            "query_text": request.query[:500],  # Truncate long queries
-            "model_used": result["model"],
-            "model_size": result["model_size"],
-            "response_time": response_time,
-            "tokens_used": result["tokens"],
-            "cost": actual_cost,
-            "confidence": routing_decision.confidence,
-            "routing_reason": routing_decision.reason,
-            "was_escalated": int(was_escalated)
-        })
-        
-        log_savings(db, {
-            "query_hash": router.get_query_hash(request.query),
-            "actual_cost": actual_cost,
-            "baseline_cost": baseline_cost,
-            "saved": savings
-        })
+        accounting = await record_query(
+            request.query, routing_decision, result, was_escalated,
+            response_time, coalesced
+        )
         
         return QueryResponse(
             response=result["text"],
             model_used=result["model"],
             model_size=result["model_size"],
             tokens=result["tokens"],
-            cost=actual_cost,
-            savings=savings,
+            prompt_tokens=accounting["prompt_tokens"],
+            cost=accounting["cost"],
+            savings=accounting["savings"],
             response_time=response_time,
             confidence=routing_decision.confidence,
-            routing_reason=routing_decision.reason
+            routing_reason=routing_decision.reason,
+            cached=accounting["cached"],
+            coalesced=coalesced,
+            hedged=bool(result.get("hedged"))
         )
         
+    except asyncio.TimeoutError:
+        metrics.errors.inc("query")
+        raise HTTPException(status_code=504, detail="Timed out waiting for a coalesced query")
+    except AdmissionRejected as e:
+        metrics.errors.inc("query")
+        raise admission_error(e)
+    except HTTPException:
+        raise
+    except Exception as e:
+        metrics.errors.inc("query")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        metrics.in_flight.dec("query")
+        metrics.request_seconds.observe(time.time() - start_time, "query")
+
+async def query_batch_with_cache(model_size: ModelSize, queries: List[str],
+                                 max_concurrency: int,
+                                 priority: Priority = Priority.BATCH,
+                                 max_new_tokens: Optional[int] = None) -> List[Dict]:
+    """Batched counterpart of query_with_cache, results in input order"""
+    results: List[Optional[Dict]] = [None] * len(queries)
+    params = model_client.generation_parameters(model_size, max_new_tokens)
+    
+    # Duplicate prompts within a batch are only sent upstream once
+    misses: Dict[str, List[int]] = {}
+    for i, query in enumerate(queries):
+        if query in misses:
+            misses[query].append(i)
+            continue
+        cached = await response_cache.get(query, model_size, params) if response_cache else None
+        if cached is not None:
+            cached["cost"] = 0
+            cached["cache_hit"] = True
+            results[i] = cached
+        else:
+            misses[query] = [i]
+    
+    unique = list(misses)
+    fetched = await model_client.query_batch(model_size, unique, max_concurrency, priority,
+                                             max_new_tokens)
+    for query, result in zip(unique, fetched):
+        first, *duplicates = misses[query]
+        results[first] = result
+        for i in duplicates:
+            results[i] = {**result, "cost": 0, "cache_hit": True}
+        if (response_cache is not None and not result.get("error")
+                and result["model_size"] == model_size.value):
+            await response_cache.set(query, model_size, params, result)
+    return results
+
+async def run_tier_groups(groups: Dict[Tuple[ModelSize, Optional[int]], List[int]],
+                          queries: List[str], max_concurrency: int,
+                          priority: Priority = Priority.BATCH) -> Dict[int, Dict]:
+    """Send each (tier, token budget) group its queries concurrently; map query index to result"""
+    keys = [key for key, indices in groups.items() if indices]
+    tier_results = await asyncio.gather(*(
+        query_batch_with_cache(size, [queries[i] for i in groups[(size, budget)]],
+                               max_concurrency, priority, budget)
+        for size, budget in keys
+    ))
+    return {
+        i: result
+        for key, results in zip(keys, tier_results)
+        for i, result in zip(groups[key], results)
+    }
+
+@app.post("/query/batch", response_model=BatchQueryResponse)
+async def process_batch(request: BatchQueryRequest):
+    """Process many queries at once, micro-batching each tier's share"""
+    if len(request.queries) > settings.BATCH_MAX_QUERIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.BATCH_MAX_QUERIES} queries per batch"
+        )
+    start_time = time.time()
+    queries = request.queries
+    max_concurrency = request.max_concurrency or settings.BATCH_MAX_CONCURRENCY
+    metrics.in_flight.inc("batch")
+    
+    try:
+        # Route every prompt in one pass, then group by tier
+        if request.force_model:
+            decisions = [await route_query(query, request.force_model) for query in queries]
+        else:
+            decisions = await router.aroute_batch(queries)
+        # List requests share one set of generation parameters, so prompts
+        # are grouped by token budget as well as tier
+        groups: Dict[Tuple[ModelSize, Optional[int]], List[int]] = {}
+        for i, decision in enumerate(decisions):
+            groups.setdefault((decision.model_size, decision.max_new_tokens), []).append(i)
+        priority = request_priority(request.force_model, Priority.BATCH)
+        results = await run_tier_groups(groups, queries, max_concurrency, priority)
+        
+        # Re-batch the escalations for the next tier
+        escalations: Dict[Tuple[ModelSize, Optional[int]], List[int]] = {}
+        for i, decision in enumerate(decisions):
+            if should_escalate(results[i], decision):
+                key = (next_model_size(decision.model_size), decision.max_new_tokens)
+                escalations.setdefault(key, []).append(i)
+        results.update(await run_tier_groups(escalations, queries, max_concurrency, priority))
+        escalated = {i for indices in escalations.values() for i in indices}
+        
+        response_time = time.time() - start_time
+        items = []
+        log_rows = []
+        for i, query in enumerate(queries):
+            query_row, savings_row, accounting = build_log_rows(
+                query, decisions[i], results[i], i in escalated, response_time
+            )
+            log_rows.append((query_row, savings_row))
+            items.append(BatchItemResponse(
+                query=query,
+                response=results[i]["text"],
+                model_used=results[i]["model"],
+                model_size=results[i]["model_size"],
+                tokens=results[i]["tokens"],
+                prompt_tokens=accounting["prompt_tokens"],
+                cost=accounting["cost"],
+                savings=accounting["savings"],
+                confidence=decisions[i].confidence,
+                routing_reason=decisions[i].reason,
+                was_escalated=i in escalated,
+                cached=accounting["cached"]
+            ))
+        await log_writer.submit_many(log_rows)
+        
+        return BatchQueryResponse(
+            results=items,
+            total_cost=sum(item.cost for item in items),
+            total_savings=sum(item.savings for item in items),
+            response_time=response_time
+        )
+    
+    except ValueError as e:
+        metrics.errors.inc("batch")
+        raise HTTPException(status_code=400, detail=str(e))
+    except AdmissionRejected as e:
+        metrics.errors.inc("batch")
+        raise admission_error(e)
+    except HTTPException:
+        raise
     except Exception as e:
+        metrics.errors.inc("batch")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        metrics.in_flight.dec("batch")
+        metrics.request_seconds.observe(time.time() - start_time, "batch")
+
+def sse_event(event: str, data: Dict) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.post("/query/stream")
+async def stream_query(request: QueryRequest):
+    """Process a query through the cascade router, streaming tokens over SSE.
+    
+    Events: "route" with the routing decision, "token" for each generated
+    token, "escalate" when a larger model takes over (discard the tokens
+    streamed so far), then "done" with cost, savings and escalation info.
+    """
+    start_time = time.time()
+    try:
+        routing_decision = await route_query(
+            request.query, request.force_model, request.latency_budget
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    async def events() -> AsyncIterator[str]:
+        metrics.in_flight.inc("stream")
+        try:
+            yield sse_event("route", {
+                "model_size": routing_decision.model_size.value,
+                "confidence": routing_decision.confidence,
+                "routing_reason": routing_decision.reason
+            })
+            
+            model_size = routing_decision.model_size
+            priority = request_priority(request.force_model)
+            result = None
+            monitor = router.escalation_monitor(routing_decision.confidence)
+            early_abort = settings.EARLY_ABORT_ENABLED and model_size != ModelSize.LARGE
+            if early_abort and monitor.certain:
+                # The answer would be escalated whatever it says; skip this tier
+                metrics.early_aborts.inc(model_size.value, monitor.reason)
+            else:
+                stream = stream_with_cache(model_size, request.query, priority,
+                                           routing_decision.max_new_tokens)
+                try:
+                    async for event in stream:
+                        if "token" in event:
+                            yield sse_event("token", {"text": event["token"]})
+                            if early_abort and monitor.feed(event["token"]):
+                                metrics.early_aborts.inc(model_size.value, monitor.reason)
+                                break
+                        else:
+                            result = event["result"]
+                finally:
+                    await stream.aclose()
+            
+            was_escalated = False
+            if result is None or should_escalate(result, routing_decision):
+                new_size = next_model_size(model_size)
+                yield sse_event("escalate", {
+                    "from": result["model_size"] if result is not None else model_size.value,
+                    "to": new_size.value
+                })
+                async for event in stream_with_cache(new_size, request.query, priority,
+                                                     routing_decision.max_new_tokens):
+                    if "token" in event:
+                        yield sse_event("token", {"text": event["token"]})
+                    else:
+                        result = event["result"]
+                was_escalated = True
+            
+            response_time = time.time() - start_time
+            accounting = await record_query(
+                request.query, routing_decision, result, was_escalated, response_time
+            )
+            
+            yield sse_event("done", {
+                "model_used": result["model"],
+                "model_size": result["model_size"],
+                "tokens": result["tokens"],
+                "prompt_tokens": accounting["prompt_tokens"],
+                "cost": accounting["cost"],
+                "savings": accounting["savings"],
+                "response_time": response_time,
+                "confidence": routing_decision.confidence,
+                "routing_reason": routing_decision.reason,
+                "cached": accounting["cached"],
+                "was_escalated": was_escalated
+            })
+        except AdmissionRejected as e:
+            metrics.errors.inc("stream")
+            yield sse_event("error", {
+                "detail": str(e), "status": e.status_code, "retry_after": e.retry_after
+            })
+        except Exception as e:
+            metrics.errors.inc("stream")
+            yield sse_event("error", {"detail": str(e)})
+        finally:
+            metrics.in_flight.dec("stream")
+            metrics.request_seconds.observe(time.time() - start_time, "stream")
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.get("/stats", response_model=StatsResponse)
 async def get_statistics(db=Depends(get_db)):
@@ -180,8 +807,76 @@ async def get_statistics(db=Depends(get_db)):
     
     return StatsResponse(**stats)
 
+@app.get("/stats/timeseries")
+async def get_statistics_timeseries(
+    bucket: str = "hour",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    model_size: Optional[str] = None,
+    db=Depends(get_db)
+):
+    """Get per-minute, per-hour or per-day totals for a time window"""
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(days=1)
+    try:
+        points = get_timeseries(db, start, end, bucket, model_size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"bucket": bucket, "start": start, "end": end, "points": points}
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+def ndjson_chunks(batches) -> Iterator[str]:
+    for batch in batches:
+        yield "".join(json.dumps(row, default=_json_value) + "\n" for row in batch)
+
+def csv_chunks(batches) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for batch in batches:
+        for row in batch:
+            writer.writerow([
+                value.isoformat() if isinstance(value, datetime) else value
+                for value in (row[name] for name in EXPORT_COLUMNS)
+            ])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+@app.get("/logs/export")
+async def export_logs(
+    format: str = "ndjson",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    model_size: Optional[str] = None,
+    escalated: Optional[bool] = None
+):
+    """Stream raw query logs with their savings as NDJSON or CSV.
+    
+    Only live rows are exported; days moved out by the log archiver are
+    in its gzipped NDJSON files.
+    """
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail=f"Unknown format: {format}")
+    if model_size is not None and model_size not in {size.value for size in ModelSize}:
+        raise HTTPException(status_code=400, detail=f"Unknown model size: {model_size}")
+    
+    batches = iter_log_batches(start, end, model_size, escalated, settings.LOG_EXPORT_FETCH_SIZE)
+    # Sync generators are iterated in the threadpool, keeping the event loop free
+    if format == "csv":
+        body, media_type = csv_chunks(batches), "text/csv"
+    else:
+        body, media_type = ndjson_chunks(batches), "application/x-ndjson"
+    return StreamingResponse(body, media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="query_logs.{format}"'
+    })
+
 @app.post("/demo")
-async def run_demo(db=Depends(get_db)):
+async def run_demo():
     """Run a demo with predefined queries"""
     demo_queries = [
         "What is 2+2?",
@@ -193,7 +888,7 @@ async def run_demo(db=Depends(get_db)):
     
     results = []
     for query in demo_queries:
-        response = await process_query(QueryRequest(query=query), db)
+        response = await process_query(QueryRequest(query=query))
         results.append({
             "query": query,
             "model": response.model_used,
@@ -206,4 +901,5 @@ async def run_demo(db=Depends(get_db)):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=settings.PORT)
\ No newline at end of file
+    uvicorn.run("main:create_app", factory=True, host="0.0.0.0", port=settings.PORT,
+                workers=settings.WEB_CONCURRENCY)
\ No newline at end of file
@@ -0,0 +1,73 @@
+from collections import deque
+from typing import Dict, List, Set, Tuple
+
+class KeywordMatcher:
+    """Aho-Corasick automaton that finds every keyword of every group in one pass.
+
+    Matching is substring-based (like ``keyword in text``) and reports
+    overlapping hits, so "javascript" matches both "java" and "javascript".
+    Scan time depends on the text length, not on the number of keywords.
+    """
+
+    def __init__(self, groups: Dict[str, List[str]]):
+        # Trie stored as parallel lists indexed by state id
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[Tuple[str, str]]] = [[]]
+        self.max_length = 0
+
+        for group, keywords in groups.items():
+            for keyword in keywords:
+                self._add(group, keyword.lower())
+        self._build()
+
+    def _add(self, group: str, keyword: str):
+        """Insert a keyword into the trie"""
+        state = 0
+        for char in keyword:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = next_state
+        self.output[state].append((group, keyword))
+        self.max_length = max(self.max_length, len(keyword))
+
+    def _build(self):
+        """Compute failure links breadth-first and merge outputs"""
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.output[next_state] = (self.output[next_state] +
+                                           self.output[self.fail[next_state]])
+
+    def scan(self, text: str) -> Dict[str, Set[str]]:
+        """Return the distinct keywords found in ``text`` for each group"""
+        return self.advance(0, text)[1]
+
+    def advance(self, state: int, text: str) -> Tuple[int, Dict[str, Set[str]]]:
+        """Continue a scan from ``state`` over the next chunk of text.
+
+        Returns the new state and the keywords completed within this chunk,
+        including ones that started in an earlier chunk. Feeding a text in
+        pieces finds the same keywords as scanning it whole.
+        """
+        goto, fail, output = self.goto, self.fail, self.output
+        hits: Dict[str, Set[str]] = {}
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for group, keyword in output[state]:
+                hits.setdefault(group, set()).add(keyword)
+        return state, hits
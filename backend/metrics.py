@@ -0,0 +1,265 @@
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from models import ModelSize
+
+Labels = Tuple[str, ...]
+
+# Bucket upper bounds in seconds
+FAST_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                0.001, 0.0025, 0.005, 0.01, 0.05)
+UPSTREAM_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+DB_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+REQUEST_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """Base class for a named metric with a fixed set of label names.
+
+    Values live in plain dicts keyed by label-value tuples. All recording
+    happens on the event loop thread, so no locks are needed. A metric
+    built with ``collect`` is not recorded into at all. Its values are
+    read from that callable at scrape time, which suits numbers other
+    components already keep (cache hits, queue depth, and so on).
+    """
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 collect: Optional[Callable[[], Dict[Labels, float]]] = None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+        self.values: Dict[Labels, float] = {}
+
+    def samples(self) -> Dict[Labels, float]:
+        return self.collect() if self.collect is not None else self.values
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in sorted(self.samples().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, *labels: str, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+    def set(self, value: float, *labels: str):
+        self.values[labels] = value
+
+class _HistogramSeries:
+    __slots__ = ("counts", "sum")
+
+    def __init__(self, buckets: int):
+        # One slot per bucket plus one for values above the last bound
+        self.counts = [0] * (buckets + 1)
+        self.sum = 0.0
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = REQUEST_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.series: Dict[Labels, _HistogramSeries] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = _HistogramSeries(len(self.buckets))
+        # Buckets are "less than or equal", which bisect_left gives directly
+        series.counts[bisect_left(self.buckets, value)] += 1
+        series.sum += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        names = self.labelnames + ("le",)
+        for labels, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series.counts):
+                cumulative += count
+                bucket_labels = _format_labels(names, labels + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(series.sum)}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """An ordered set of metrics rendered together in the Prometheus text format"""
+
+    content_type = "text/plain; version=0.0.4"
+
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+class CascadeMetrics(MetricsRegistry):
+    """The metrics exported on /metrics.
+
+    Latency histograms cover each stage of a query: routing, every
+    upstream model call (by tier and outcome), the escalation decision and
+    the database write. Counters cover escalations, fallbacks, served
+    queries, and tokens and cost per tier. Gauges report requests in flight.
+    Components that already count something get a ``collect`` callback
+    through ``bind`` instead of being recorded into twice.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.started_at = time.time()
+        self.request_seconds = self.register(Histogram(
+            "cascade_request_seconds", "End-to-end request latency by endpoint",
+            ("endpoint",), REQUEST_BUCKETS
+        ))
+        self.routing_seconds = self.register(Histogram(
+            "cascade_routing_seconds", "Time spent choosing the starting tier", (), FAST_BUCKETS
+        ))
+        self.upstream_seconds = self.register(Histogram(
+            "cascade_upstream_seconds", "Upstream model call latency by tier and outcome",
+            ("tier", "outcome"), UPSTREAM_BUCKETS
+        ))
+        self.escalation_check_seconds = self.register(Histogram(
+            "cascade_escalation_check_seconds", "Time spent deciding whether to escalate",
+            (), FAST_BUCKETS
+        ))
+        self.db_write_seconds = self.register(Histogram(
+            "cascade_db_write_seconds", "Time to write one batch of log rows", (), DB_BUCKETS
+        ))
+        self.db_write_rows = self.register(Counter(
+            "cascade_db_write_rows_total", "Log rows written, by outcome", ("outcome",)
+        ))
+        self.queries = self.register(Counter(
+            "cascade_queries_total", "Queries served, by the tier that answered", ("tier",)
+        ))
+        self.escalations = self.register(Counter(
+            "cascade_escalations_total", "Queries escalated to a larger tier",
+            ("from_tier", "to_tier")
+        ))
+        self.fallbacks = self.register(Counter(
+            "cascade_fallbacks_total", "Upstream failures that fell back to a larger tier",
+            ("from_tier", "to_tier")
+        ))
+        self.early_aborts = self.register(Counter(
+            "cascade_early_aborts_total",
+            "Lower-tier generations skipped or cancelled because escalation was certain",
+            ("tier", "reason")
+        ))
+        self.upstream_cancelled = self.register(Counter(
+            "cascade_upstream_cancelled_total", "Upstream calls abandoned before finishing",
+            ("tier",)
+        ))
+        self.tokens = self.register(Counter(
+            "cascade_tokens_total", "Tokens generated upstream, by tier", ("tier",)
+        ))
+        self.prompt_tokens = self.register(Counter(
+            "cascade_prompt_tokens_total", "Prompt tokens sent upstream (charged with the completion), by tier",
+            ("tier",)
+        ))
+        self.cost = self.register(Counter(
+            "cascade_cost_dollars_total", "Upstream spend, by tier", ("tier",)
+        ))
+        self.admission_wait_seconds = self.register(Histogram(
+            "cascade_admission_wait_seconds", "Time queued for an upstream slot, by tier and priority",
+            ("tier", "priority"), (0.0, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+        ))
+        self.admission_rejected = self.register(Counter(
+            "cascade_admission_rejected_total", "Upstream calls refused by admission control",
+            ("tier", "priority", "reason")
+        ))
+        self.errors = self.register(Counter(
+            "cascade_request_errors_total", "Requests that failed, by endpoint", ("endpoint",)
+        ))
+        self.in_flight = self.register(Gauge(
+            "cascade_requests_in_flight", "Requests currently being processed, by endpoint",
+            ("endpoint",)
+        ))
+        for endpoint in ("query", "stream", "batch"):
+            self.in_flight.set(0, endpoint)
+
+    def bind(self, model_client, router, response_cache, single_flight, log_writer,
+             admission=None):
+        """Export counts other components already keep, read at scrape time"""
+        def cache_counts(field: str):
+            def collect():
+                values = {("routing",): router.decision_cache.stats()[field]}
+                if response_cache is not None:
+                    values[("response",)] = getattr(response_cache, field)
+                    if field == "hits" and response_cache.near_duplicates is not None:
+                        values[("near_duplicate",)] = response_cache.near_hits
+                if field == "hits":
+                    values[("coalesced",)] = single_flight.coalesced
+                return values
+            return collect
+
+        self.register(Counter(
+            "cascade_cache_hits_total", "Cache hits by cache", ("cache",),
+            collect=cache_counts("hits")
+        ))
+        self.register(Counter(
+            "cascade_cache_misses_total", "Cache misses by cache", ("cache",),
+            collect=cache_counts("misses")
+        ))
+        self.register(Gauge(
+            "cascade_upstream_in_flight", "Upstream calls in flight, by tier", ("tier",),
+            collect=lambda: {(size.value,): count for size, count in model_client.in_flight.items()}
+        ))
+        if admission is not None:
+            self.register(Gauge(
+                "cascade_admission_queue_depth", "Upstream calls waiting for admission",
+                ("tier", "priority"),
+                collect=lambda: {
+                    (size.value, priority.name.lower()): count
+                    for size, tier in admission.tiers.items()
+                    for priority, count in tier.queued().items()
+                }
+            ))
+            self.register(Gauge(
+                "cascade_admission_active", "Upstream calls holding an admission slot", ("tier",),
+                collect=lambda: {(size.value,): tier.active for size, tier in admission.tiers.items()}
+            ))
+        self.register(Gauge(
+            "cascade_log_queue_depth", "Log rows waiting to be written",
+            collect=lambda: {(): log_writer.stats()["queued"]}
+        ))
+        self.register(Gauge(
+            "cascade_start_time_seconds", "Unix time the process started",
+            collect=lambda: {(): self.started_at}
+        ))
+
+    def observe_upstream(self, model_size: ModelSize, outcome: str, latency: float):
+        self.upstream_seconds.observe(latency, model_size.value, outcome)
@@ -0,0 +1,211 @@
+"""Local stand-in for the Hugging Face inference API, used by benchmark.py.
+
+Point the backend at it with HF_API_BASE_URL=http://127.0.0.1:<port>/models.
+Every tier in MODEL_CONFIGS is served at /models/<model id>. Each tier
+has its own latency distribution, error rate, rate of unhelpful answers
+(which make the cascade escalate) and cold-start window, during which it
+answers 503 with an ``estimated_time`` just like the real API.
+
+    python mock_hf_server.py --port 8081 --error-rate 0.01 --loading-seconds 5
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from dataclasses import asdict, dataclass, fields
+from typing import Any, Dict, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from models import ModelSize, MODEL_CONFIGS
+
+ANSWER = ("Here is a detailed answer that walks through the question step by step, "
+          "covers the relevant background and ends with a short summary of the key points.")
+FAILED_ANSWER = "I cannot help with that."
+
+@dataclass
+class TierProfile:
+    """How one mocked model behaves"""
+    latency_median: float = 0.1  # Seconds; latencies are log-normal around this
+    latency_sigma: float = 0.3
+    error_rate: float = 0.0  # Fraction of requests answered with a 500
+    failure_rate: float = 0.0  # Fraction of answers that trigger escalation
+    loading_seconds: float = 0.0  # Cold-start window after startup or reset
+    answer_words: int = 40
+
+DEFAULT_PROFILES = {
+    ModelSize.TINY: TierProfile(latency_median=0.05, failure_rate=0.1),
+    ModelSize.MEDIUM: TierProfile(latency_median=0.15, failure_rate=0.05),
+    ModelSize.LARGE: TierProfile(latency_median=0.4)
+}
+
+class MockInference:
+    """State shared by the mock endpoints: profiles, cold-start clocks and counters"""
+
+    def __init__(self, profiles: Dict[ModelSize, TierProfile], seed: int = 0):
+        self.profiles = profiles
+        self.random = random.Random(seed)
+        self.by_id = {config["id"]: size for size, config in MODEL_CONFIGS.items()}
+        self.reset()
+
+    def reset(self):
+        self.started_at = time.monotonic()
+        self.counts: Dict[ModelSize, Dict[str, int]] = {
+            size: {"requests": 0, "prompts": 0, "errors": 0, "loading": 0, "streams": 0}
+            for size in ModelSize
+        }
+        self.latencies: Dict[ModelSize, List[float]] = {size: [] for size in ModelSize}
+
+    def loading_remaining(self, size: ModelSize) -> float:
+        return max(0.0, self.profiles[size].loading_seconds - (time.monotonic() - self.started_at))
+
+    def latency(self, size: ModelSize, prompts: int = 1) -> float:
+        profile = self.profiles[size]
+        sample = self.random.lognormvariate(math.log(profile.latency_median), profile.latency_sigma)
+        # Batched inputs share one forward pass but still cost some extra time
+        return sample * (1 + 0.1 * (prompts - 1))
+
+    def answer(self, size: ModelSize) -> str:
+        profile = self.profiles[size]
+        if self.random.random() < profile.failure_rate:
+            return FAILED_ANSWER
+        words = ANSWER.split()
+        return " ".join(words[i % len(words)] for i in range(profile.answer_words))
+
+    def stats(self) -> Dict[str, Any]:
+        result = {}
+        for size in ModelSize:
+            latencies = sorted(self.latencies[size])
+            result[size.value] = {
+                **self.counts[size],
+                "latency": summarize(latencies),
+                "profile": asdict(self.profiles[size])
+            }
+        return result
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, math.ceil(q / 100 * len(sorted_values)) - 1)
+    return sorted_values[rank]
+
+def summarize(sorted_values: List[float]) -> Dict[str, float]:
+    """Count, mean and tail percentiles (seconds) of a sorted latency sample"""
+    if not sorted_values:
+        return {"count": 0}
+    return {
+        "count": len(sorted_values),
+        "mean": round(sum(sorted_values) / len(sorted_values), 6),
+        "p50": round(percentile(sorted_values, 50), 6),
+        "p95": round(percentile(sorted_values, 95), 6),
+        "p99": round(percentile(sorted_values, 99), 6),
+        "max": round(sorted_values[-1], 6)
+    }
+
+def create_mock_app(profiles: Dict[ModelSize, TierProfile] = None, seed: int = 0) -> FastAPI:
+    mock = MockInference(profiles or DEFAULT_PROFILES, seed)
+    app = FastAPI(title="Mock HF Inference API")
+    app.state.mock = mock
+
+    @app.post("/models/{model_id:path}")
+    async def generate(model_id: str, request: Request):
+        size = mock.by_id.get(model_id)
+        if size is None:
+            return JSONResponse({"error": f"Model {model_id} does not exist"}, status_code=404)
+        body = await request.json()
+        inputs = body.get("inputs")
+        prompts = len(inputs) if isinstance(inputs, list) else 1
+        counts = mock.counts[size]
+        counts["requests"] += 1
+        counts["prompts"] += prompts
+
+        remaining = mock.loading_remaining(size)
+        if remaining > 0:
+            if not (body.get("options") or {}).get("wait_for_model"):
+                counts["loading"] += 1
+                return JSONResponse(
+                    {"error": f"Model {model_id} is currently loading",
+                     "estimated_time": round(remaining, 1)},
+                    status_code=503
+                )
+            await asyncio.sleep(remaining)
+
+        latency = mock.latency(size, prompts)
+        mock.latencies[size].append(latency)
+        if mock.random.random() < mock.profiles[size].error_rate:
+            await asyncio.sleep(latency)
+            counts["errors"] += 1
+            return JSONResponse({"error": "Internal server error"}, status_code=500)
+
+        if body.get("stream"):
+            counts["streams"] += 1
+            words = mock.answer(size).split()
+
+            async def events():
+                for word in words:
+                    await asyncio.sleep(latency / len(words))
+                    token = {"text": word + " ", "special": False}
+                    yield f"data:{json.dumps({'token': token})}\n\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        await asyncio.sleep(latency)
+        if isinstance(inputs, list):
+            return [[{"generated_text": mock.answer(size)}] for _ in inputs]
+        return [{"generated_text": mock.answer(size)}]
+
+    @app.get("/_stats")
+    async def stats():
+        return mock.stats()
+
+    @app.post("/_reset")
+    async def reset():
+        mock.reset()
+        return {"status": "reset"}
+
+    return app
+
+def build_profiles(args: argparse.Namespace) -> Dict[ModelSize, TierProfile]:
+    """Apply command-line overrides on top of DEFAULT_PROFILES"""
+    overrides = json.loads(args.profiles) if args.profiles else {}
+    profiles = {}
+    for size, default in DEFAULT_PROFILES.items():
+        profile = TierProfile(**asdict(default))
+        profile.latency_median *= args.latency_scale
+        if args.error_rate is not None:
+            profile.error_rate = args.error_rate
+        if args.loading_seconds is not None:
+            profile.loading_seconds = args.loading_seconds
+        names = {field.name for field in fields(TierProfile)}
+        for name, value in overrides.get(size.value, {}).items():
+            if name not in names:
+                raise ValueError(f"Unknown profile field: {name}")
+            setattr(profile, name, value)
+        profiles[size] = profile
+    return profiles
+
+def add_profile_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency-scale", type=float, default=1.0,
+                        help="Multiply every tier's median latency")
+    parser.add_argument("--error-rate", type=float, default=None,
+                        help="Fraction of upstream requests answered with a 500")
+    parser.add_argument("--loading-seconds", type=float, default=None,
+                        help="Answer 503 loading for this long after startup")
+    parser.add_argument("--profiles", default=None,
+                        help='Per-tier JSON overrides, e.g. \'{"tiny": {"failure_rate": 0.3}}\'')
+    parser.add_argument("--seed", type=int, default=0)
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_mock_app(build_profiles(args), args.seed),
+                host=args.host, port=args.port, log_level="warning")
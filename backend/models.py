@@ -1,5 +1,9 @@
 from enum import Enum
-from typing import Dict, Any, Union
+from typing import Dict, Any, AsyncIterator, List, Optional, Union
+import asyncio
+import contextlib
+import json
+import time
 import httpx
 from config import settings
 
@@ -15,7 +19,14 @@ MODEL_CONFIGS = {
         "params": "2.7B",
         "cost_per_token": 0.0000001,  # $0.0001 per 1K tokens
         "max_tokens": 2048,
-        "timeout": 10
+        "timeout": 10,
+        "max_connections": 20,
+        "max_keepalive": 10,
+        "batch_size": 8,
+        "rate_limit": 20.0,  # Requests per second admitted upstream
+        "burst": 40,
+        "max_concurrency": 20,
+        "max_queue": 200
     },
     ModelSize.MEDIUM: {
         "id": "mistralai/Mistral-7B-Instruct-v0.2",
@@ -23,7 +34,14 @@ MODEL_CONFIGS = {
         "params": "7B",
         "cost_per_token": 0.0000005,  # $0.0005 per 1K tokens
         "max_tokens": 4096,
-        "timeout": 15
+        "timeout": 15,
+        "max_connections": 10,
+        "max_keepalive": 5,
+        "batch_size": 4,
+        "rate_limit": 10.0,
+        "burst": 20,
+        "max_concurrency": 10,
+        "max_queue": 100
     },
     ModelSize.LARGE: {
         "id": "meta-llama/Meta-Llama-3-8B-Instruct",
@@ -31,81 +49,492 @@ MODEL_CONFIGS = {
         "params": "8B",
         "cost_per_token": 0.000001,  # $0.001 per 1K tokens
         "max_tokens": 8192,
-        "timeout": 20
+        "timeout": 20,
+        "max_connections": 5,
+        "max_keepalive": 5,
+        "batch_size": 4,
+        "rate_limit": 5.0,
+        "burst": 10,
+        "max_concurrency": 5,
+        "max_queue": 50
     }
 }
 
+def estimate_tokens(text: str) -> int:
+    """Rough token count for when the model's tokenizer isn't available"""
+    return int(len(text.split()) * 1.3)
+
+def is_model_failure(error: httpx.HTTPError) -> bool:
+    """Whether an error says the model is unhealthy (rather than the request being bad)"""
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status >= 500 or status == 429
+    return True
+
+def fallback_sizes(model_size: ModelSize):
+    """The requested tier followed by every larger tier"""
+    sizes = list(ModelSize)
+    return sizes[sizes.index(model_size):]
+
+def parse_loading(response: httpx.Response) -> Optional[float]:
+    """Return the estimated load time if a 503 says the model is still loading"""
+    if response.status_code != 503:
+        return None
+    try:
+        body = response.json()
+    except ValueError:
+        return None
+    if not isinstance(body, dict):
+        return None
+    if "estimated_time" in body:
+        return float(body["estimated_time"])
+    if "loading" in str(body.get("error", "")).lower():
+        return 0.0
+    return None
+
+def pool_connections(client: Optional[httpx.AsyncClient]) -> Optional[List[Any]]:
+    """The connections in a client's pool, or None if httpx's internals have changed"""
+    if client is None:
+        return []
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    try:
+        connections = list(pool.connections)
+        for conn in connections:
+            if not callable(conn.is_idle):
+                return None
+    except (AttributeError, TypeError):
+        return None
+    return connections
+
+class CircuitOpen(Exception):
+    """A tier's circuit breaker refused the call"""
+    def __init__(self, model_size: ModelSize):
+        super().__init__("circuit breaker open")
+        self.model_size = model_size
+
 class ModelClient:
-    def __init__(self):
+    def __init__(self, health=None, readiness=None, metrics=None, admission=None,
+                 token_counter=None):
+        # Optional HealthTracker fed with the outcome of every upstream call
+        self.health = health
+        # Optional ModelReadiness tracking cold starts (503 + estimated_time)
+        self.readiness = readiness
+        # Optional CascadeMetrics recording upstream latency and fallbacks
+        self.metrics = metrics
+        # Optional AdmissionController rate limiting and queueing upstream calls
+        self.admission = admission
+        # Optional TokenCounter giving exact counts from each model's tokenizer
+        self.token_counter = token_counter
         self.api_key = settings.HUGGINGFACE_API_KEY
-        self.base_url = "https://api-inference.huggingface.co/models"
+        self.base_url = settings.HF_API_BASE_URL.rstrip("/")
         
-    async def query_model(self, model_size: ModelSize, prompt: str) -> Dict[str, Any]:
-        """Query a specific model via Hugging Face Inference API"""
+        # One long-lived pooled client per tier so each ModelSize gets its
+        # own connection limit and keep-alive connections are reused
+        self.clients: Dict[ModelSize, httpx.AsyncClient] = {}
+        self.in_flight: Dict[ModelSize, int] = {size: 0 for size in ModelSize}
+    
+    def _create_client(self, model_size: ModelSize) -> httpx.AsyncClient:
+        """Create a pooled HTTP client for a single model tier"""
         config = MODEL_CONFIGS[model_size]
+        limits = httpx.Limits(
+            max_connections=config["max_connections"],
+            max_keepalive_connections=config["max_keepalive"],
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY
+        )
+        return httpx.AsyncClient(
+            limits=limits,
+            http2=settings.HTTP2_ENABLED,
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json"
+            }
+        )
+    
+    async def start(self):
+        """Open the pooled clients (called on app startup)"""
+        for model_size in ModelSize:
+            if model_size not in self.clients:
+                self.clients[model_size] = self._create_client(model_size)
+    
+    async def close(self):
+        """Close the pooled clients (called on app shutdown)"""
+        for client in self.clients.values():
+            await client.aclose()
+        self.clients.clear()
+    
+    def get_client(self, model_size: ModelSize) -> httpx.AsyncClient:
+        """Return the pooled client for a tier, creating it lazily if needed"""
+        client = self.clients.get(model_size)
+        if client is None or client.is_closed:
+            client = self._create_client(model_size)
+            self.clients[model_size] = client
+        return client
+    
+    def pool_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Connection pool usage per tier (in use, idle, waiting).
         
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "inputs": prompt,
-            "parameters": {
-                "max_new_tokens": min(256, config["max_tokens"]),
-                "temperature": 0.7,
-                "return_full_text": False
+        httpx has no public pool API, so its internals are read where they
+        exist. Otherwise the counts are derived from calls in flight, and
+        idle connections are reported as unknown.
+        """
+        stats = {}
+        for model_size in ModelSize:
+            config = MODEL_CONFIGS[model_size]
+            in_flight = self.in_flight[model_size]
+            connections = pool_connections(self.clients.get(model_size))
+            if connections is not None:
+                idle = sum(1 for conn in connections if conn.is_idle())
+                in_use = len(connections) - idle
+            else:
+                idle = None
+                in_use = min(in_flight, config["max_connections"])
+            stats[model_size.value] = {
+                "max_connections": config["max_connections"],
+                "in_use": in_use,
+                "idle": idle,
+                "waiting": max(0, in_flight - in_use),
+                "http2": settings.HTTP2_ENABLED
             }
-        }
+        return stats
+        
+    @contextlib.asynccontextmanager
+    async def _admit(self, model_size: ModelSize, priority=None, probe: bool = True):
+        """Admission slot for one upstream call, then the circuit breaker's go-ahead.
+        
+        The breaker is asked only once the slot is held: on a half-open
+        tier that claims the single probe, which a request rejected by
+        admission or cancelled while queued would otherwise never release.
+        An open breaker is checked (without claiming) before queuing, and
+        raises CircuitOpen either way. Pings pass ``probe=False``.
+        """
+        if probe and not self._available(model_size):
+            raise CircuitOpen(model_size)
+        slot = (contextlib.nullcontext() if self.admission is None
+                else self.admission.slot(model_size, priority))
+        async with slot:
+            if probe and not self._allow(model_size):
+                raise CircuitOpen(model_size)
+            yield
+    
+    async def _post(self, model_size: ModelSize, payload: Dict[str, Any],
+                    priority=None, probe: bool = True) -> httpx.Response:
+        """Send a request to a model through its tier's pooled client.
         
-        async with httpx.AsyncClient() as client:
+        The outcome is reported to the health tracker; a non-2xx status
+        raises httpx.HTTPStatusError. If admission control can't fit the
+        call within its priority's wait budget, AdmissionRejected is raised;
+        if the tier's circuit breaker is open, CircuitOpen.
+        """
+        config = MODEL_CONFIGS[model_size]
+        client = self.get_client(model_size)
+        payload, timeout = self._prepare(model_size, payload)
+        async with self._admit(model_size, priority, probe):
+            self.in_flight[model_size] += 1
+            start = time.perf_counter()
             try:
                 response = await client.post(
                     f"{self.base_url}/{config['id']}",
                     json=payload,
-                    headers=headers,
-                    timeout=config["timeout"]
+                    timeout=timeout
                 )
                 response.raise_for_status()
-                
-                result = response.json()
-                
-                # Handle different response formats
-                if isinstance(result, list) and len(result) > 0:
-                    text = result[0].get("generated_text", "")
-                elif isinstance(result, dict):
-                    text = result.get("generated_text", "")
-                else:
-                    text = ""
-                
-                # Calculate tokens (rough estimate)
-                tokens = len(text.split()) * 1.3
-                cost = tokens * config["cost_per_token"]
-                
-                return {
-                    "text": text,
-                    "model": config["name"],
-                    "tokens": int(tokens),
-                    "cost": cost,
-                    "model_size": model_size.value
-                }
-                
+            except httpx.HTTPError as e:
+                self._record_error(model_size, e, time.perf_counter() - start)
+                raise
+            except asyncio.CancelledError:
+                self._record_abandoned(model_size)
+                raise
+            finally:
+                self.in_flight[model_size] -= 1
+        self._record_success(model_size, time.perf_counter() - start)
+        return response
+    
+    def _prepare(self, model_size: ModelSize, payload: Dict[str, Any]):
+        """Ask the API to wait for a model that is still loading, extending the timeout to match"""
+        timeout = MODEL_CONFIGS[model_size]["timeout"]
+        if (self.readiness is not None and self.readiness.is_loading(model_size)
+                and "options" not in payload):
+            payload = {**payload, "options": {"wait_for_model": True}}
+            timeout += self.readiness.expected_wait(model_size)
+        return payload, timeout
+    
+    def _available(self, model_size: ModelSize) -> bool:
+        return self.health is None or self.health.is_available(model_size)
+    
+    def _allow(self, model_size: ModelSize) -> bool:
+        return self.health is None or self.health.allow_request(model_size)
+    
+    def _record_success(self, model_size: ModelSize, latency: float):
+        if self.health is not None:
+            self.health.record_success(model_size, latency)
+        if self.readiness is not None:
+            self.readiness.record_ready(model_size)
+        if self.metrics is not None:
+            self.metrics.observe_upstream(model_size, "success", latency)
+    
+    def _record_error(self, model_size: ModelSize, error: httpx.HTTPError, latency: float):
+        loading = None
+        if isinstance(error, httpx.HTTPStatusError):
+            loading = parse_loading(error.response)
+        if loading is not None:
+            # A cold start isn't a health failure
+            if self.readiness is not None:
+                self.readiness.record_loading(model_size, loading)
+            self._record_cancelled(model_size)
+            outcome = "loading"
+        elif is_model_failure(error):
+            if self.health is not None:
+                self.health.record_failure(model_size, latency)
+            outcome = "error"
+        else:
+            self._record_cancelled(model_size)
+            outcome = "rejected"
+        if self.metrics is not None:
+            self.metrics.observe_upstream(model_size, outcome, latency)
+    
+    def _record_cancelled(self, model_size: ModelSize):
+        if self.health is not None:
+            self.health.record_cancelled(model_size)
+    
+    def _record_abandoned(self, model_size: ModelSize):
+        """The caller gave up on the call (cancelled task or closed stream)"""
+        self._record_cancelled(model_size)
+        if self.metrics is not None:
+            self.metrics.upstream_cancelled.inc(model_size.value)
+    
+    def _record_fallback(self, from_size: ModelSize, to_size: ModelSize):
+        print(f"Falling back to {to_size.name} model...")
+        if self.metrics is not None:
+            self.metrics.fallbacks.inc(from_size.value, to_size.value)
+    
+    async def ping(self, model_size: ModelSize, priority=None) -> httpx.Response:
+        """Request a single token to keep a model loaded and learn its readiness"""
+        payload = {
+            "inputs": "ping",
+            "parameters": {"max_new_tokens": 1, "return_full_text": False},
+            "options": {"wait_for_model": False}
+        }
+        return await self._post(model_size, payload, priority, probe=False)
+    
+    def generation_parameters(self, model_size: ModelSize,
+                              max_new_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """Generation parameters sent with a request to a tier.
+        
+        ``max_new_tokens`` is the budget the router chose for the query;
+        without one a tier generates up to 256 tokens.
+        """
+        config = MODEL_CONFIGS[model_size]
+        return {
+            "max_new_tokens": min(max_new_tokens or 256, config["max_tokens"]),
+            "temperature": 0.7,
+            "return_full_text": False
+        }
+    
+    async def build_results(self, model_size: ModelSize, prompts: List[str],
+                            texts: List[str]) -> List[Dict[str, Any]]:
+        """Package generated texts with their token and cost accounting.
+        
+        ``tokens`` counts the completion; prompt tokens are reported
+        separately and both are charged.
+        """
+        config = MODEL_CONFIGS[model_size]
+        if self.token_counter is not None:
+            usage = await self.token_counter.count_usage(model_size, prompts, texts)
+        else:
+            usage = [(estimate_tokens(prompt), estimate_tokens(text))
+                     for prompt, text in zip(prompts, texts)]
+        
+        return [{
+            "text": text,
+            "model": config["name"],
+            "tokens": completion_tokens,
+            "prompt_tokens": prompt_tokens,
+            "cost": (prompt_tokens + completion_tokens) * config["cost_per_token"],
+            "model_size": model_size.value
+        } for text, (prompt_tokens, completion_tokens) in zip(texts, usage)]
+    
+    async def build_result(self, model_size: ModelSize, prompt: str, text: str) -> Dict[str, Any]:
+        return (await self.build_results(model_size, [prompt], [text]))[0]
+    
+    async def stream_model(self, model_size: ModelSize, prompt: str, priority=None,
+                           max_new_tokens: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a generation token by token via the text-generation streaming API.
+        
+        Yields {"token": text} for each generated token and finally
+        {"result": {...}} with the same shape query_model returns.
+        """
+        config = MODEL_CONFIGS[model_size]
+        payload, timeout = self._prepare(model_size, {
+            "inputs": prompt,
+            "parameters": self.generation_parameters(model_size, max_new_tokens),
+            "stream": True
+        })
+        
+        text = ""
+        error = None
+        client = self.get_client(model_size)
+        try:
+            async with self._admit(model_size, priority):
+                self.in_flight[model_size] += 1
+                start = time.perf_counter()
+                try:
+                    async with client.stream(
+                        "POST",
+                        f"{self.base_url}/{config['id']}",
+                        json=payload,
+                        timeout=timeout
+                    ) as response:
+                        response.raise_for_status()
+                        async for line in response.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            event = json.loads(line[len("data:"):])
+                            token = event.get("token") or {}
+                            if token.get("special"):
+                                continue
+                            if token.get("text"):
+                                text += token["text"]
+                                yield {"token": token["text"]}
+                    self._record_success(model_size, time.perf_counter() - start)
+                except httpx.HTTPError as e:
+                    self._record_error(model_size, e, time.perf_counter() - start)
+                    error = e
+                except (asyncio.CancelledError, GeneratorExit):
+                    # The consumer stopped reading; closing the stream cancels the generation
+                    self._record_abandoned(model_size)
+                    raise
+                finally:
+                    self.in_flight[model_size] -= 1
+        except CircuitOpen as e:
+            error = e
+        
+        if error is None:
+            yield {"result": await self.build_result(model_size, prompt, text)}
+            return
+        
+        print(f"Error streaming {config['name']}: {error}")
+        next_size = {ModelSize.TINY: ModelSize.MEDIUM,
+                     ModelSize.MEDIUM: ModelSize.LARGE}.get(model_size)
+        # Only fall back if nothing has been sent to the caller yet
+        if text or next_size is None:
+            yield {"result": {
+                **await self.build_result(model_size, prompt, text),
+                "text": text or f"Error: All models failed. Last error: {str(error)}",
+                "error": True
+            }}
+            return
+        
+        self._record_fallback(model_size, next_size)
+        async for event in self.stream_model(next_size, prompt, priority, max_new_tokens):
+            yield event
+    
+    async def query_model(self, model_size: ModelSize, prompt: str, priority=None,
+                          max_new_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """Query a specific model via Hugging Face Inference API.
+        
+        On failure the next larger tier is tried. Tiers whose circuit
+        breaker is open are skipped without making a request.
+        """
+        error = None
+        sizes = fallback_sizes(model_size)
+        for previous, size in zip([None] + sizes, sizes):
+            config = MODEL_CONFIGS[size]
+            if error is not None:
+                self._record_fallback(previous, size)
+            payload = {
+                "inputs": prompt,
+                "parameters": self.generation_parameters(size, max_new_tokens)
+            }
+            
+            try:
+                response = await self._post(size, payload, priority)
+            except CircuitOpen:
+                print(f"Skipping {config['name']}: circuit breaker open")
+                error = error or "circuit breaker open"
+                continue
             except httpx.HTTPError as e:
                 print(f"Error querying {config['name']}: {e}")
-                # Fallback to next size up
-                if model_size == ModelSize.TINY:
-                    print("Falling back to MEDIUM model...")
-                    return await self.query_model(ModelSize.MEDIUM, prompt)
-                elif model_size == ModelSize.MEDIUM:
-                    print("Falling back to LARGE model...")
-                    return await self.query_model(ModelSize.LARGE, prompt)
-                else:
-                    # No more fallbacks available
-                    return {
-                        "text": f"Error: All models failed. Last error: {str(e)}",
-                        "model": config["name"],
-                        "tokens": 0,
-                        "cost": 0,
-                        "model_size": model_size.value,
-                        "error": True
-                    }
\ No newline at end of file
+                error = e
+                continue
+            
+            result = response.json()
+            
+            # Handle different response formats
+            if isinstance(result, list) and len(result) > 0:
+                text = result[0].get("generated_text", "")
+            elif isinstance(result, dict):
+                text = result.get("generated_text", "")
+            else:
+                text = ""
+            
+            return await self.build_result(size, prompt, text)
+        
+        # No more fallbacks available
+        last_size = sizes[-1]
+        return {
+            "text": f"Error: All models failed. Last error: {str(error)}",
+            "model": MODEL_CONFIGS[last_size]["name"],
+            "tokens": 0,
+            "prompt_tokens": 0,
+            "cost": 0,
+            "model_size": last_size.value,
+            "error": True
+        }
+    
+    async def _query_list(self, model_size: ModelSize, prompts: List[str], priority=None,
+                          max_new_tokens: Optional[int] = None) -> Optional[List[str]]:
+        """Send several prompts as one list-valued ``inputs`` request.
+        
+        Returns None if the endpoint rejects list inputs or answers in an
+        unexpected shape, so the caller can fall back to single requests.
+        """
+        config = MODEL_CONFIGS[model_size]
+        payload = {
+            "inputs": prompts,
+            "parameters": self.generation_parameters(model_size, max_new_tokens)
+        }
+        try:
+            response = await self._post(model_size, payload, priority)
+            result = response.json()
+        except CircuitOpen:
+            return None
+        except (httpx.HTTPError, ValueError) as e:
+            print(f"Batch request to {config['name']} failed, sending prompts individually: {e}")
+            return None
+        
+        if not isinstance(result, list) or len(result) != len(prompts):
+            return None
+        texts = []
+        for item in result:
+            if isinstance(item, list) and item:
+                item = item[0]
+            if not isinstance(item, dict):
+                return None
+            texts.append(item.get("generated_text", ""))
+        return texts
+    
+    async def query_batch(self, model_size: ModelSize, prompts: List[str],
+                          max_concurrency: int = 4, priority=None,
+                          max_new_tokens: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Query a tier with many prompts using micro-batches, results in input order.
+        
+        Every prompt shares one ``max_new_tokens`` budget, as list requests
+        carry a single set of generation parameters.
+        """
+        batch_size = max(1, MODEL_CONFIGS[model_size].get("batch_size", 1))
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def run_chunk(chunk: List[str]) -> List[Dict[str, Any]]:
+            async with semaphore:
+                if len(chunk) > 1:
+                    texts = await self._query_list(model_size, chunk, priority, max_new_tokens)
+                    if texts is not None:
+                        return await self.build_results(model_size, chunk, texts)
+                return list(await asyncio.gather(*(
+                    self.query_model(model_size, prompt, priority, max_new_tokens)
+                    for prompt in chunk
+                )))
+        
+        chunks = [prompts[i:i + batch_size] for i in range(0, len(prompts), batch_size)]
+        chunk_results = await asyncio.gather(*(run_chunk(chunk) for chunk in chunks))
+        return [result for chunk in chunk_results for result in chunk]
@@ -0,0 +1,225 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from cache import LRUCache, tune_sqlite
+from models import ModelSize
+
+def normalize_query(query: str) -> str:
+    """Normalize query text for exact-match caching"""
+    return " ".join(query.lower().split())
+
+def make_cache_key(query: str, model_size: ModelSize, params: Dict[str, Any]) -> str:
+    """Key a response by normalized query, tier and generation parameters"""
+    material = json.dumps(
+        [normalize_query(query), model_size.value, params],
+        sort_keys=True
+    )
+    return hashlib.sha256(material.encode()).hexdigest()
+
+class ResponseCache:
+    """Two-tier exact-match cache for model outputs.
+
+    A small in-memory LRU sits in front of a SQLite table so hot entries
+    are served without touching disk and every entry survives restarts.
+    Disk entries expire after ``ttl`` seconds and the least recently used
+    rows are evicted once the table grows past ``max_entries``. A disk hit
+    only rewrites its row's access time once that is ``touch_interval``
+    seconds old (a tenth of the TTL by default), so repeated reads of a hot
+    entry don't each cost a write and commit; eviction order is that
+    coarse. Several
+    worker processes can share one file; each re-reads the row count now
+    and then so the limit holds across all of them.
+
+    With a ``NearDuplicateIndex``, an exact miss falls back to the answer
+    stored for a near-identical query ("what's the capital of france" for
+    "What is the capital of France?"). The index is per process and only
+    learns queries answered by this worker.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100000,
+                 memory_entries: int = 1000, ttl: Optional[float] = None,
+                 near_duplicates=None, touch_interval: Optional[float] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        if touch_interval is None:
+            touch_interval = ttl / 10 if ttl else 3600.0
+        self.touch_interval = touch_interval
+        self.memory = LRUCache(max_entries=memory_entries, ttl=ttl)
+        # Optional NearDuplicateIndex consulted on exact misses
+        self.near_duplicates = near_duplicates
+
+        self.hits = 0
+        self.misses = 0
+        self.near_hits = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._count = 0
+        self._writes = 0
+        self._recount_every = max(1, max_entries // 100)
+        self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the SQLite tier, creating its table on first use"""
+        if self._conn is not None:
+            return self._conn
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        tune_sqlite(self._conn)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS response_cache (
+                key TEXT PRIMARY KEY,
+                model_size TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_response_cache_last_access "
+            "ON response_cache (last_access)"
+        )
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+        return self._conn
+
+    async def get(self, query: str, model_size: ModelSize,
+                  params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Look up a cached result, checking memory before disk, then near duplicates"""
+        key = make_cache_key(query, model_size, params)
+        result = await self._lookup(key)
+        if result is None and self.near_duplicates is not None:
+            similar = self.near_duplicates.lookup(query, model_size, params)
+            if similar is not None:
+                # The entry may have been evicted since it was indexed
+                result = await self._lookup(similar)
+                if result is not None:
+                    self.near_hits += 1
+                    self.memory.set(key, result)
+
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return dict(result)
+
+    async def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        result = self.memory.get(key)
+        if result is None:
+            result = await asyncio.to_thread(self._load, key)
+            if result is not None:
+                self.memory.set(key, result)
+        return result
+
+    async def set(self, query: str, model_size: ModelSize,
+                  params: Dict[str, Any], result: Dict[str, Any]):
+        """Store a successful model result in both tiers"""
+        key = make_cache_key(query, model_size, params)
+        self.memory.set(key, result)
+        await asyncio.to_thread(self._store, key, model_size, result)
+        if self.near_duplicates is not None:
+            self.near_duplicates.add(query, model_size, params, key)
+
+    def _load(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            self._connect()
+            row = self._conn.execute(
+                "SELECT result, expires_at, last_access FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] is not None and row[1] <= now:
+                self._conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self._count -= 1
+                return None
+            if now - row[2] >= self.touch_interval:
+                self._conn.execute(
+                    "UPDATE response_cache SET last_access = ? WHERE key = ?", (now, key)
+                )
+                self._conn.commit()
+        return json.loads(row[0])
+
+    def _store(self, key: str, model_size: ModelSize, result: Dict[str, Any]):
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl else None
+        with self._lock:
+            self._connect()
+            replaced = self._conn.execute(
+                "SELECT 1 FROM response_cache WHERE key = ?", (key,)
+            ).fetchone() is not None
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache "
+                "(key, model_size, result, created_at, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model_size.value, json.dumps(result), now, expires_at, now)
+            )
+            if not replaced:
+                self._count += 1
+            self._writes += 1
+            if self._writes % self._recount_every == 0:
+                self._count = self._conn.execute(
+                    "SELECT COUNT(*) FROM response_cache"
+                ).fetchone()[0]
+            if self._count > self.max_entries:
+                self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        """Drop expired rows, then least recently used rows over the limit"""
+        expired = self._conn.execute(
+            "DELETE FROM response_cache WHERE expires_at IS NOT NULL AND expires_at <= ?",
+            (now,)
+        ).rowcount
+        overflow = self._count - expired - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM response_cache WHERE key IN ("
+                "SELECT key FROM response_cache ORDER BY last_access LIMIT ?)",
+                (overflow,)
+            )
+        self.evictions += expired + max(overflow, 0)
+        self._count = self._conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+
+    def clear(self):
+        """Invalidate every cached response"""
+        self.memory.clear()
+        if self.near_duplicates is not None:
+            self.near_duplicates.clear()
+        with self._lock:
+            self._connect()
+            self._conn.execute("DELETE FROM response_cache")
+            self._conn.commit()
+            self._count = 0
+
+    def close(self):
+        """Close the SQLite tier; it reopens on next use"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit-rate and occupancy metrics for both tiers"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": self._count,
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "near_duplicate_hits": self.near_hits,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "memory": self.memory.stats(),
+            "near_duplicates": self.near_duplicates.stats()
+                               if self.near_duplicates is not None else None
+        }
@@ -1,22 +1,122 @@
+import asyncio
 import re
 from enum import Enum
-from typing import Dict, Any, List
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Set
 import hashlib
+import json
 from models import ModelSize
+from matcher import KeywordMatcher
+from cache import LRUCache
+from config import settings
 
 class QueryComplexity(Enum):
     SIMPLE = "simple"
     MODERATE = "moderate"
     COMPLEX = "complex"
 
+@dataclass
+class QueryFeatures:
+    """Everything the router needs to know about a query, computed once"""
+    word_count: int
+    question_count: int
+    matches_simple_pattern: bool
+    complex_hits: Set[str]
+    code_hits: Set[str]
+    math_hits: Set[str]
+    complexity: QueryComplexity
+    domain: str
+    
+    @property
+    def complex_score(self) -> int:
+        return len(self.complex_hits)
+    
+    @property
+    def technical_score(self) -> int:
+        return len(self.code_hits)
+    
+    @property
+    def math_score(self) -> int:
+        return len(self.math_hits)
+
 class RouteDecision:
-    def __init__(self, model_size: ModelSize, confidence: float, reason: str):
+    def __init__(self, model_size: ModelSize, confidence: float, reason: str,
+                 complexity: Optional[QueryComplexity] = None,
+                 success: Optional[Dict[ModelSize, float]] = None,
+                 max_new_tokens: Optional[int] = None):
         self.model_size = model_size
         self.confidence = confidence
         self.reason = reason
+        self.complexity = complexity
+        # Learned per-tier probability of answering without escalation
+        self.success = success
+        # Generation budget for the query, kept if the decision moves tier
+        self.max_new_tokens = max_new_tokens
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "model_size": self.model_size.value,
+            "confidence": self.confidence,
+            "reason": self.reason,
+            "complexity": self.complexity.value if self.complexity is not None else None,
+            "success": {size.value: p for size, p in self.success.items()}
+                       if self.success is not None else None,
+            "max_new_tokens": self.max_new_tokens
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RouteDecision":
+        complexity = data.get("complexity")
+        success = data.get("success")
+        return cls(
+            ModelSize(data["model_size"]), data["confidence"], data["reason"],
+            QueryComplexity(complexity) if complexity is not None else None,
+            {ModelSize(size): p for size, p in success.items()} if success is not None else None,
+            data.get("max_new_tokens")
+        )
+
+class EscalationMonitor:
+    """Incremental version of ``CascadeRouter.should_escalate`` for a token stream.
+
+    Escalation is certain before any text arrives when confidence is below
+    the escalation threshold. Otherwise it becomes certain once a failure
+    indicator appears anywhere in the output, so the rest of the
+    generation can be abandoned. A short answer can only be judged at the
+    end, by ``should_escalate``.
+    """
+    
+    def __init__(self, matcher: KeywordMatcher, low_confidence: bool):
+        self.matcher = matcher
+        self.state = 0
+        self.certain = low_confidence
+        self.reason = "low_confidence" if low_confidence else None
+    
+    def feed(self, text: str) -> bool:
+        """Scan the next chunk of output; return whether escalation is now certain"""
+        if not self.certain:
+            self.state, hits = self.matcher.advance(self.state, text.lower())
+            if hits:
+                self.certain = True
+                self.reason = "failure_indicator"
+        return self.certain
+
+# Attributes that decide routing; changing any of them invalidates cached decisions
+ROUTING_RULES = (
+    "code_keywords", "complex_keywords", "simple_patterns", "math_keywords",
+    "simple_max_words", "complex_min_words", "complex_keyword_threshold",
+    "complex_question_threshold", "code_domain_threshold", "math_domain_threshold",
+    "min_success", "adaptive_token_budgets", "token_budgets", "domain_token_budgets"
+)
 
 class CascadeRouter:
-    def __init__(self):
+    def __init__(self, health=None, readiness=None, shared_cache=None):
+        # Optional HealthTracker used to skip tiers whose circuit breaker is open
+        self.health = health
+        # Optional ModelReadiness used to avoid waiting on cold models
+        self.readiness = readiness
+        # Longest cold-start wait accepted when a request has no latency budget
+        self.default_wait_budget = settings.WARM_DEFAULT_WAIT_BUDGET
+        
         # Keywords that indicate code-related queries
         self.code_keywords = [
             "code", "function", "debug", "error", "python", "javascript",
@@ -42,65 +142,21 @@ class CascadeRouter:
             r"^true or false.*\?$"
         ]
         
-        # Cache for recent routing decisions
-        self.decision_cache: Dict[str, RouteDecision] = {}
+        # Keywords that indicate math queries
+        self.math_keywords = ["calculate", "solve", "equation", "math", "number"]
         
-    def analyze_complexity(self, query: str) -> QueryComplexity:
-        """Analyze query complexity based on multiple factors"""
-        query_lower = query.lower()
-        
-        # Factor 1: Query length
-        word_count = len(query.split())
-        
-        # Factor 2: Check for simple patterns
-        for pattern in self.simple_patterns:
-            if re.match(pattern, query_lower):
-                return QueryComplexity.SIMPLE
-        
-        # Factor 3: Check for complex keywords
-        complex_score = sum(1 for keyword in self.complex_keywords 
-                          if keyword in query_lower)
-        
-        # Factor 4: Question depth (number of questions)
-        question_count = query.count('?')
-        
-        # Factor 5: Technical complexity
-        technical_score = sum(1 for keyword in self.code_keywords 
-                            if keyword in query_lower)
-        
-        # Scoring logic
-        if word_count < 10 and complex_score == 0:
-            return QueryComplexity.SIMPLE
-        elif word_count > 50 or complex_score >= 2 or question_count > 2:
-            return QueryComplexity.COMPLEX
-        else:
-            return QueryComplexity.MODERATE
-            
-    def detect_domain(self, query: str) -> str:
-        """Detect the domain of the query"""
-        query_lower = query.lower()
-        
-        # Check for code domain
-        code_score = sum(1 for keyword in self.code_keywords 
-                        if keyword in query_lower)
-        if code_score >= 2:
-            return "code"
-            
-        # Check for math domain
-        math_keywords = ["calculate", "solve", "equation", "math", "number"]
-        math_score = sum(1 for keyword in math_keywords 
-                        if keyword in query_lower)
-        if math_score >= 2:
-            return "math"
-            
-        return "general"
-    
-    def calculate_confidence(self, query: str, model_size: ModelSize) -> float:
-        """Calculate confidence score for routing decision"""
-        complexity = self.analyze_complexity(query)
+        # Phrases in a model's answer that trigger escalation
+        self.failure_indicators = [
+            "i cannot", "i don't understand", "unclear", "error",
+            "sorry", "unable to"
+        ]
+        # Answers shorter than this many words are escalated too
+        self.min_response_words = 10
+        # Routing confidence below this always escalates
+        self.escalation_confidence = 0.7
         
         # Confidence matrix based on complexity and model size
-        confidence_matrix = {
+        self.confidence_matrix = {
             (QueryComplexity.SIMPLE, ModelSize.TINY): 0.95,
             (QueryComplexity.SIMPLE, ModelSize.MEDIUM): 0.98,
             (QueryComplexity.SIMPLE, ModelSize.LARGE): 0.99,
@@ -114,22 +170,193 @@ class CascadeRouter:
             (QueryComplexity.COMPLEX, ModelSize.LARGE): 0.95,
         }
         
-        return confidence_matrix.get((complexity, model_size), 0.5)
+        # Complexity and domain thresholds
+        self.simple_max_words = 10
+        self.complex_min_words = 50
+        self.complex_keyword_threshold = 2
+        self.complex_question_threshold = 2
+        self.code_domain_threshold = 2
+        self.math_domain_threshold = 2
+        
+        # max_new_tokens per complexity, raised to the domain's budget where
+        # that is larger (code and worked maths need room for the answer)
+        self.token_budgets = {"simple": 64, "moderate": 160, "complex": 256}
+        self.domain_token_budgets = {"code": 256, "math": 192}
+        self.adaptive_token_budgets = settings.ADAPTIVE_TOKEN_BUDGETS
+        
+        # Bounded cache for recent routing decisions
+        self.decision_cache = LRUCache(
+            max_entries=settings.ROUTER_CACHE_MAX_ENTRIES,
+            max_bytes=settings.ROUTER_CACHE_MAX_BYTES,
+            ttl=settings.ROUTER_CACHE_TTL
+        )
+        # Optional DiskCache behind it, shared with other worker processes.
+        # Its keys include a fingerprint of the rules, so decisions made under
+        # other rules (or by a worker running an older model) are never served.
+        # Only aroute/aroute_batch use it, and only for learned decisions:
+        # the heuristic rules take less time than a SQLite round trip.
+        self.shared_cache = shared_cache
+        
+        # Optional learned model (see train_router.py) that replaces the
+        # thresholds and confidence matrix above when loaded
+        self.model = None
+        self.min_success = settings.ROUTER_MIN_SUCCESS
+        
+        self.compile()
+        self.rules_version = self.fingerprint()
+        if settings.ROUTER_MODE == "learned":
+            try:
+                self.load_model(settings.ROUTER_MODEL_PATH)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Could not load router model from {settings.ROUTER_MODEL_PATH}, "
+                      f"using heuristic routing: {e}")
+    
+    def update_rules(self, **rules):
+        """Change keyword lists, patterns or thresholds and drop stale decisions"""
+        for name, value in rules.items():
+            if not hasattr(self, name) or name in ("decision_cache", "shared_cache",
+                                                   "rules_version", "keyword_matcher",
+                                                   "failure_matcher", "simple_regex", "model"):
+                raise ValueError(f"Unknown routing rule: {name}")
+            setattr(self, name, value)
+        self.compile()
+        self.invalidate_cache()
+    
+    def load_model(self, path: str):
+        """Route with a trained TierModel instead of the hand-tuned rules"""
+        from learned_router import TierModel
+        self.model = TierModel.load(path)
+        self.invalidate_cache()
+    
+    def unload_model(self):
+        """Go back to the hand-tuned rules"""
+        self.model = None
+        self.invalidate_cache()
+    
+    def invalidate_cache(self):
+        """Forget every cached routing decision"""
+        self.decision_cache.clear()
+        self.rules_version = self.fingerprint()
+    
+    def fingerprint(self) -> str:
+        """Digest of the rules and model that decisions are derived from"""
+        rules = [getattr(self, name) for name in ROUTING_RULES]
+        rules.append(sorted((complexity.value, size.value, confidence)
+                            for (complexity, size), confidence in self.confidence_matrix.items()))
+        digest = hashlib.md5(json.dumps(rules).encode())
+        if self.model is not None:
+            digest.update(json.dumps(self.model.names).encode())
+            for array in (self.model.weights, self.model.bias, self.model.mean, self.model.std):
+                digest.update(array.tobytes())
+        return digest.hexdigest()[:12]
+    
+    def compile(self):
+        """Build the single-pass matchers from the current keyword lists and patterns"""
+        self.keyword_matcher = KeywordMatcher({
+            "code": self.code_keywords,
+            "complex": self.complex_keywords,
+            "math": self.math_keywords
+        })
+        self.failure_matcher = KeywordMatcher({"failure": self.failure_indicators})
+        self.simple_regex = re.compile(
+            "|".join(f"(?:{pattern})" for pattern in self.simple_patterns)
+        )
+    
+    def extract_features(self, query: str) -> QueryFeatures:
+        """Compute all routing features for a query in a single pass"""
+        query_lower = query.lower()
+        hits = self.keyword_matcher.scan(query_lower)
+        
+        features = QueryFeatures(
+            # Factor 1: Query length
+            word_count=len(query.split()),
+            # Factor 4: Question depth (number of questions)
+            question_count=query.count('?'),
+            # Factor 2: Simple patterns
+            matches_simple_pattern=self.simple_regex.match(query_lower) is not None,
+            # Factors 3 and 5: Complex and technical keywords
+            complex_hits=hits.get("complex", set()),
+            code_hits=hits.get("code", set()),
+            math_hits=hits.get("math", set()),
+            complexity=QueryComplexity.MODERATE,
+            domain="general"
+        )
+        features.complexity = self._score_complexity(features)
+        features.domain = self._score_domain(features)
+        return features
+    
+    def _score_complexity(self, features: QueryFeatures) -> QueryComplexity:
+        """Scoring logic for query complexity"""
+        if features.matches_simple_pattern:
+            return QueryComplexity.SIMPLE
+        
+        if features.word_count < self.simple_max_words and features.complex_score == 0:
+            return QueryComplexity.SIMPLE
+        elif (features.word_count > self.complex_min_words
+              or features.complex_score >= self.complex_keyword_threshold
+              or features.question_count > self.complex_question_threshold):
+            return QueryComplexity.COMPLEX
+        else:
+            return QueryComplexity.MODERATE
+    
+    def _score_domain(self, features: QueryFeatures) -> str:
+        """Scoring logic for query domain"""
+        if features.technical_score >= self.code_domain_threshold:
+            return "code"
+        if features.math_score >= self.math_domain_threshold:
+            return "math"
+        return "general"
+        
+    def analyze_complexity(self, query: str) -> QueryComplexity:
+        """Analyze query complexity based on multiple factors"""
+        return self.extract_features(query).complexity
+            
+    def detect_domain(self, query: str) -> str:
+        """Detect the domain of the query"""
+        return self.extract_features(query).domain
+    
+    def token_budget(self, features: QueryFeatures) -> Optional[int]:
+        """How many new tokens to allow for a query (None for the tier default)"""
+        if not self.adaptive_token_budgets:
+            return None
+        return max(self.token_budgets.get(features.complexity.value, 0),
+                   self.domain_token_budgets.get(features.domain, 0)) or None
+    
+    def calculate_confidence(self, query: str, model_size: ModelSize,
+                             features: Optional[QueryFeatures] = None) -> float:
+        """Calculate confidence score for routing decision"""
+        if features is None:
+            features = self.extract_features(query)
+        return self.confidence_matrix.get((features.complexity, model_size), 0.5)
     
     def get_query_hash(self, query: str) -> str:
         """Generate hash for query caching"""
         return hashlib.md5(query.encode()).hexdigest()
     
-    def route(self, query: str) -> RouteDecision:
+    def route(self, query: str, latency_budget: Optional[float] = None) -> RouteDecision:
         """Main routing logic"""
         # Check cache first
         query_hash = self.get_query_hash(query)
-        if query_hash in self.decision_cache:
-            return self.decision_cache[query_hash]
+        cached = self.decision_cache.get(query_hash)
+        if cached is not None:
+            return self.apply_readiness(self.apply_health(cached), latency_budget)
         
         # Analyze query
-        complexity = self.analyze_complexity(query)
-        domain = self.detect_domain(query)
+        features = self.extract_features(query)
+        if self.model is not None:
+            decision = self.learned_decisions([query], [features])[0]
+        else:
+            decision = self.heuristic_decision(query, features)
+        
+        # Cache decision
+        self.decision_cache.set(query_hash, decision)
+        
+        return self.apply_readiness(self.apply_health(decision), latency_budget)
+    
+    def heuristic_decision(self, query: str, features: QueryFeatures) -> RouteDecision:
+        """Pick a tier from the hand-tuned complexity and domain rules"""
+        complexity = features.complexity
+        domain = features.domain
         
         # Routing logic
         if complexity == QueryComplexity.SIMPLE:
@@ -152,28 +379,167 @@ class CascadeRouter:
                 model_size = ModelSize.MEDIUM
                 reason = "Complex query - using medium model"
         
-        confidence = self.calculate_confidence(query, model_size)
-        decision = RouteDecision(model_size, confidence, reason)
+        confidence = self.calculate_confidence(query, model_size, features)
+        return RouteDecision(model_size, confidence, reason, complexity,
+                             max_new_tokens=self.token_budget(features))
+    
+    def learned_decisions(self, queries: List[str],
+                          features: List[QueryFeatures]) -> List[RouteDecision]:
+        """Score queries with the learned model in one vectorized pass"""
+        from learned_router import TIERS, featurize
+        matrix = featurize(self, queries, self.model.names, features)
+        tiers, success = self.model.choose(matrix, self.min_success)
         
-        # Cache decision
-        self.decision_cache[query_hash] = decision
+        decisions = []
+        for row, tier in enumerate(tiers.tolist()):
+            model_size = TIERS[tier]
+            probabilities = dict(zip(TIERS, success[row].tolist()))
+            confidence = probabilities[model_size]
+            decisions.append(RouteDecision(
+                model_size, confidence,
+                f"Learned router - {confidence:.0%} chance the {model_size.value} model suffices",
+                features[row].complexity, probabilities, self.token_budget(features[row])
+            ))
+        return decisions
+    
+    def tier_confidence(self, decision: RouteDecision, model_size: ModelSize) -> float:
+        """Confidence in a decision if it were moved to another tier"""
+        if decision.success is not None:
+            return decision.success[model_size]
+        return self.confidence_matrix.get((decision.complexity, model_size), decision.confidence)
+    
+    def apply_health(self, decision: RouteDecision) -> RouteDecision:
+        """Move a decision off an unavailable tier, preferring larger tiers"""
+        if self.health is None or self.health.is_available(decision.model_size):
+            return decision
         
+        sizes = list(ModelSize)
+        index = sizes.index(decision.model_size)
+        for size in sizes[index + 1:] + sizes[:index][::-1]:
+            if self.health.is_available(size):
+                return RouteDecision(
+                    size, self.tier_confidence(decision, size),
+                    f"{decision.reason} ({decision.model_size.value} model unavailable, "
+                    f"using {size.value})",
+                    decision.complexity, decision.success, decision.max_new_tokens
+                )
+        # Nothing is available; let the model client probe the original tier
         return decision
     
+    def apply_readiness(self, decision: RouteDecision,
+                        latency_budget: Optional[float] = None) -> RouteDecision:
+        """Wait for a loading model if it fits the latency budget, otherwise escalate"""
+        if self.readiness is None:
+            return decision
+        budget = self.default_wait_budget if latency_budget is None else latency_budget
+        wait = self.readiness.expected_wait(decision.model_size)
+        if wait <= budget:
+            return decision
+        
+        sizes = list(ModelSize)
+        for size in sizes[sizes.index(decision.model_size) + 1:]:
+            if self.readiness.expected_wait(size) <= budget and (
+                    self.health is None or self.health.is_available(size)):
+                return RouteDecision(
+                    size, self.tier_confidence(decision, size),
+                    f"{decision.reason} ({decision.model_size.value} model loading for "
+                    f"~{wait:.0f}s, using {size.value})",
+                    decision.complexity, decision.success, decision.max_new_tokens
+                )
+        # Every larger tier is also cold; waiting on the cheapest is best
+        return decision
+    
+    def route_batch(self, queries: List[str],
+                    latency_budget: Optional[float] = None) -> List[RouteDecision]:
+        """Route many queries in one pass, scoring cache misses together"""
+        if self.model is None:
+            return [self.route(query, latency_budget) for query in queries]
+        
+        hashes = [self.get_query_hash(query) for query in queries]
+        decisions = {query_hash: self.decision_cache.get(query_hash)
+                     for query_hash in dict.fromkeys(hashes)}
+        self._score_misses(queries, hashes, decisions)
+        return [self.apply_readiness(self.apply_health(decisions[query_hash]), latency_budget)
+                for query_hash in hashes]
+    
+    async def aroute(self, query: str, latency_budget: Optional[float] = None) -> RouteDecision:
+        """route(), also reusing decisions cached by other worker processes"""
+        return (await self.aroute_batch([query], latency_budget))[0]
+    
+    async def aroute_batch(self, queries: List[str],
+                           latency_budget: Optional[float] = None) -> List[RouteDecision]:
+        """route_batch(), also reading and filling the cache shared between workers.
+        
+        The shared cache is SQLite, so it is read and written in a worker
+        thread rather than on the event loop.
+        """
+        if self.model is None or self.shared_cache is None:
+            return self.route_batch(queries, latency_budget)
+        
+        version = self.rules_version
+        hashes = [self.get_query_hash(query) for query in queries]
+        decisions = {query_hash: self.decision_cache.get(query_hash)
+                     for query_hash in dict.fromkeys(hashes)}
+        misses = [query_hash for query_hash, decision in decisions.items() if decision is None]
+        if misses:
+            shared = await asyncio.to_thread(self._load_shared, version, misses)
+            if self.model is None or self.rules_version != version:
+                # The rules changed while we waited; these decisions are stale
+                return self.route_batch(queries, latency_budget)
+            for query_hash, decision in shared.items():
+                self.decision_cache.set(query_hash, decision)
+                decisions[query_hash] = decision
+        
+        scored = self._score_misses(queries, hashes, decisions)
+        if scored:
+            await asyncio.to_thread(self._store_shared, version, scored)
+        return [self.apply_readiness(self.apply_health(decisions[query_hash]), latency_budget)
+                for query_hash in hashes]
+    
+    def _score_misses(self, queries: List[str], hashes: List[str],
+                      decisions: Dict[str, Optional[RouteDecision]]) -> Dict[str, RouteDecision]:
+        """Score queries without a decision with the learned model, filling ``decisions`` and the cache"""
+        misses: Dict[str, str] = {}
+        for query, query_hash in zip(queries, hashes):
+            if decisions[query_hash] is None:
+                misses.setdefault(query_hash, query)
+        if not misses:
+            return {}
+        
+        miss_queries = list(misses.values())
+        scored = dict(zip(misses, self.learned_decisions(
+            miss_queries, [self.extract_features(query) for query in miss_queries]
+        )))
+        for query_hash, decision in scored.items():
+            self.decision_cache.set(query_hash, decision)
+            decisions[query_hash] = decision
+        return scored
+    
+    def _load_shared(self, version: str, hashes: List[str]) -> Dict[str, RouteDecision]:
+        """Decisions other workers cached under the same rules (blocking)"""
+        found = {}
+        for query_hash in hashes:
+            data = self.shared_cache.get(f"{version}:{query_hash}")
+            if data is not None:
+                found[query_hash] = RouteDecision.from_dict(data)
+        return found
+    
+    def _store_shared(self, version: str, decisions: Dict[str, RouteDecision]):
+        """Share freshly scored decisions with other workers (blocking)"""
+        self.shared_cache.set_many({f"{version}:{query_hash}": decision.to_dict()
+                                    for query_hash, decision in decisions.items()})
+    
     def should_escalate(self, response: str, confidence: float) -> bool:
         """Determine if we should escalate to a larger model"""
         # Check for obvious failure indicators
-        failure_indicators = [
-            "i cannot", "i don't understand", "unclear", "error",
-            "sorry", "unable to"
-        ]
-        
-        response_lower = response.lower()
-        has_failure = any(indicator in response_lower 
-                         for indicator in failure_indicators)
+        has_failure = bool(self.failure_matcher.scan(response.lower()))
         
         # Check response length (too short might indicate failure)
-        is_too_short = len(response.split()) < 10
+        is_too_short = len(response.split()) < self.min_response_words
         
         # Escalate if confidence is low OR response seems inadequate
-        return confidence < 0.7 or has_failure or is_too_short
\ No newline at end of file
+        return confidence < self.escalation_confidence or has_failure or is_too_short
+    
+    def escalation_monitor(self, confidence: float) -> EscalationMonitor:
+        """Track a streamed answer and report as soon as escalation is certain"""
+        return EscalationMonitor(self.failure_matcher, confidence < self.escalation_confidence)
\ No newline at end of file
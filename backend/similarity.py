@@ -0,0 +1,197 @@
+"""Near-duplicate query lookup with MinHash and locality-sensitive hashing.
+
+Queries are normalized (case, contractions, punctuation, a leading "can
+you" or "please") and cut into overlapping 4-byte shingles. Each query gets a MinHash signature whose
+agreement with another signature estimates the Jaccard similarity of the
+two shingle sets. The first ``bands * rows`` values are split into bands,
+and each band is hashed into a bucket table. Only queries sharing a bucket
+in some band are compared. With 8 bands of 4 rows, pairs at 0.8 similarity
+share a bucket more than 98% of the time, and unrelated queries almost
+never do.
+
+Shingle similarity alone can't tell "sort ascending" from "sort
+descending", "safe" from "unsafe" or "set to list" from "list to set",
+so a candidate must also have the same words in the same order, apart
+from articles. The threshold then only bounds how much the rest of the
+text may differ.
+
+Everything lives in fixed-size NumPy arrays allocated up front, so memory
+is bounded by ``capacity``. Inserts overwrite the oldest entry, and a
+lookup hashes one query and compares at most ``bands * bucket_width``
+candidates, whatever the number of entries.
+"""
+import json
+import re
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from models import ModelSize
+
+SHINGLE_BYTES = 4
+# Signatures keep the low byte of each MinHash value (b-bit MinHash);
+# matches between unrelated bytes are corrected for in the estimate
+CHANCE_MATCH = 1 / 256
+
+CONTRACTIONS = (
+    (re.compile(r"\b(what|who|where|when|how|that|there|it|he|she)'s\b"), r"\1 is"),
+    (re.compile(r"\bcan't\b"), "cannot"),
+    (re.compile(r"\bwon't\b"), "will not"),
+    (re.compile(r"n't\b"), " not"),
+    (re.compile(r"'re\b"), " are"),
+    (re.compile(r"'m\b"), " am"),
+    (re.compile(r"'ll\b"), " will"),
+    (re.compile(r"'ve\b"), " have"),
+    (re.compile(r"'d\b"), " would")
+)
+PUNCTUATION = re.compile(r"[^\w\s+\-*/^=<>%.]|(?<!\d)\.|\.(?!\d)")
+OPERATOR_SPACING = re.compile(r"\s*([+\-*/^=<>%])\s*")
+# Requests for help that don't change the question
+POLITENESS = re.compile(r"^(?:(?:can|could|would|will) you (?:please )?|please |kindly )+|\s+please$")
+# The only words a match may add or leave out. Kept to articles on purpose:
+# negations, numbers, operators, question words, tense, direction words
+# (to/from, ascending/descending) and prefixed antonyms (safe/unsafe) all
+# have to match, in order
+DROPPABLE_WORDS = frozenset(("a", "an", "the"))
+
+def normalize_text(text: str) -> str:
+    """Lowercase, expand contractions, drop punctuation, politeness and extra whitespace.
+
+    "What's the capital of France?" becomes "what is the capital of france".
+    """
+    text = text.lower().replace("’", "'")
+    for pattern, replacement in CONTRACTIONS:
+        text = pattern.sub(replacement, text)
+    text = " ".join(PUNCTUATION.sub(" ", text).split())
+    return POLITENESS.sub("", OPERATOR_SPACING.sub(r"\1", text))
+
+def content_words(normalized: str) -> List[str]:
+    """The words of a normalized query that a match must repeat in order"""
+    return [word for word in normalized.split() if word not in DROPPABLE_WORDS]
+
+class NearDuplicateIndex:
+    """Bounded MinHash/LSH index from queries to response cache keys.
+
+    A match must have been stored for the same tier and generation
+    parameters, have the same content words in the same order, and reach
+    that tier's similarity threshold.
+    """
+
+    def __init__(self, thresholds: Dict[str, float], capacity: int = 100000,
+                 num_perm: int = 64, bands: int = 8, rows: int = 4,
+                 bucket_width: int = 2, seed: int = 1):
+        if bands * rows > num_perm:
+            raise ValueError("bands * rows must not exceed num_perm")
+        self.thresholds = {ModelSize(size): value for size, value in thresholds.items()}
+        self.capacity = capacity
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = rows
+        self.bucket_width = bucket_width
+
+        # Multiply-add-shift hash family; uint64 arithmetic wraps modulo 2**64
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 2**63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2**63, num_perm, dtype=np.uint64)
+        self._band_mix = rng.integers(1, 2**63, rows, dtype=np.uint64) | np.uint64(1)
+        self._band_index = np.arange(bands)
+        self.buckets = 1 << max(1, (capacity - 1).bit_length())
+
+        self.signatures = np.zeros((capacity, num_perm), dtype=np.uint8)
+        self.contexts = np.zeros(capacity, dtype=np.uint32)
+        # CRC of each entry's content words
+        self.guards = np.zeros(capacity, dtype=np.uint32)
+        self.keys = np.zeros((capacity, 32), dtype=np.uint8)
+        # Slot + 1 per bucket entry, 0 when empty; newest entry first
+        self.table = np.zeros((bands, self.buckets, bucket_width), dtype=np.int32)
+
+        self.size = 0
+        self._next = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _signature(self, normalized: str) -> np.ndarray:
+        data = normalized.encode()
+        if len(data) < SHINGLE_BYTES:
+            data = data.ljust(SHINGLE_BYTES)
+        raw = np.frombuffer(data, dtype=np.uint8).astype(np.uint64)
+        shingles = raw[:-3] << 24 | raw[1:-2] << 16 | raw[2:-1] << 8 | raw[3:]
+        hashes = (shingles[:, None] * self._a + self._b) >> np.uint64(32)
+        return hashes.min(axis=0)
+
+    def _band_buckets(self, signature: np.ndarray) -> np.ndarray:
+        rows = signature[:self.bands * self.rows].reshape(self.bands, self.rows)
+        mixed = np.bitwise_xor.reduce(rows * self._band_mix, axis=1)
+        mixed ^= mixed >> np.uint64(29)
+        return (mixed & np.uint64(self.buckets - 1)).astype(np.int64)
+
+    @staticmethod
+    def _context(model_size: ModelSize, params: Dict[str, Any]) -> int:
+        return zlib.crc32(json.dumps([model_size.value, params], sort_keys=True).encode())
+
+    def _features(self, query: str) -> Tuple[np.ndarray, np.ndarray, int]:
+        normalized = normalize_text(query)
+        signature = self._signature(normalized)
+        guard = zlib.crc32(" ".join(content_words(normalized)).encode())
+        return signature, self._band_buckets(signature), guard
+
+    def lookup(self, query: str, model_size: ModelSize,
+               params: Dict[str, Any]) -> Optional[str]:
+        """Cache key of the most similar stored query above the tier's threshold"""
+        threshold = self.thresholds.get(model_size)
+        if threshold is None:
+            return None
+        signature, buckets, guard = self._features(query)
+        slots = np.unique(self.table[self._band_index, buckets].ravel())
+        slots = slots[slots > 0] - 1
+        slots = slots[(self.contexts[slots] == self._context(model_size, params))
+                      & (self.guards[slots] == guard)]
+        if len(slots) == 0:
+            self.misses += 1
+            return None
+
+        matches = (self.signatures[slots] == signature.astype(np.uint8)).mean(axis=1)
+        similarity = (matches - CHANCE_MATCH) / (1 - CHANCE_MATCH)
+        best = int(similarity.argmax())
+        if similarity[best] < threshold:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.keys[slots[best]].tobytes().hex()
+
+    def add(self, query: str, model_size: ModelSize, params: Dict[str, Any], key: str):
+        """Index a query whose response is cached under ``key``, replacing the oldest entry when full"""
+        if model_size not in self.thresholds:
+            return
+        signature, buckets, guard = self._features(query)
+        slot = self._next
+        self._next = (self._next + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+        self.signatures[slot] = signature.astype(np.uint8)
+        self.contexts[slot] = self._context(model_size, params)
+        self.guards[slot] = guard
+        self.keys[slot] = np.frombuffer(bytes.fromhex(key), dtype=np.uint8)
+        # Push onto the front of each band's bucket; the oldest entry falls off
+        bands = self._band_index
+        self.table[bands, buckets, 1:] = self.table[bands, buckets, :-1]
+        self.table[bands, buckets, 0] = slot + 1
+
+    def clear(self):
+        self.table.fill(0)
+        self.size = 0
+        self._next = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        arrays = (self.signatures, self.contexts, self.guards, self.keys, self.table)
+        return {
+            "entries": self.size,
+            "capacity": self.capacity,
+            "thresholds": {size.value: value for size, value in self.thresholds.items()},
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "memory_bytes": sum(array.nbytes for array in arrays)
+        }
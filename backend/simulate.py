@@ -0,0 +1,263 @@
+"""Replay recorded queries through the router under alternative configurations.
+
+No upstream calls are made. Each query needs a starting tier, which the
+router picks, and an outcome model that says which tier would have
+answered it. For logged queries the tier that finally answered is taken
+as the cheapest one that suffices, as in train_router.py (days moved out
+by archiver.py are not replayed). A query routed
+below that tier, or routed with confidence below the escalation
+threshold, escalates one tier, just as run_cascade does. Cost is charged
+on the answering tier's prompt and completion tokens, and savings are
+measured against answering everything with the LARGE model, as in
+process_query. Prompt tokens come from the logs; rows logged before they
+were recorded estimate them from the query text (words x 1.3, the
+fallback live accounting uses). The
+tokens burnt by a first attempt that escalated are reported separately
+as waste. Early abort skips that attempt when escalation was certain
+from the routing confidence alone.
+
+    python simulate.py --variant '{"name": "wider-simple", "rules": {"simple_max_words": 15}}'
+    python simulate.py --jsonl queries.jsonl --variant variants.json --output report.json
+
+A variant is a JSON object (inline or in a file, alone or in a list) with
+any of these keys:
+- "name"
+- "rules": CascadeRouter.update_rules keyword arguments
+- "router_model": a train_router.py output, or null for the heuristic
+- "costs": tier to cost_per_token
+- "early_abort": a bool
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import settings
+from learned_router import TIERS
+from models import MODEL_CONFIGS, ModelSize, estimate_tokens
+
+TIER_INDEX = {size.value: i for i, size in enumerate(TIERS)}
+LARGE = TIER_INDEX[ModelSize.LARGE.value]
+
+def load_logged(since: Optional[datetime] = None, limit: Optional[int] = None
+                ) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """Query texts, tokens charged (prompt + completion) and answering tier for every usable logged query"""
+    from database import QueryLog, SessionLocal
+
+    queries, tokens, needed = [], [], []
+    db = SessionLocal()
+    try:
+        rows = db.query(QueryLog.query_text, QueryLog.tokens_used, QueryLog.prompt_tokens,
+                        QueryLog.model_size).filter(
+            QueryLog.routing_reason != "Forced model selection",
+            QueryLog.tokens_used > 0
+        )
+        if since is not None:
+            rows = rows.filter(QueryLog.timestamp >= since)
+        if limit is not None:
+            rows = rows.limit(limit)
+        for query_text, tokens_used, prompt_tokens, model_size in rows.order_by(QueryLog.id).yield_per(10000):
+            if query_text and model_size in TIER_INDEX:
+                queries.append(query_text)
+                tokens.append(tokens_used + (prompt_tokens or estimate_tokens(query_text)))
+                needed.append(TIER_INDEX[model_size])
+    finally:
+        db.close()
+    return queries, np.array(tokens, dtype=np.float64), np.array(needed, dtype=np.int8)
+
+def load_jsonl(path: str, default_tokens: int) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """Queries from a JSONL file.
+
+    The text comes from "query", "text" or "prompt", or else from "title"
+    and "body" together. Optional "tokens" and "model_size" fields give
+    the outcome, and "prompt_tokens" the prompt size (estimated from the
+    text if absent). Without "model_size" every tier is assumed to
+    suffice, so only low-confidence escalations are counted.
+    """
+    queries, tokens, needed = [], [], []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            text = record.get("query") or record.get("text") or record.get("prompt")
+            if text is None:
+                text = " ".join(str(record[key]) for key in ("title", "body") if record.get(key))
+            if not text:
+                continue
+            queries.append(text)
+            tokens.append((record.get("tokens") or default_tokens)
+                          + (record.get("prompt_tokens") or estimate_tokens(text)))
+            needed.append(TIER_INDEX.get(record.get("model_size"), 0))
+    return queries, np.array(tokens, dtype=np.float64), np.array(needed, dtype=np.int8)
+
+def load_variants(specs: List[str]) -> List[Dict[str, Any]]:
+    """The current configuration followed by each --variant (inline JSON or a file)"""
+    variants = [{"name": "current"}]
+    for spec in specs:
+        if spec.lstrip().startswith(("{", "[")):
+            data = json.loads(spec)
+        else:
+            with open(spec) as f:
+                data = json.load(f)
+        for variant in (data if isinstance(data, list) else [data]):
+            variant.setdefault("name", f"variant-{len(variants)}")
+            variants.append(variant)
+    return variants
+
+def build_router(variant: Dict[str, Any]):
+    from router import CascadeRouter
+
+    router = CascadeRouter()
+    if "router_model" in variant:
+        if variant["router_model"] is None:
+            router.unload_model()
+        else:
+            router.load_model(variant["router_model"])
+    if variant.get("rules"):
+        router.update_rules(**variant["rules"])
+    return router
+
+_routers = []
+
+def _init_worker(variants: List[Dict[str, Any]]):
+    _routers.extend(build_router(variant) for variant in variants)
+
+def _route_chunk(queries: List[str]) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Starting tier, confidence and low-confidence flag per query, for each variant"""
+    results = []
+    for router in _routers:
+        features = [router.extract_features(query) for query in queries]
+        if router.model is not None:
+            decisions = router.learned_decisions(queries, features)
+        else:
+            decisions = [router.heuristic_decision(query, f) for query, f in zip(queries, features)]
+        tiers = np.array([TIER_INDEX[d.model_size.value] for d in decisions], dtype=np.int8)
+        confidence = np.array([d.confidence for d in decisions], dtype=np.float32)
+        results.append((tiers, confidence, confidence < router.escalation_confidence))
+    return results
+
+def route_all(queries: List[str], variants: List[Dict[str, Any]], workers: int,
+              chunk_size: int) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Route every query under every variant, spread over a process pool"""
+    chunks = [queries[i:i + chunk_size] for i in range(0, len(queries), chunk_size)]
+    if workers <= 1:
+        _init_worker(variants)
+        parts = [_route_chunk(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(variants,)) as pool:
+            parts = list(pool.map(_route_chunk, chunks))
+    return [
+        tuple(np.concatenate([part[v][k] for part in parts]) for k in range(3))
+        for v in range(len(variants))
+    ]
+
+def simulate(variant: Dict[str, Any], start: np.ndarray, low_confidence: np.ndarray,
+             tokens: np.ndarray, needed: np.ndarray) -> Dict[str, Any]:
+    """Project tier mix, escalations, cost and savings for one variant"""
+    prices = np.array([
+        variant.get("costs", {}).get(size.value, MODEL_CONFIGS[size]["cost_per_token"])
+        for size in TIERS
+    ])
+    early_abort = variant.get("early_abort", settings.EARLY_ABORT_ENABLED)
+
+    escalated = ((start < needed) | low_confidence) & (start < LARGE)
+    final = np.where(escalated, start + 1, start)
+    cost = tokens * prices[final]
+    # A first attempt is skipped outright when escalation was certain up front
+    wasted = np.where(escalated & ~(low_confidence & early_abort), tokens * prices[start], 0.0)
+    baseline = tokens * prices[LARGE]
+
+    total_cost, total_wasted, total_baseline = cost.sum(), wasted.sum(), baseline.sum()
+    counts = np.bincount(final, minlength=len(TIERS))
+    return {
+        "name": variant["name"],
+        "queries": int(len(start)),
+        "tier_mix": {size.value: round(float(counts[i] / len(start)), 4) for i, size in enumerate(TIERS)},
+        "starting_mix": {
+            size.value: round(float(np.mean(start == i)), 4) for i, size in enumerate(TIERS)
+        },
+        "escalation_rate": round(float(escalated.mean()), 4),
+        "under_routed": round(float(np.mean(final < needed)), 4),
+        "cost": round(float(total_cost), 6),
+        "wasted": round(float(total_wasted), 6),
+        "baseline_cost": round(float(total_baseline), 6),
+        "saved": round(float(total_baseline - total_cost), 6),
+        "savings_percentage": round(float((total_baseline - total_cost) / total_baseline * 100), 2)
+                              if total_baseline else 0.0,
+        "savings_after_waste_percentage": round(
+            float((total_baseline - total_cost - total_wasted) / total_baseline * 100), 2
+        ) if total_baseline else 0.0
+    }
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Replay queries through alternative cascade configurations")
+    parser.add_argument("--jsonl", default=None, help="Replay a JSONL file instead of query_logs")
+    parser.add_argument("--since-days", type=float, default=None,
+                        help="Only replay the last N days of logs")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--default-tokens", type=int, default=150,
+                        help="Tokens per answer for JSONL records without a \"tokens\" field")
+    parser.add_argument("--variant", action="append", default=[],
+                        help="Variant as inline JSON or a JSON file (repeatable)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--output", default=None, help="Write the report as JSON")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.jsonl:
+        queries, tokens, needed = load_jsonl(args.jsonl, args.default_tokens)
+    else:
+        since = None
+        if args.since_days is not None:
+            since = datetime.now(timezone.utc) - timedelta(days=args.since_days)
+        queries, tokens, needed = load_logged(since, args.limit)
+    if not queries:
+        print("No queries to replay")
+        return 1
+    variants = load_variants(args.variant)
+
+    # Routing is deterministic, so each distinct text is routed once
+    unique: Dict[str, int] = {}
+    inverse = np.fromiter((unique.setdefault(query, len(unique)) for query in queries),
+                          dtype=np.int64, count=len(queries))
+    loaded = time.perf_counter()
+    routed = route_all(list(unique), variants, args.workers, args.chunk_size)
+
+    report = {
+        "queries": len(queries),
+        "distinct_queries": len(unique),
+        "source": args.jsonl or "query_logs",
+        "variants": [
+            simulate(variant, tiers[inverse], low_confidence[inverse], tokens, needed)
+            for variant, (tiers, _, low_confidence) in zip(variants, routed)
+        ],
+        "seconds": {"load": round(loaded - started, 2),
+                    "replay": round(time.perf_counter() - loaded, 2)}
+    }
+
+    print(f"Replayed {len(queries)} queries ({len(unique)} distinct) in "
+          f"{report['seconds']['replay']}s")
+    print(f"  {'variant':<16} {'tiny':>6} {'medium':>7} {'large':>6} {'escal':>6} "
+          f"{'cost':>10} {'wasted':>10} {'saved':>7}")
+    for result in report["variants"]:
+        mix = result["tier_mix"]
+        print(f"  {result['name']:<16} {mix['tiny']:>6.1%} {mix['medium']:>7.1%} {mix['large']:>6.1%} "
+              f"{result['escalation_rate']:>6.1%} {result['cost']:>10.4f} {result['wasted']:>10.4f} "
+              f"{result['savings_percentage']:>6.1f}%")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionRejected, Priority, TierAdmission, _Slot
+from models import ModelSize
+
+def make_tier(rate=None, burst=1.0, max_concurrency=1, max_queue=10):
+    return TierAdmission(ModelSize.TINY, rate=rate, burst=burst,
+                         max_concurrency=max_concurrency, max_queue=max_queue)
+
+def test_queued_requests_are_admitted_in_priority_order():
+    async def run():
+        tier = make_tier()
+        await tier.acquire(Priority.INTERACTIVE, 1.0)
+        order = []
+
+        async def request(priority, name):
+            await tier.acquire(priority, 1.0)
+            order.append(name)
+            tier.release()
+
+        tasks = [asyncio.create_task(request(priority, name)) for priority, name in (
+            (Priority.BACKGROUND, "warmup"),
+            (Priority.BATCH, "batch"),
+            (Priority.INTERACTIVE, "query"),
+            (Priority.BATCH, "batch-2")
+        )]
+        await asyncio.sleep(0.01)
+        assert tier.queued()[Priority.BATCH] == 2
+        tier.release()
+        await asyncio.gather(*tasks)
+        return order, tier.active
+
+    order, active = asyncio.run(run())
+    assert order == ["query", "batch", "batch-2", "warmup"]
+    assert active == 0
+
+def test_full_queue_is_rejected_with_503():
+    async def run():
+        tier = make_tier(max_queue=1)
+        await tier.acquire(Priority.INTERACTIVE, 1.0)
+        waiter = asyncio.create_task(tier.acquire(Priority.INTERACTIVE, 1.0))
+        await asyncio.sleep(0)
+        try:
+            with pytest.raises(AdmissionRejected) as rejected:
+                await tier.acquire(Priority.INTERACTIVE, 1.0)
+        finally:
+            waiter.cancel()
+        return rejected.value
+
+    rejected = asyncio.run(run())
+    assert (rejected.status_code, rejected.reason) == (503, "queue_full")
+
+def test_empty_token_bucket_is_rejected_with_429():
+    async def run():
+        tier = make_tier(rate=1.0, burst=1.0, max_concurrency=10)
+        await tier.acquire(Priority.INTERACTIVE, 0.1)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await tier.acquire(Priority.INTERACTIVE, 0.1)
+        return rejected.value
+
+    rejected = asyncio.run(run())
+    assert (rejected.status_code, rejected.reason) == (429, "rate_limited")
+    assert rejected.retry_after == pytest.approx(1.0, abs=0.1)
+
+def test_wait_budget_exceeded_is_rejected_with_429():
+    async def run():
+        tier = make_tier()
+        await tier.acquire(Priority.INTERACTIVE, 1.0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await tier.acquire(Priority.BATCH, 0.02)
+        return rejected.value, tier.queued()
+
+    rejected, queued = asyncio.run(run())
+    assert (rejected.status_code, rejected.reason) == (429, "wait_budget_exceeded")
+    assert sum(queued.values()) == 0
+
+def test_cancelled_request_releases_its_slot():
+    async def run():
+        tier = make_tier()
+        started = asyncio.Event()
+
+        async def request():
+            async with _Slot(tier, Priority.INTERACTIVE, 1.0):
+                started.set()
+                await asyncio.sleep(10)
+
+        task = asyncio.create_task(request())
+        await started.wait()
+        held = tier.active
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return held, tier.active
+
+    held, active = asyncio.run(run())
+    assert held == 1
+    assert active == 0
+
+def test_cancelled_queued_waiter_leaves_the_queue():
+    async def run():
+        tier = make_tier()
+        await tier.acquire(Priority.INTERACTIVE, 1.0)
+        waiter = asyncio.create_task(tier.acquire(Priority.INTERACTIVE, 1.0))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return tier.queued(), tier.active
+
+    queued, active = asyncio.run(run())
+    assert sum(queued.values()) == 0
+    assert active == 1
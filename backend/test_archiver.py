@@ -0,0 +1,46 @@
+import gzip
+import json
+from datetime import datetime
+
+from archiver import archive_day
+from database import ArchiveSummary, CostSaving, QueryLog, SessionLocal, log_batch
+
+DAY = datetime(2002, 3, 4)
+
+def query(model_size, cost, at):
+    return {"query_hash": model_size * 4, "model_size": model_size, "cost": cost, "timestamp": at}
+
+def savings(model_size, saved, at):
+    return {"query_hash": model_size * 4, "actual_cost": 0.0, "baseline_cost": saved,
+            "saved": saved, "timestamp": at}
+
+def test_archive_pairs_savings_by_link_not_by_order(tmp_path):
+    at = DAY.replace(hour=9)
+    log_batch([query("tiny", 1.0, at)], [savings("tiny", 0.5, at)])
+    log_batch([query("medium", 2.0, at)], [savings("medium", 3.0, at)])
+    db = SessionLocal()
+    try:
+        # As if the first pair's savings row had never been written
+        db.query(CostSaving).filter(CostSaving.query_hash == "tiny" * 4).delete()
+        db.commit()
+    finally:
+        db.close()
+
+    result = archive_day(DAY, str(tmp_path), pause=0)
+    assert (result["query_rows"], result["savings_rows"]) == (2, 1)
+
+    db = SessionLocal()
+    try:
+        summaries = {row.model_size: row.saved for row in
+                     db.query(ArchiveSummary).filter(ArchiveSummary.bucket_start == at)}
+        remaining = db.query(QueryLog).filter(QueryLog.timestamp >= DAY,
+                                              QueryLog.timestamp < at.replace(hour=23)).count()
+    finally:
+        db.close()
+    assert summaries == {"tiny": 0, "medium": 3.0}
+    assert remaining == 0
+
+    with gzip.open(tmp_path / "cost_savings" / "2002-03-04.ndjson.gz", "rt") as f:
+        archived = [json.loads(line) for line in f]
+    assert [row["saved"] for row in archived] == [3.0]
+    assert archived[0]["query_log_id"] is not None
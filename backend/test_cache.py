@@ -0,0 +1,88 @@
+import cache
+from cache import DiskCache, LRUCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_least_recently_used_entry_evicted_first():
+    lru = LRUCache(max_entries=2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1
+    lru.set("c", 3)
+    assert lru.get("b") is None
+    assert lru.get("a") == 1 and lru.get("c") == 3
+    assert lru.evictions == 1
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    lru = LRUCache(max_entries=10, ttl=5.0)
+    lru.set("a", 1)
+    clock.now += 4.9
+    assert lru.get("a") == 1
+    clock.now += 0.2
+    assert lru.get("a") is None
+    assert lru.expirations == 1
+    assert len(lru) == 0 and lru.current_bytes == 0
+
+def test_byte_budget_evicts_until_under_limit():
+    lru = LRUCache(max_entries=100, max_bytes=250, sizeof=lambda key, value: len(value))
+    for key in "abcd":
+        lru.set(key, "x" * 100)
+    assert len(lru) == 2
+    assert lru.current_bytes == 200
+    assert lru.get("a") is None and lru.get("b") is None
+    assert lru.get("d") is not None
+    assert lru.evictions == 2
+
+def test_replacing_a_key_updates_its_size():
+    lru = LRUCache(max_entries=10, max_bytes=1000, sizeof=lambda key, value: len(value))
+    lru.set("a", "x" * 100)
+    lru.set("a", "x" * 10)
+    assert len(lru) == 1
+    assert lru.current_bytes == 10
+
+def test_entry_larger_than_budget_is_not_kept():
+    lru = LRUCache(max_entries=10, max_bytes=50, sizeof=lambda key, value: len(value))
+    lru.set("a", "x" * 10)
+    lru.set("big", "x" * 100)
+    assert lru.get("big") is None
+    assert lru.current_bytes <= 50
+
+def test_disk_cache_replacing_a_key_keeps_the_count(tmp_path):
+    disk = DiskCache(str(tmp_path / "cache.db"), max_entries=10)
+    for i in range(20):
+        disk.set("same", i)
+    assert len(disk) == 1
+    assert disk.get("same") == 19
+    assert disk.evictions == 0
+    disk.close()
+
+def test_disk_cache_evicts_oldest_down_to_low_water(tmp_path, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache.time, "time", clock)
+    disk = DiskCache(str(tmp_path / "cache.db"), max_entries=10, low_water=0.5)
+
+    def insert(i):
+        clock.now += 1
+        disk.set(f"k{i}", i)
+
+    for i in range(10):
+        insert(i)
+    assert disk.evictions == 0
+    insert(10)
+    assert len(disk) == 5
+    assert disk.evictions == 6
+    assert disk.get("k5") is None
+    assert disk.get("k6") == 6
+    # No further trimming until the limit is passed again
+    for i in range(11, 16):
+        insert(i)
+    assert len(disk) == 10
+    assert disk.evictions == 6
+    disk.close()
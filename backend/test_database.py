@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+
+from database import (CostSaving, QueryLog, SessionLocal, StatsRollup, iter_log_batches,
+                      log_batch)
+
+START = datetime(2001, 1, 1, 12, 0, 0)
+
+def add_rows(rows):
+    db = SessionLocal()
+    try:
+        db.add_all(rows)
+        db.commit()
+    finally:
+        db.close()
+
+def log(query_hash, at, cost):
+    return QueryLog(query_hash=query_hash, query_text=query_hash, model_used="phi-2",
+                    model_size="tiny", cost=cost, timestamp=at)
+
+def saving(query_hash, at, saved):
+    return CostSaving(query_hash=query_hash, actual_cost=0.0, baseline_cost=saved,
+                      saved=saved, timestamp=at)
+
+def exported(start, end):
+    return [row for batch in iter_log_batches(start, end) for row in batch]
+
+def test_export_pairs_savings_stamped_by_the_log_writer():
+    at = START
+    add_rows([log("a" * 32, at, 1.0), saving("a" * 32, at, 0.5),
+              # An unrelated savings row a moment later isn't picked
+              saving("b" * 32, at, 9.0)])
+    rows = exported(at, at + timedelta(minutes=1))
+    assert [(row["cost"], row["saved"]) for row in rows] == [(1.0, 0.5)]
+
+def test_export_pairs_savings_committed_after_their_query():
+    at = START + timedelta(hours=1)
+    query_hash = "c" * 32
+    # Before the log writer each row had its own commit and timestamp, and
+    # the same query could be asked twice in a row
+    add_rows([
+        log(query_hash, at, 1.0),
+        saving(query_hash, at + timedelta(milliseconds=3), 0.1),
+        log(query_hash, at + timedelta(milliseconds=500), 2.0),
+        saving(query_hash, at + timedelta(milliseconds=504), 0.2),
+        log("d" * 32, at + timedelta(seconds=1), 3.0),
+        # Far too late to belong to the query above
+        saving("d" * 32, at + timedelta(seconds=30), 0.3)
+    ])
+    rows = exported(at, at + timedelta(minutes=1))
+    assert [(row["cost"], row["saved"]) for row in rows] == [(1.0, 0.1), (2.0, 0.2), (3.0, None)]
+
+def test_export_pairs_rows_linked_by_the_log_writer():
+    at = START + timedelta(hours=2)
+    query_hash = "e" * 32
+    # A prompt repeated in one batch: same hash and timestamp, the second
+    # answered from the cache
+    log_batch(
+        [{"query_hash": query_hash, "model_size": "tiny", "cost": 2.75e-05, "cache_hit": 0,
+          "timestamp": at},
+         {"query_hash": query_hash, "model_size": "tiny", "cost": 0.0, "cache_hit": 1,
+          "timestamp": at}],
+        [{"query_hash": query_hash, "actual_cost": 2.75e-05, "baseline_cost": 1e-04,
+          "saved": 7.25e-05, "timestamp": at},
+         {"query_hash": query_hash, "actual_cost": 0.0, "baseline_cost": 1e-04,
+          "saved": 1e-04, "cache_hit": 1, "timestamp": at}]
+    )
+    rows = exported(at, at + timedelta(minutes=1))
+    assert [(row["cost"], row["actual_cost"], row["saved"]) for row in rows] == [
+        (2.75e-05, 2.75e-05, 7.25e-05), (0.0, 0.0, 1e-04)
+    ]
+
+def test_rollups_count_the_prompt_tokens_that_were_charged():
+    at = START + timedelta(hours=3)
+    log_batch(
+        [{"query_hash": "f" * 32, "model_size": "tiny", "tokens_used": 40, "prompt_tokens": 12,
+          "cost": 5.2e-06, "timestamp": at}],
+        [{"query_hash": "f" * 32, "actual_cost": 5.2e-06, "baseline_cost": 5.2e-05,
+          "saved": 4.68e-05, "timestamp": at}]
+    )
+    db = SessionLocal()
+    try:
+        rollup = db.query(StatsRollup).filter_by(bucket="hour", bucket_start=at).one()
+    finally:
+        db.close()
+    assert (rollup.tokens, rollup.prompt_tokens) == (40, 12)
+    assert exported(at, at + timedelta(minutes=1))[0]["prompt_tokens"] == 12
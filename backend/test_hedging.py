@@ -0,0 +1,33 @@
+import pytest
+
+import main
+from models import ModelSize
+from router import RouteDecision
+
+@pytest.fixture(autouse=True)
+def hedging(monkeypatch):
+    monkeypatch.setattr(main.settings, "HEDGE_ENABLED", True)
+    monkeypatch.setattr(main.settings, "HEDGE_CONFIDENCE_MARGIN", 0.1)
+    monkeypatch.setattr(main.settings, "HEDGE_DELAY", 1.0)
+    monkeypatch.setattr(main.router, "escalation_confidence", 0.7)
+
+def delay(confidence, latency_budget=None):
+    decision = RouteDecision(ModelSize.TINY, confidence, "test")
+    return main.hedge_delay(decision, None, latency_budget)
+
+def test_routes_certain_to_escalate_are_never_hedged():
+    assert delay(0.6) is None
+    assert delay(0.6, latency_budget=2.0) is None
+
+def test_uncertain_band_starts_at_the_escalation_threshold():
+    assert delay(0.7) == 1.0
+    assert delay(0.79) == 1.0
+    assert delay(0.8) is None
+
+def test_band_follows_the_router_threshold(monkeypatch):
+    monkeypatch.setattr(main.router, "escalation_confidence", 0.5)
+    assert delay(0.55) == 1.0
+    assert delay(0.45) is None
+
+def test_latency_budget_hedges_confident_routes():
+    assert delay(0.9, latency_budget=3.0) == 1.5
@@ -0,0 +1,43 @@
+import random
+
+from matcher import KeywordMatcher
+
+GROUPS = {
+    "code": ["java", "javascript", "script", "api", "class", "array", "ray"],
+    "complex": ["pros and cons", "pros", "step-by-step", "step", "trade-offs"],
+    "math": ["sum", "summary", "number", "numbers"]
+}
+
+def substring_scan(text):
+    """The matching the router did before the automaton"""
+    hits = {}
+    for group, keywords in GROUPS.items():
+        found = {keyword for keyword in keywords if keyword in text}
+        if found:
+            hits[group] = found
+    return hits
+
+def test_overlapping_keywords_all_reported():
+    hits = KeywordMatcher(GROUPS).scan("javascript arrays: pros and cons")
+    assert hits["code"] == {"java", "javascript", "script", "array", "ray"}
+    assert hits["complex"] == {"pros and cons", "pros"}
+    assert "math" not in hits
+
+def test_agrees_with_substring_scan():
+    matcher = KeywordMatcher(GROUPS)
+    pieces = [keyword for keywords in GROUPS.values() for keyword in keywords]
+    pieces += ["a", "s", "-", " ", "jav", "summ", "cl", "rays", "stepp"]
+    rng = random.Random(0)
+    for _ in range(2000):
+        text = "".join(rng.choice(pieces) for _ in range(rng.randint(0, 12)))
+        assert matcher.scan(text) == substring_scan(text), text
+
+def test_advance_in_chunks_matches_whole_scan():
+    matcher = KeywordMatcher(GROUPS)
+    text = "give a step-by-step summary of the javascript class api"
+    state, hits = 0, {}
+    for start in range(0, len(text), 3):
+        state, chunk_hits = matcher.advance(state, text[start:start + 3])
+        for group, found in chunk_hits.items():
+            hits.setdefault(group, set()).update(found)
+    assert hits == matcher.scan(text)
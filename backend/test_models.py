@@ -0,0 +1,104 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected, Priority
+from health import BreakerState, HealthTracker
+from models import CircuitOpen, ModelClient, ModelSize, pool_connections
+
+def test_pool_stats_before_clients_open():
+    stats = ModelClient().pool_stats()
+    assert stats["tiny"]["in_use"] == 0
+    assert stats["tiny"]["idle"] == 0
+
+def test_pool_connections_of_a_fresh_client():
+    async def run():
+        client = ModelClient()
+        await client.start()
+        try:
+            return pool_connections(client.clients[ModelSize.TINY])
+        finally:
+            await client.close()
+
+    assert asyncio.run(run()) == []
+
+def test_pool_stats_survive_httpx_internals_changing():
+    client = ModelClient()
+    # As if a newer httpx renamed its private transport attributes
+    client.clients[ModelSize.TINY] = SimpleNamespace(_transport=object())
+    client.in_flight[ModelSize.TINY] = 25
+    tiny = client.pool_stats()["tiny"]
+    assert tiny["idle"] is None
+    assert tiny["in_use"] == 20
+    assert tiny["waiting"] == 5
+
+def half_open_client(max_queue=1):
+    """A client whose tiny tier has a cooled-down breaker and no free admission slots"""
+    health = HealthTracker(open_seconds=0.0)
+    health.models[ModelSize.TINY].state = BreakerState.OPEN
+    admission = AdmissionController({"interactive": 0.05})
+    tier = admission.tiers[ModelSize.TINY]
+    tier.max_concurrency = 0
+    tier.max_queue = max_queue
+    return ModelClient(health=health, admission=admission), health
+
+def test_admission_rejection_does_not_leak_half_open_probe():
+    async def run():
+        client, health = half_open_client()
+        try:
+            with pytest.raises(AdmissionRejected):
+                await client._post(ModelSize.TINY, {"inputs": "hi"})
+        finally:
+            await client.close()
+        return health
+
+    health = asyncio.run(run())
+    assert not health.models[ModelSize.TINY].probe_in_flight
+    assert health.is_available(ModelSize.TINY)
+
+def test_queue_full_does_not_leak_half_open_probe():
+    async def run():
+        client, health = half_open_client(max_queue=0)
+        try:
+            with pytest.raises(AdmissionRejected) as rejected:
+                await client._post(ModelSize.TINY, {"inputs": "hi"})
+        finally:
+            await client.close()
+        return health, rejected.value.status_code
+
+    health, status_code = asyncio.run(run())
+    assert status_code == 503
+    assert health.is_available(ModelSize.TINY)
+
+def test_cancel_while_queued_does_not_leak_half_open_probe():
+    async def run():
+        client, health = half_open_client()
+        client.admission.max_wait[Priority.INTERACTIVE] = 10.0
+        task = asyncio.create_task(client._post(ModelSize.TINY, {"inputs": "hi"}))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await client.close()
+        return health
+
+    health = asyncio.run(run())
+    assert not health.models[ModelSize.TINY].probe_in_flight
+    assert health.is_available(ModelSize.TINY)
+
+def test_open_breaker_is_skipped_without_queuing():
+    async def run():
+        client, health = half_open_client()
+        health.models[ModelSize.TINY].open_seconds = 60.0
+        health.models[ModelSize.TINY].opened_at = time.monotonic()
+        try:
+            with pytest.raises(CircuitOpen):
+                await client._post(ModelSize.TINY, {"inputs": "hi"})
+        finally:
+            await client.close()
+        return client
+
+    client = asyncio.run(run())
+    assert client.admission.tiers[ModelSize.TINY].stats()["rejected"] == {}
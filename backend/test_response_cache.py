@@ -0,0 +1,26 @@
+import response_cache
+from models import ModelSize
+from response_cache import ResponseCache
+
+KEY = "ab" * 32
+
+def last_access(disk):
+    return disk._conn.execute(
+        "SELECT last_access FROM response_cache WHERE key = ?", (KEY,)
+    ).fetchone()[0]
+
+def test_disk_hits_touch_access_time_at_most_once_per_interval(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    disk = ResponseCache(str(tmp_path / "responses.db"), ttl=100)
+    assert disk.touch_interval == 10
+    disk._store(KEY, ModelSize.TINY, {"text": "4"})
+
+    now[0] = 1005.0
+    assert disk._load(KEY) == {"text": "4"}
+    assert last_access(disk) == 1000.0
+
+    now[0] = 1012.0
+    assert disk._load(KEY) == {"text": "4"}
+    assert last_access(disk) == 1012.0
+    disk.close()
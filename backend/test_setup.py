@@ -0,0 +1,16 @@
+import pytest
+
+from config import Settings
+
+@pytest.mark.parametrize("value", ["", "none", "null", "0", "0.0"])
+def test_log_retention_can_be_disabled_from_the_environment(monkeypatch, value):
+    monkeypatch.setenv("LOG_RETENTION_DAYS", value)
+    assert Settings().LOG_RETENTION_DAYS is None
+
+def test_log_retention_is_off_by_default(monkeypatch):
+    monkeypatch.delenv("LOG_RETENTION_DAYS", raising=False)
+    assert Settings(_env_file=None).LOG_RETENTION_DAYS is None
+
+def test_log_retention_days_from_the_environment(monkeypatch):
+    monkeypatch.setenv("LOG_RETENTION_DAYS", "30")
+    assert Settings().LOG_RETENTION_DAYS == 30
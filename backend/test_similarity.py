@@ -0,0 +1,50 @@
+import pytest
+
+from models import ModelSize
+from similarity import NearDuplicateIndex
+
+PARAMS = {"max_new_tokens": 64}
+THRESHOLDS = {"tiny": 0.9, "medium": 0.9, "large": 0.95}
+
+def lookup(stored, query, model_size=ModelSize.TINY):
+    index = NearDuplicateIndex(THRESHOLDS, capacity=64)
+    index.add(stored, ModelSize.TINY, PARAMS, "ab" * 32)
+    return index.lookup(query, model_size, PARAMS)
+
+@pytest.mark.parametrize("stored, query", [
+    ("What is the capital of France?", "what's the capital of france"),
+    ("Explain recursion in Python", "Can you please explain recursion in python?"),
+    ("How do I reverse a list in Python?", "how do i reverse a list in python"),
+])
+def test_rephrasings_reuse_the_answer(stored, query):
+    assert lookup(stored, query) == "ab" * 32
+
+@pytest.mark.parametrize("stored, query", [
+    ("Sort this list of numbers in ascending order", "Sort this list of numbers in descending order"),
+    ("How do I convert a list to a set in Python?", "How do I convert a set to a list in Python?"),
+    ("Is it safe to eat raw chicken?", "Is it unsafe to eat raw chicken?"),
+    ("Is it safe to eat raw chicken?", "Is it safe to eat raw chicken eggs?"),
+    ("Summarize Romeo and Juliet", "Summarize Romeo and Juliet briefly"),
+    ("What is 2+2?", "What is 2-2?"),
+    ("Is Python a compiled language?", "Is Python not a compiled language?"),
+    ("Who was the president of France?", "Who is the president of France?"),
+])
+def test_different_questions_are_not_reused(stored, query):
+    assert lookup(stored, query) is None
+
+def test_matches_are_per_tier_and_parameters():
+    index = NearDuplicateIndex(THRESHOLDS, capacity=64)
+    index.add("What is the capital of France?", ModelSize.TINY, PARAMS, "ab" * 32)
+    assert index.lookup("what's the capital of france", ModelSize.MEDIUM, PARAMS) is None
+    assert index.lookup("what's the capital of france", ModelSize.TINY,
+                        {"max_new_tokens": 256}) is None
+
+def test_oldest_entry_is_replaced_when_full():
+    index = NearDuplicateIndex(THRESHOLDS, capacity=2)
+    for i, query in enumerate(["What is the capital of France?",
+                               "What is the capital of Spain?",
+                               "What is the capital of Italy?"]):
+        index.add(query, ModelSize.TINY, PARAMS, f"{i:02x}" * 32)
+    assert index.size == 2
+    assert index.lookup("what's the capital of france", ModelSize.TINY, PARAMS) is None
+    assert index.lookup("what's the capital of italy", ModelSize.TINY, PARAMS) == "02" * 32
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+def test_concurrent_callers_share_one_call():
+    async def run():
+        flight = SingleFlight()
+        calls = 0
+        release = asyncio.Event()
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return "answer"
+
+        waiters = [asyncio.ensure_future(flight.do("k", work)) for _ in range(5)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*waiters)
+        return calls, results, flight
+
+    calls, results, flight = asyncio.run(run())
+    assert calls == 1
+    assert [result for result, _ in results] == ["answer"] * 5
+    assert sorted(shared for _, shared in results) == [False] + [True] * 4
+    assert flight.stats() == {"in_flight": 0, "leaders": 1, "coalesced": 4}
+
+def test_cancelled_waiter_does_not_cancel_shared_call():
+    async def run():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            return "answer"
+
+        leader = asyncio.ensure_future(flight.do("k", work))
+        follower = asyncio.ensure_future(flight.do("k", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return leader, await follower
+
+    leader, (result, shared) = asyncio.run(run())
+    assert leader.cancelled()
+    assert result == "answer" and shared
+
+def test_timed_out_waiter_leaves_call_running():
+    async def run():
+        flight = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        with pytest.raises(asyncio.TimeoutError):
+            await flight.do("k", work, timeout=0.01)
+        return await flight.do("k", work)
+
+    result, shared = asyncio.run(run())
+    assert result == "answer" and shared
+
+def test_errors_reach_every_waiter_and_key_is_released():
+    async def run():
+        flight = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0)
+            raise ValueError("upstream failed")
+
+        results = await asyncio.gather(flight.do("k", work), flight.do("k", work),
+                                       return_exceptions=True)
+        return results, flight
+
+    results, flight = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight.calls == {}
@@ -0,0 +1,96 @@
+"""Prompt and completion token counts for each model in MODEL_CONFIGS.
+
+Counts come from the model's own tokenizer when the optional
+``tokenizers`` package is installed. Each tokenizer is downloaded from
+the Hub in a background thread the first time its tier counts tokens,
+and kept for the life of the process, so tiers that are never used are
+never downloaded. Tokenizing is CPU work, so it runs in a worker thread rather
+than on the event loop. Until a tier's tokenizer arrives, and for good
+without the package or if it can't be loaded, counts fall back to the
+words x 1.3 estimate used before.
+"""
+import asyncio
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from config import settings
+from models import MODEL_CONFIGS, ModelSize, estimate_tokens
+
+try:
+    from tokenizers import Tokenizer
+except ImportError:
+    Tokenizer = None
+
+class TokenCounter:
+    """Per-tier tokenizers, loaded lazily and cached"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled and Tokenizer is not None
+        self.tokenizers: Dict[ModelSize, Optional["Tokenizer"]] = {}
+        self.loading: Set[ModelSize] = set()
+        self._lock = threading.Lock()
+
+    def tokenizer(self, model_size: ModelSize) -> Optional["Tokenizer"]:
+        """The tier's tokenizer, or None while it loads or if it can't be loaded.
+
+        Loading happens in a background thread, so a slow or failing
+        download never holds up counting.
+        """
+        if not self.enabled or model_size in self.tokenizers:
+            return self.tokenizers.get(model_size)
+        with self._lock:
+            if model_size not in self.tokenizers and model_size not in self.loading:
+                self.loading.add(model_size)
+                # Not a daemon: the tokenizers library aborts the process if
+                # interpreter exit kills a thread mid-load
+                threading.Thread(target=self._load, args=(model_size,)).start()
+        return self.tokenizers.get(model_size)
+
+    def _load(self, model_size: ModelSize):
+        config = MODEL_CONFIGS[model_size]
+        try:
+            # The token is positional: its keyword was renamed from
+            # auth_token to token between releases
+            tokenizer = Tokenizer.from_pretrained(
+                config.get("tokenizer", config["id"]), "main",
+                settings.HUGGINGFACE_API_KEY or None
+            )
+        except Exception as e:
+            # Don't retry on every request; estimate for this tier instead
+            print(f"Could not load tokenizer for {config['name']}, estimating tokens: {e}")
+            tokenizer = None
+        with self._lock:
+            self.tokenizers[model_size] = tokenizer
+            self.loading.discard(model_size)
+
+    def count_many(self, model_size: ModelSize, texts: List[str]) -> List[int]:
+        """Token counts for several texts (blocking)"""
+        tokenizer = self.tokenizer(model_size)
+        if tokenizer is None:
+            return [estimate_tokens(text) for text in texts]
+        encodings = tokenizer.encode_batch(texts, add_special_tokens=False)
+        return [len(encoding.ids) for encoding in encodings]
+
+    async def count_usage(self, model_size: ModelSize, prompts: List[str],
+                          completions: List[str]) -> List[Tuple[int, int]]:
+        """(prompt, completion) token counts per pair, counted off the event loop"""
+        texts = prompts + completions
+        if self.tokenizer(model_size) is not None:
+            counts = await asyncio.to_thread(self.count_many, model_size, texts)
+        else:
+            counts = self.count_many(model_size, texts)
+        return list(zip(counts[:len(prompts)], counts[len(prompts):]))
+
+    def stats(self) -> Dict[str, str]:
+        """Where each tier's counts come from"""
+        if Tokenizer is None:
+            return {size.value: "estimate (tokenizers not installed)" for size in ModelSize}
+        if not self.enabled:
+            return {size.value: "estimate (disabled)" for size in ModelSize}
+        return {
+            size.value: "tokenizer" if self.tokenizers.get(size) is not None
+            else "estimate (load failed)" if size in self.tokenizers
+            else "estimate (loading)" if size in self.loading
+            else "estimate (not used yet)"
+            for size in ModelSize
+        }
@@ -0,0 +1,124 @@
+"""Train the learned router from historical query logs.
+
+Every logged query becomes a training example. Its label is the tier that
+finally answered it: the routed tier if no escalation happened, otherwise
+the tier it escalated to. The label therefore approximates the cheapest
+tier that answers the query without escalating. Forced-model queries,
+failed answers and repeated queries are skipped. Only the live
+query_logs table is read, so days moved out by archiver.py are left out.
+
+    python train_router.py --output router_model.json
+    ROUTER_MODE=learned ROUTER_MODEL_PATH=router_model.json python main.py
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import List, Tuple
+
+import numpy as np
+
+from database import QueryLog, SessionLocal
+from learned_router import TIERS, feature_names, featurize, fit
+from models import MODEL_CONFIGS
+from router import CascadeRouter
+
+def load_examples(since: datetime = None) -> Tuple[List[str], np.ndarray]:
+    """Query texts and tier labels from query_logs, one example per distinct query"""
+    tier_index = {size.value: i for i, size in enumerate(TIERS)}
+    db = SessionLocal()
+    try:
+        rows = db.query(QueryLog.query_hash, QueryLog.query_text, QueryLog.model_size).filter(
+            QueryLog.routing_reason != "Forced model selection",
+            QueryLog.tokens_used > 0
+        )
+        if since is not None:
+            rows = rows.filter(QueryLog.timestamp >= since)
+        # Later rows win, so each query is labelled by its most recent outcome
+        latest = {}
+        for query_hash, query_text, model_size in rows.order_by(QueryLog.id).yield_per(5000):
+            if query_text and model_size in tier_index:
+                latest[query_hash] = (query_text, tier_index[model_size])
+    finally:
+        db.close()
+    queries = [query for query, _ in latest.values()]
+    labels = np.array([label for _, label in latest.values()], dtype=np.int64)
+    return queries, labels
+
+def evaluate(chosen: np.ndarray, labels: np.ndarray) -> dict:
+    """How often the chosen starting tier was too small, right or larger than needed"""
+    costs = np.array([MODEL_CONFIGS[size]["cost_per_token"] for size in TIERS])
+    return {
+        "accuracy": round(float(np.mean(chosen == labels)), 4),
+        "under_routed": round(float(np.mean(chosen < labels)), 4),
+        "over_routed": round(float(np.mean(chosen > labels)), 4),
+        # Relative per-token spend, counting the wasted first call when under-routed
+        "relative_cost": round(float(np.mean(
+            costs[np.maximum(chosen, labels)] + np.where(chosen < labels, costs[chosen], 0)
+        ) / costs[-1]), 4)
+    }
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Train the learned router from query_logs")
+    parser.add_argument("--output", default="router_model.json")
+    parser.add_argument("--since-days", type=float, default=None,
+                        help="Only train on the last N days of logs")
+    parser.add_argument("--min-examples", type=int, default=100)
+    parser.add_argument("--validation", type=float, default=0.2,
+                        help="Share of examples held out for evaluation")
+    parser.add_argument("--min-success", type=float, default=None,
+                        help="Success probability a tier needs to be chosen "
+                             "(defaults to ROUTER_MIN_SUCCESS)")
+    parser.add_argument("--l2", type=float, default=1e-3)
+    parser.add_argument("--learning-rate", type=float, default=0.5)
+    parser.add_argument("--epochs", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    since = None
+    if args.since_days is not None:
+        since = datetime.now(timezone.utc) - timedelta(days=args.since_days)
+    queries, labels = load_examples(since)
+    if len(queries) < args.min_examples:
+        print(f"Only {len(queries)} usable logged queries; need at least {args.min_examples}")
+        return 1
+
+    router = CascadeRouter()
+    router.unload_model()
+    min_success = args.min_success if args.min_success is not None else router.min_success
+    names = feature_names(router)
+    features = [router.extract_features(query) for query in queries]
+    matrix = featurize(router, queries, names, features)
+
+    order = np.random.default_rng(args.seed).permutation(len(queries))
+    held_out = int(len(queries) * args.validation)
+    test, train = order[:held_out], order[held_out:]
+
+    model = fit(matrix[train], labels[train], names, args.l2, args.learning_rate, args.epochs)
+    evaluation = {"examples": len(queries), "train": len(train), "validation": len(test)}
+    if held_out:
+        learned, _ = model.choose(matrix[test], min_success)
+        tier_index = {size: i for i, size in enumerate(TIERS)}
+        heuristic = np.array([
+            tier_index[router.heuristic_decision(queries[i], features[i]).model_size] for i in test
+        ])
+        evaluation["learned"] = evaluate(learned, labels[test])
+        evaluation["heuristic"] = evaluate(heuristic, labels[test])
+
+    model.metadata = {
+        "trained_at": datetime.now(timezone.utc).isoformat(),
+        "label_distribution": {size.value: int(np.sum(labels == i)) for i, size in enumerate(TIERS)},
+        "evaluation": evaluation,
+        "l2": args.l2,
+        "epochs": args.epochs
+    }
+    model.save(args.output)
+
+    print(f"Trained on {len(train)} queries, validated on {held_out}")
+    for name in ("learned", "heuristic"):
+        if name in evaluation:
+            print(f"  {name:<10} " + "  ".join(f"{k} {v}" for k, v in evaluation[name].items()))
+    print(f"Wrote {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
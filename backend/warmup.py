@@ -0,0 +1,108 @@
+import asyncio
+import time
+from enum import Enum
+from typing import Any, Dict, Optional
+
+import httpx
+
+from admission import AdmissionRejected, Priority
+from models import ModelSize, MODEL_CONFIGS
+
+class Readiness(Enum):
+    UNKNOWN = "unknown"
+    READY = "ready"
+    LOADING = "loading"
+
+class ModelReadiness:
+    """Tracks whether each model is loaded on the inference API and how long until it is.
+
+    While a model is loading, the API answers 503 with an ``estimated_time``
+    in seconds. Those answers, from warm-keeper pings or from real
+    requests, mark the model LOADING until the estimate runs out. Any
+    successful response marks it READY.
+    """
+
+    def __init__(self):
+        self.states: Dict[ModelSize, Readiness] = {size: Readiness.UNKNOWN for size in ModelSize}
+        self.ready_at: Dict[ModelSize, float] = {size: 0.0 for size in ModelSize}
+        self.checked_at: Dict[ModelSize, Optional[float]] = {size: None for size in ModelSize}
+
+    def record_ready(self, model_size: ModelSize):
+        self.states[model_size] = Readiness.READY
+        self.ready_at[model_size] = 0.0
+        self.checked_at[model_size] = time.time()
+
+    def record_loading(self, model_size: ModelSize, estimated_time: float):
+        self.states[model_size] = Readiness.LOADING
+        self.ready_at[model_size] = time.monotonic() + max(0.0, estimated_time)
+        self.checked_at[model_size] = time.time()
+
+    def is_loading(self, model_size: ModelSize) -> bool:
+        return self.states[model_size] == Readiness.LOADING
+
+    def expected_wait(self, model_size: ModelSize) -> float:
+        """Seconds until the model should be ready (0 if it isn't known to be loading)"""
+        if not self.is_loading(model_size):
+            return 0.0
+        return max(0.0, self.ready_at[model_size] - time.monotonic())
+
+    def snapshot(self, model_size: ModelSize) -> Dict[str, Any]:
+        return {
+            "state": self.states[model_size].value,
+            "expected_wait": round(self.expected_wait(model_size), 2),
+            "checked_at": self.checked_at[model_size]
+        }
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {size.value: self.snapshot(size) for size in ModelSize}
+
+class WarmKeeper:
+    """Background task that periodically pings every model in MODEL_CONFIGS.
+
+    Each ping asks for a single token, which keeps models from being
+    unloaded while idle and keeps their readiness state current.
+    """
+
+    def __init__(self, model_client, readiness: ModelReadiness, interval: float = 240.0):
+        self.model_client = model_client
+        self.readiness = readiness
+        self.interval = interval
+        self.task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Start pinging (called on app startup)"""
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop pinging (called on app shutdown)"""
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+
+    async def _run(self):
+        while True:
+            await self.ping_all()
+            await asyncio.sleep(self.interval)
+
+    async def ping_all(self):
+        await asyncio.gather(*(self.ping(size) for size in MODEL_CONFIGS))
+
+    async def ping(self, model_size: ModelSize):
+        """Send a one-token request; the model client records the readiness outcome"""
+        try:
+            # Pings yield to real traffic and are simply skipped when a tier is busy
+            await self.model_client.ping(model_size, Priority.BACKGROUND)
+        except AdmissionRejected:
+            pass
+        except httpx.HTTPError as e:
+            if self.readiness.is_loading(model_size):
+                print(f"{MODEL_CONFIGS[model_size]['name']} is loading, "
+                      f"ready in ~{self.readiness.expected_wait(model_size):.0f}s")
+            else:
+                print(f"Warm-up ping to {MODEL_CONFIGS[model_size]['name']} failed: {e}")
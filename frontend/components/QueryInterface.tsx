@@ -1,14 +1,76 @@
 'use client';
 
 import { useState } from 'react';
-import { api, QueryResponse } from '../lib/api';
+import { QueryResponse } from '../lib/api';
 import { MetricCard } from './MetricCard';
 
+const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
+
+interface RouteEvent {
+  model_size: string;
+  confidence: number;
+  routing_reason: string;
+}
+
+interface StreamHandlers {
+  onRoute: (route: RouteEvent) => void;
+  onToken: (text: string) => void;
+  onEscalate: (from: string, to: string) => void;
+  onDone: (result: Omit<QueryResponse, 'response'>) => void;
+}
+
+// Read the server-sent events emitted by POST /query/stream
+async function streamQuery(query: string, handlers: StreamHandlers) {
+  const res = await fetch(`${API_URL}/query/stream`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream' },
+    body: JSON.stringify({ query }),
+  });
+  if (!res.ok || !res.body) {
+    throw new Error(`Request failed with status ${res.status}`);
+  }
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      const chunk = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf('\n\n');
+
+      let event = 'message';
+      let data = '';
+      for (const line of chunk.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) data += line.slice(5).trim();
+      }
+      if (!data) continue;
+      const payload = JSON.parse(data);
+
+      if (event === 'route') handlers.onRoute(payload);
+      else if (event === 'token') handlers.onToken(payload.text);
+      else if (event === 'escalate') handlers.onEscalate(payload.from, payload.to);
+      else if (event === 'done') handlers.onDone(payload);
+      else if (event === 'error') throw new Error(payload.detail);
+    }
+  }
+}
+
 export function QueryInterface() {
   const [query, setQuery] = useState('');
   const [loading, setLoading] = useState(false);
   const [response, setResponse] = useState<QueryResponse | null>(null);
   const [error, setError] = useState<string | null>(null);
+  const [streamingText, setStreamingText] = useState('');
+  const [route, setRoute] = useState<RouteEvent | null>(null);
+  const [escalation, setEscalation] = useState<string | null>(null);
   
   const handleSubmit = async (e: React.FormEvent) => {
     e.preventDefault();
@@ -17,10 +79,26 @@ export function QueryInterface() {
     setLoading(true);
     setError(null);
     setResponse(null);
+    setStreamingText('');
+    setRoute(null);
+    setEscalation(null);
     
     try {
-      const result = await api.query({ query });
-      setResponse(result);
+      let text = '';
+      await streamQuery(query, {
+        onRoute: setRoute,
+        onToken: (token) => {
+          text += token;
+          setStreamingText(text);
+        },
+        onEscalate: (from, to) => {
+          // The larger model's answer replaces the partial one
+          text = '';
+          setStreamingText('');
+          setEscalation(`Escalated from ${from} to ${to} model`);
+        },
+        onDone: (result) => setResponse({ ...result, response: text }),
+      });
     } catch (err) {
       const errorMessage = err instanceof Error ? err.message : 'Failed to process query';
       setError(errorMessage);
@@ -34,6 +112,9 @@ export function QueryInterface() {
     setQuery('');
     setResponse(null);
     setError(null);
+    setStreamingText('');
+    setRoute(null);
+    setEscalation(null);
   };
   
   return (
@@ -85,13 +166,32 @@ export function QueryInterface() {
         </div>
       )}
 
-      {loading && !response && (
+      {loading && !response && streamingText && (
+        <div className="space-y-4 mb-4">
+          <div className="p-4 bg-gray-50 rounded-lg">
+            <h3 className="font-semibold mb-2">Response:</h3>
+            <p className="whitespace-pre-wrap">{streamingText}</p>
+          </div>
+          {route && (
+            <div className="p-3 bg-gray-100 rounded text-sm">
+              <p><strong>Routing Reason:</strong> {route.routing_reason}</p>
+              {escalation && <p><strong>Escalation:</strong> {escalation}</p>}
+            </div>
+          )}
+        </div>
+      )}
+
+      {loading && !response && !streamingText && (
         <div className="p-6 bg-blue-50 border border-blue-200 rounded-lg mb-4">
           <div className="flex items-center gap-3">
             <div className="animate-spin w-6 h-6 border-2 border-blue-500 border-t-transparent rounded-full"></div>
             <div>
               <p className="text-blue-800 font-medium">Processing your query...</p>
-              <p className="text-blue-600 text-sm">The cascade system is selecting the optimal model</p>
+              <p className="text-blue-600 text-sm">
+                {route
+                  ? escalation || `Routed to the ${route.model_size} model, waiting for tokens...`
+                  : 'The cascade system is selecting the optimal model'}
+              </p>
             </div>
           </div>
         </div>
@@ -133,6 +233,7 @@ export function QueryInterface() {
           
           <div className="p-3 bg-gray-100 rounded text-sm">
             <p><strong>Routing Reason:</strong> {response.routing_reason}</p>
+            {escalation && <p><strong>Escalation:</strong> {escalation}</p>}
           </div>
         </div>
       )}